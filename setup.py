@@ -14,6 +14,12 @@ setup(
         "stripe==5.5.0",
     ],
     extras_require={
+        'asyncio': [
+            'aiohttp'
+        ],
+        'speedups': [
+            'orjson'
+        ],
         'test': [
             'pylint==3.0.3',
             'nose2',
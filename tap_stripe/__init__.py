@@ -2,19 +2,57 @@
 import os
 import json
 import logging
+import asyncio
+import codecs
+import contextvars
+import cProfile
+import decimal
+import fnmatch
+import functools
+import glob
+import gzip
+import io
+import itertools
+import math
+import pstats
+import random
 import re
-
-from datetime import datetime, timedelta
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import weakref
+
+from array import array
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qsl, urlencode, urlsplit
 import stripe
 import stripe.error
 from stripe.stripe_object import StripeObject
 from stripe.api_resources.list_object import ListObject
 from stripe.error import InvalidRequestError
-from stripe.api_requestor import APIRequestor
+from stripe.api_requestor import APIRequestor, _api_encode
 import singer
 from singer import utils, Transformer, metrics
 from singer import metadata
 import backoff
+import urllib3
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 REQUIRED_CONFIG_KEYS = [
     "start_date",
@@ -131,10 +169,38 @@ LOGGER = singer.get_logger()
 
 DEFAULT_DATE_WINDOW_SIZE = 30  # default date window to fetch newly created records
 DEFAULT_EVENT_UPDATE_DATE_WINDOW = 7  # default date window to fetch event updates
+DEFAULT_WINDOW_CONCURRENCY = 1  # default number of date windows fetched at the same time
+DEFAULT_STREAM_CONCURRENCY = 1  # default number of streams synced at the same time
+DEFAULT_SUB_STREAM_CONCURRENCY = 1  # default number of parents whose sub stream is fetched at the same time
+DEFAULT_ACCOUNT_CONCURRENCY = 1  # default number of connected accounts synced at the same time
+DEFAULT_TARGET_WINDOW_RECORDS = 10000  # default number of records aimed for in an adaptive date window
+
+# Serializes the messages written to stdout and the changes to the state
+# when streams are synced by several threads
+MESSAGE_LOCK = threading.RLock()
 
 # default request timeout
 REQUEST_TIMEOUT = 300  # 5 minutes
 
+# default size of the connection pool of the asyncio http engine
+DEFAULT_MAX_CONNECTIONS = 50
+
+# default number of seconds the messages are kept in the output buffer
+DEFAULT_OUTPUT_FLUSH_INTERVAL = 1
+
+# number of bytes read at a time from a streamed list page
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# transformers of the records: singer.Transformer, compiled schemas, or compiled schemas without validation
+TRANSFORM_MODES = ['singer', 'compiled', 'trusted']
+
+# Profilers of the `profile_stream` and the number of entries of the profile logged
+PROFILERS = ['cprofile', 'tracemalloc']
+PROFILE_TOP = 30
+
+# Only one cProfile profiler can be enabled at a time, the passes profiled by cProfile take turns
+PROFILE_LOCK = threading.Lock()
+
 
 def new_list(self, api_key=None, stripe_version=None, stripe_account=None, **params):
     """
@@ -177,9 +243,34 @@ def new_list(self, api_key=None, stripe_version=None, stripe_account=None, **par
 ListObject.list = new_list
 
 
-class Context():
+# The connected account synced by the current thread, when the tap syncs several accounts
+CURRENT_ACCOUNT = contextvars.ContextVar('tap_stripe_account', default=None)
+
+# Whether the current thread fetches a date window that is split when its requests time out
+BISECTING_WINDOW = contextvars.ContextVar('tap_stripe_bisecting_window', default=False)
+
+
+AccountScope = namedtuple('AccountScope', ['account_id', 'state'])
+
+
+class AccountScopedContext(type):
+    """
+    Resolves the `state` of the `Context` to the bookmarks of the connected account synced by
+    the current thread, and to the state of the whole sync otherwise.
+    """
+    @property
+    def state(cls):
+        account = CURRENT_ACCOUNT.get()
+        return cls.sync_state if account is None else account.state
+
+    @state.setter
+    def state(cls, state):
+        cls.sync_state = state
+
+
+class Context(metaclass=AccountScopedContext):
     config = {}
-    state = {}
+    sync_state = {}  # The state of all the accounts, `state` is the one of the account synced
     catalog = {}
     tap_start = None
     stream_map = {}
@@ -188,6 +279,30 @@ class Context():
     window_size = DEFAULT_DATE_WINDOW_SIZE  # By default fetch data from last 30 days for newly created records.
     event_update_window_size = DEFAULT_EVENT_UPDATE_DATE_WINDOW  # By default collect data of 7 days in one
                                                                 # API call for event_updates
+    window_concurrency = DEFAULT_WINDOW_CONCURRENCY  # By default fetch one date window at a time
+    stream_concurrency = DEFAULT_STREAM_CONCURRENCY  # By default sync one stream at a time
+    shared_event_scan = False  # By default scan the events endpoint once per stream
+    async_engine = None  # Set when the asyncio http engine is configured
+    adaptive_window_size = False  # By default the date windows have a fixed size
+    probe_empty_ranges = False  # By default every date window is requested
+    target_window_records = DEFAULT_TARGET_WINDOW_RECORDS
+    concurrency_controller = None  # Set when requests can be in flight at the same time
+    raw_json = False  # By default the records are parsed into StripeObjects by the SDK
+    stream_pages = False  # By default the raw list pages are decoded once fully read
+    transform_mode = 'singer'  # By default the records are transformed by singer.Transformer
+    message_writer = None  # Set when the messages are buffered
+    state_throttle = None  # Set when the STATE messages are coalesced
+    sub_stream_concurrency = DEFAULT_SUB_STREAM_CONCURRENCY  # By default sync the sub stream of one parent at a time
+    checkpoint_interval = 0  # By default the bookmarks only move at the end of the date windows
+    account_ids = []  # Set to the connected accounts synced instead of the account_id
+    events_store = None  # Set when the events are kept in a local store
+    page_archive = None  # Set when the responses of Stripe are archived
+    archive_replay = None  # Set when the requests are answered from the archive
+    account_concurrency = DEFAULT_ACCOUNT_CONCURRENCY  # By default sync one connected account at a time
+    profile_stream = None  # Set to the stream profiled during the sync
+    profiler = 'cprofile'
+    profiling = False  # Set while a pass is profiled by cProfile
+    stream_plans = {}  # The plans of the streams during a sync
 
     @classmethod
     def get_catalog_entry(cls, stream_name):
@@ -197,15 +312,25 @@ class Context():
 
     @classmethod
     def get_schema(cls, stream_name):
-        stream = [s for s in cls.catalog["streams"] if s["tap_stream_id"] == stream_name][0]
-        return stream["schema"]
+        return cls.get_catalog_entry(stream_name)["schema"]
+
+    @classmethod
+    def get_stream_plan(cls, stream_name):
+        return cls.stream_plans.get(stream_name) or build_stream_plan(stream_name)
 
     @classmethod
     def is_selected(cls, stream_name):
+        if stream_name in cls.stream_plans:
+            return cls.stream_plans[stream_name].selected
         stream = cls.get_catalog_entry(stream_name)
         stream_metadata = metadata.to_map(stream['metadata'])
         return metadata.get(stream_metadata, (), 'selected')
 
+    @classmethod
+    def get_account_id(cls):
+        account = CURRENT_ACCOUNT.get()
+        return cls.config.get('account_id') if account is None else account.account_id
+
     @classmethod
     def is_sub_stream(cls, stream_name):
         for sub_stream_id in SUB_STREAMS.values():
@@ -231,17 +356,793 @@ class Context():
         LOGGER.info('------------------')
 
 
+def encode_message(message):
+    """
+    Encode a message dict as a JSON line, with orjson when it is installed. The values the
+    fast encoders do not support, such as Decimals, are encoded by singer's encoder.
+    """
+    try:
+        if orjson is not None:
+            return orjson.dumps(message) + b'\n'  # pylint: disable=no-member
+        return json.dumps(message).encode('utf-8') + b'\n'
+    except TypeError:
+        return (singer.format_message(EncodedMessage(message)) + '\n').encode('utf-8')
+
+
+class EncodedMessage(singer.Message):  # pylint: disable=too-few-public-methods
+    """
+    A message dict already in its output format, for `singer.format_message`.
+    """
+    def __init__(self, message):
+        self.message = message
+
+    def asdict(self):
+        return self.message
+
+
+class MessageWriter():  # pylint: disable=too-many-instance-attributes
+    """
+    Writes the messages to the output through a buffer of `buffer_size` bytes, which is flushed
+    when it is full, when it is older than `flush_interval` seconds and on every STATE message,
+    so a state is never emitted ahead of the records it covers.
+    """
+    def __init__(self, buffer_size, flush_interval=DEFAULT_OUTPUT_FLUSH_INTERVAL, output=None, encoder=encode_message):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.output = output or sys.stdout
+        self.encoder = encoder
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.last_flush = time.monotonic()
+        self.time_extracted = (None, None)  # The last time extracted and its formatted value
+
+    def write_record(self, stream_name, rec, time_extracted=None):
+        message = {'type': 'RECORD', 'stream': stream_name, 'record': rec}
+        if time_extracted:
+            if self.time_extracted[0] != time_extracted:
+                self.time_extracted = (time_extracted,
+                                       utils.strftime(time_extracted.astimezone(timezone.utc)))
+            message['time_extracted'] = self.time_extracted[1]
+        self.write(self.encoder(message))
+
+    def write_state(self, state):
+        self.write(self.encoder({'type': 'STATE', 'value': state}))
+        self.flush()
+
+    def write(self, line):
+        self.buffer.append(line)
+        self.buffered_bytes += len(line)
+        if self.buffered_bytes >= self.buffer_size or \
+                time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        data = b''.join(self.buffer)
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.last_flush = time.monotonic()
+        if data:
+            # Keep the order with the messages written to the text output by singer
+            self.output.flush()
+            if hasattr(self.output, 'buffer'):
+                self.output.buffer.write(data)
+                self.output.buffer.flush()
+            else:
+                self.output.write(data.decode('utf-8'))
+                self.output.flush()
+
+
+# What the sync needs of the catalog entry and the config of a stream, built once per sync
+StreamPlan = namedtuple('StreamPlan', ['stream_name', 'schema', 'metadata', 'selected', 'replication_key',
+                                       'filter_key', 'whitelist', 'expand', 'parent', 'sub_stream'])
+
+
+def build_stream_plan(stream_name):
+    catalog_entry = Context.get_catalog_entry(stream_name)
+    stream_metadata = metadata.to_map(catalog_entry['metadata'])
+    replication_key = STREAM_REPLICATION_KEY.get(stream_name)
+    selected = metadata.get(stream_metadata, (), 'selected')
+    whitelist = json.loads(Context.config.get('whitelist_map', '{}')).get(stream_name)
+    return StreamPlan(
+        stream_name=stream_name,
+        schema=catalog_entry['schema'],
+        metadata=stream_metadata,
+        selected=selected,
+        replication_key=replication_key,
+        # Invoice Items bookmarks on `date`, but queries on `created`
+        filter_key='created' if stream_name == 'invoice_items' else replication_key,
+        whitelist=whitelist,
+        expand=get_selected_expand_fields(stream_name, stream_metadata, whitelist, log=selected),
+        parent=PARENT_STREAM_MAP.get(stream_name),
+        sub_stream=SUB_STREAMS.get(stream_name))
+
+
+def is_field_kept(mdata, field_path):
+    """
+    Returns whether the nested field is kept by the field selection, with the same rules
+    as `Transformer.filter_data_by_metadata`.
+    """
+    breadcrumb = ()
+    for field_name in field_path:
+        breadcrumb += ('properties', field_name)
+        field_metadata = mdata.get(breadcrumb, {})
+        if field_metadata.get('inclusion') == 'automatic':
+            return True
+        if field_metadata.get('selected') is False or field_metadata.get('inclusion') == 'unsupported':
+            return False
+    return True
+
+
+def get_selected_expand_fields(stream_name, mdata, whitelist=None, log=False):
+    """
+    Returns the fields of `STREAM_TO_EXPAND_FIELDS` whose values are written, leaving out the ones
+    of deselected fields and, with a whitelist, the ones no breadcrumb of the whitelist goes through.
+    The breadcrumbs are paths in the records, so they are compared without the `data.` list prefix.
+    """
+    expand_fields = []
+    for expand_field in STREAM_TO_EXPAND_FIELDS.get(stream_name, []):
+        field_path = expand_field.split('.')[1:]
+        if not is_field_kept(mdata, field_path):
+            reason = 'the field is not selected'
+        elif whitelist and not any(list(breadcrumb[:len(field_path)]) == field_path[:len(breadcrumb)]
+                                   for breadcrumb in whitelist):
+            reason = 'the field is not in the whitelist'
+        else:
+            expand_fields.append(expand_field)
+            reason = None
+        if log and reason:
+            LOGGER.info('Not expanding %s for stream %s as %s.', expand_field, stream_name, reason)
+        elif log:
+            LOGGER.info('Expanding %s for stream %s.', expand_field, stream_name)
+    return expand_fields
+
+
+def get_expand_fields(stream_name):
+    """
+    Returns the fields to expand in the list requests of the stream, all of them outside a sync.
+    """
+    if stream_name in Context.stream_plans:
+        return Context.stream_plans[stream_name].expand
+    return STREAM_TO_EXPAND_FIELDS.get(stream_name, [])
+
+
+def write_record(stream_name, rec, time_extracted=None):
+    """
+    Write a record message, one message at a time across the threads. The records of the
+    connected accounts are tagged with their account.
+    """
+    account = CURRENT_ACCOUNT.get()
+    if account is not None:
+        rec['account_id'] = account.account_id
+    with MESSAGE_LOCK:
+        if Context.state_throttle:
+            Context.state_throttle.records += 1
+        if Context.message_writer:
+            Context.message_writer.write_record(stream_name, rec, time_extracted)
+        else:
+            singer.write_record(stream_name,
+                                rec,
+                                time_extracted=time_extracted)
+
+
+def increment_count(counts, stream_name):
+    """
+    Count a record of the stream in the new or updated counts, shared by the threads of the accounts.
+    """
+    with MESSAGE_LOCK:
+        counts[stream_name] += 1
+
+
+def write_state(force=False):
+    """
+    Write the current state, one message at a time across the threads. With a state throttle,
+    the state is only written once it is due, unless forced.
+    """
+    with MESSAGE_LOCK:
+        if Context.state_throttle and not Context.state_throttle.should_write(force):
+            return
+        # The state of all the connected accounts is written while one of them is synced
+        state = Context.state if CURRENT_ACCOUNT.get() is None else Context.sync_state
+        if Context.message_writer:
+            Context.message_writer.write_state(state)
+        else:
+            singer.write_state(state)
+
+
+def flush_state():
+    """
+    Write the state held back by the state throttle.
+    """
+    with MESSAGE_LOCK:
+        if Context.state_throttle and Context.state_throttle.pending:
+            write_state(force=True)
+
+
+class StateThrottle():  # pylint: disable=too-few-public-methods
+    """
+    Holds back the STATE messages until `interval` seconds have passed or `max_records` records
+    have been written since the last one. The state held back is always the latest, and its
+    bookmarks only move after the records they cover, so it can be written at any later time.
+    """
+    def __init__(self, interval=None, max_records=None):
+        self.interval = interval
+        self.max_records = max_records
+        self.records = 0
+        self.pending = False
+        self.last_write = time.monotonic()
+
+    def should_write(self, force=False):
+        due = force or (self.interval is not None and time.monotonic() - self.last_write >= self.interval) \
+            or (self.max_records is not None and self.records >= self.max_records)
+        self.pending = not due
+        if due:
+            self.records = 0
+            self.last_write = time.monotonic()
+        return due
+
+
+class PhaseTimer():
+    """
+    Accumulates the time spent in the phases of a pass over a stream: `lap(phase)` adds the
+    time elapsed since the previous lap to the phase, except for the HTTP requests made by the
+    thread meanwhile which are counted as `http`. The totals are added to the breakdown of the
+    run when the timer exits, and logged at the end of the run.
+    """
+    active = threading.local()
+    totals = {}
+    lock = threading.Lock()
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = {}
+        self.nested = 0.0
+        self.start = self.last = time.perf_counter()
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = getattr(self.active, 'timer', None)
+        self.active.timer = self
+        self.start = self.last = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.active.timer = self.previous
+        self.seconds['total'] = time.perf_counter() - self.start
+        with self.lock:
+            phases = self.totals.setdefault(self.name, {})
+            for phase, seconds in self.seconds.items():
+                phases[phase] = phases.get(phase, 0.0) + seconds
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + now - self.last - self.nested
+        self.last = now
+        self.nested = 0.0
+
+    @classmethod
+    def current(cls):
+        """
+        Returns the timer of the thread, or a timer whose laps are not reported.
+        """
+        return getattr(cls.active, 'timer', None) or cls(None)
+
+    @classmethod
+    def add_http(cls, seconds):
+        timer = getattr(cls.active, 'timer', None)
+        if timer is not None:
+            timer.seconds['http'] = timer.seconds.get('http', 0.0) + seconds
+            timer.nested += seconds
+
+    @classmethod
+    def log_breakdown(cls):
+        for name, phases in sorted(cls.totals.items()):
+            total = phases.get('total', 0.0)
+            breakdown = sorted(((seconds, phase) for phase, seconds in phases.items() if phase != 'total'),
+                               reverse=True)
+            LOGGER.info('Phase times of %s: %.2fs total, %s', name, total,
+                        ', '.join('{} {:.2f}s ({:.0%})'.format(phase, seconds, seconds / total if total else 0)
+                                  for seconds, phase in breakdown))
+
+
+@contextmanager
+def profile_stream(stream_name, pass_name):
+    """
+    Profiles a pass over the `profile_stream` of the config with cProfile or tracemalloc and
+    logs the top of the profile. cProfile only profiles the thread running the pass.
+    """
+    if stream_name != Context.profile_stream:
+        yield
+        return
+
+    if Context.profiler == 'tracemalloc':
+        # The passes of a stream may run at the same time, the first one traces for both
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            yield
+        finally:
+            if tracemalloc.is_tracing():
+                statistics = tracemalloc.take_snapshot().statistics('lineno')[:PROFILE_TOP]
+                _, peak = tracemalloc.get_traced_memory()
+                LOGGER.info('Memory profile of %s, %.1f MiB at peak:\n%s', pass_name, peak / 2 ** 20,
+                            '\n'.join(str(statistic) for statistic in statistics))
+            if started:
+                tracemalloc.stop()
+        return
+
+    # The passes of a stream may run at the same time, an overlapping pass is not profiled
+    with PROFILE_LOCK:
+        started = not Context.profiling
+        Context.profiling = True
+    if not started:
+        LOGGER.info('Not profiling %s, another pass of %s is being profiled', pass_name, stream_name)
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        yield
+    finally:
+        profiler.disable()
+        with PROFILE_LOCK:
+            Context.profiling = False
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP)
+        LOGGER.info('Profile of %s:\n%s', pass_name, output.getvalue())
+
+
+def get_endpoint_template(method, url):
+    """
+    Returns the endpoint of a request with the ids of its path replaced and its expanded
+    fields, e.g. `GET /v1/invoices/{id}/lines` or `GET /v1/customers?expand=data.sources`.
+    """
+    parts = urlsplit(url)
+    segments = parts.path.split('/')
+    # The paths alternate resources and ids after the version, as in /v1/invoices/in_x/lines
+    path = '/'.join(segments[:2] + ['{id}' if index % 2 and '_' in segment else segment
+                                    for index, segment in enumerate(segments[2:])])
+    expand = sorted(value for key, value in parse_qsl(parts.query) if key.startswith('expand'))
+    return '{} {}{}'.format(method.upper(), path, '?expand=' + ','.join(expand) if expand else '')
+
+
+class EndpointStats():  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.attempts = 0
+        self.retries = 0
+        self.sleep_seconds = 0.0
+        self.bytes_received = 0
+        self.status_codes = {}
+        self.latencies = array('d')
+
+
+class HttpMetrics():
+    """
+    Collects the requests made to every endpoint: the attempts, the retries and the time
+    slept before them, the status codes, the bytes received and the latencies, which are
+    emitted as metrics with their percentiles at the end of the run.
+    """
+    percentiles = (50, 95, 99)
+
+    def __init__(self):
+        self.endpoints = {}
+        self.lock = threading.Lock()
+        self.last_request = threading.local()
+
+    def get_stats(self, endpoint):
+        stats = self.endpoints.get(endpoint)
+        if stats is None:
+            stats = self.endpoints.setdefault(endpoint, EndpointStats())
+        return stats
+
+    def record_attempt(self, endpoint, seconds, status_code, bytes_received):
+        """
+        Record an attempt of a request, with the status code of its response or `error`.
+        """
+        self.last_request.endpoint = endpoint
+        with self.lock:
+            stats = self.get_stats(endpoint)
+            stats.attempts += 1
+            stats.status_codes[status_code] = stats.status_codes.get(status_code, 0) + 1
+            stats.bytes_received += bytes_received
+            stats.latencies.append(seconds)
+
+    def record_retry(self, sleep_seconds, endpoint=None):
+        """
+        Record a retry and its sleep, of the last request of the thread unless the endpoint is given.
+        """
+        endpoint = endpoint or getattr(self.last_request, 'endpoint', None)
+        if endpoint is None:
+            return
+        with self.lock:
+            stats = self.get_stats(endpoint)
+            stats.retries += 1
+            stats.sleep_seconds += sleep_seconds
+
+    def log_summary(self):
+        for endpoint, stats in sorted(self.endpoints.items()):
+            latencies = sorted(stats.latencies)
+            percentiles = {percentile: latencies[max(math.ceil(percentile / 100 * len(latencies)) - 1, 0)]
+                           for percentile in self.percentiles} if latencies else {}
+            tags = {metrics.Tag.endpoint: endpoint}
+            for metric, value in (('http_request_attempts', stats.attempts),
+                                  ('http_request_retries', stats.retries),
+                                  ('http_bytes_received', stats.bytes_received)):
+                metrics.log(LOGGER, metrics.Point('counter', metric, value, tags))
+            for status_code, count in stats.status_codes.items():
+                metrics.log(LOGGER, metrics.Point('counter', 'http_responses', count,
+                                                  {**tags, metrics.Tag.http_status_code: status_code}))
+            metrics.log(LOGGER, metrics.Point('timer', 'http_retry_sleep', stats.sleep_seconds, tags))
+            for percentile, seconds in percentiles.items():
+                metrics.log(LOGGER, metrics.Point('timer', 'http_request_duration_p{}'.format(percentile),
+                                                  seconds, tags))
+
+            LOGGER.info('%s: %d attempts, %d retries after %.1fs of sleep, %.1f MiB received, status codes %s, %s',
+                        endpoint, stats.attempts, stats.retries, stats.sleep_seconds, stats.bytes_received / 2 ** 20,
+                        ', '.join('{}: {}'.format(status_code, count)
+                                  for status_code, count in sorted(stats.status_codes.items(), key=str)),
+                        ' '.join('p{} {:.0f}ms'.format(percentile, seconds * 1000)
+                                 for percentile, seconds in percentiles.items()))
+
+
+HTTP_METRICS = HttpMetrics()
+
+
+def get_response_size(body, headers):
+    """
+    Returns the bytes received for a response, as sent when it is compressed.
+    """
+    content_length = headers.get('content-length') if headers is not None else None
+    if content_length is not None:
+        return int(content_length)
+    return len(body) if isinstance(body, (bytes, str)) else 0
+
+
+def record_backoff(details):
+    """ Records the retries of the rate limited requests made by the tap. """
+    HTTP_METRICS.record_retry(details['wait'])
+
+
 def apply_request_timer_to_client(client):
-    """ Instruments the Stripe SDK client object with a request timer. """
-    _original_request = client.request
+    """ Instruments the Stripe SDK client object with a request timer and the HTTP metrics. """
+    def wrap_request(_original_request):
+        def wrapped_request(*args, **kwargs):
+            endpoint = get_endpoint_template(args[0], args[1])
+            start = time.perf_counter()
+            response = None
+            try:
+                with metrics.Timer(metrics.Metric.http_request_duration, {metrics.Tag.endpoint: endpoint}) as timer:
+                    response = _original_request(*args, **kwargs)
+                    timer.tags[metrics.Tag.http_status_code] = response[1]
+                    return response
+            finally:
+                seconds = time.perf_counter() - start
+                PhaseTimer.add_http(seconds)
+                if response is None:
+                    HTTP_METRICS.record_attempt(endpoint, seconds, 'error', 0)
+                else:
+                    HTTP_METRICS.record_attempt(endpoint, seconds, response[1], get_response_size(*response[::2]))
+        return wrapped_request
+    client.request = wrap_request(client.request)
+    client.request_stream = wrap_request(client.request_stream)
+
+    # The SDK sleeps for the time returned before every retry of a request
+    _original_sleep_time_seconds = client._sleep_time_seconds  # pylint: disable=protected-access
+    def sleep_time_seconds(num_retries, response=None):
+        sleep_seconds = _original_sleep_time_seconds(num_retries, response)
+        HTTP_METRICS.record_retry(sleep_seconds)
+        return sleep_seconds
+    client._sleep_time_seconds = sleep_time_seconds  # pylint: disable=protected-access
+
+
+class ConcurrencyController():
+    """
+    Limits the number of requests in flight across all the threads and the asyncio engine
+    with additive increase and multiplicative decrease: the limit grows by one for every
+    `limit` successful requests, and is halved when Stripe answers 429. Only the first 429
+    of the requests sent under a limit cuts it, so that a burst of 429s halves it once.
+    The limit stops growing while requests take more than `latency_tolerance` times the
+    fastest observed request.
+    """
+    min_concurrency = 1
+    decrease_factor = 0.5
+    latency_tolerance = 2
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.generation = 0  # Incremented every time the limit is cut
+        self.min_latency = None
+        self.condition = threading.Condition()
+        self.async_waiters = []
+
+    def has_slot(self):
+        return self.in_flight < max(self.min_concurrency, int(self.limit))
+
+    def take_slot(self):
+        self.in_flight += 1
+        return self.generation
+
+    def acquire(self):
+        """
+        Wait for a free slot and return the token to release it with.
+        """
+        with self.condition:
+            while not self.has_slot():
+                self.condition.wait()
+            return self.take_slot()
+
+    async def acquire_async(self):
+        """
+        Same as `acquire` without blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.condition:
+                if self.has_slot():
+                    return self.take_slot()
+                waiter = loop.create_future()
+                self.async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, token, latency, status_code):
+        """
+        Free the slot of a finished request and adjust the limit from its status code and latency.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            if status_code == 429:
+                if token == self.generation:
+                    self.generation += 1
+                    self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+                    LOGGER.info('Rate limited by Stripe, lowering the concurrency to %d requests',
+                                int(self.limit))
+            elif status_code is not None and 200 <= status_code < 300:
+                if self.min_latency is None or latency < self.min_latency:
+                    self.min_latency = latency
+                if latency <= self.min_latency * self.latency_tolerance:
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+            async_waiters, self.async_waiters = self.async_waiters, []
+        for loop, waiter in async_waiters:
+            loop.call_soon_threadsafe(wake_async_waiter, waiter)
+
+
+def wake_async_waiter(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def apply_concurrency_controller_to_client(client):
+    """ Routes the requests of the Stripe SDK client object through the concurrency controller. """
+    def wrap_request(_original_request):
+        def wrapped_request(*args, **kwargs):
+            controller = Context.concurrency_controller
+            if controller is None:
+                return _original_request(*args, **kwargs)
+            token = controller.acquire()
+            request_start = time.monotonic()
+            status_code = None
+            try:
+                response = _original_request(*args, **kwargs)
+                status_code = response[1]
+                return response
+            finally:
+                controller.release(token, time.monotonic() - request_start, status_code)
+        return wrapped_request
+    client.request = wrap_request(client.request)
+    client.request_stream = wrap_request(client.request_stream)
+
+
+def get_request_account(headers):
+    return (headers or {}).get('Stripe-Account') or ''
+
 
-    def wrapped_request(*args, **kwargs):
-        url = args[1]
-        match = re.match(r'http[s]?://api\.stripe\.com/v1/(\w+)\??', url)
-        stream_name = match.groups()[0]
-        with metrics.http_request_timer(stream_name):
-            return _original_request(*args, **kwargs)
-    client.request = wrapped_request
+def get_archive_url(url):
+    """
+    Returns the path and the query of a request url, without the api base.
+    """
+    parts = urlsplit(url)
+    return parts.path + ('?' + parts.query if parts.query else '')
+
+
+class PageArchive():
+    """
+    Writes the responses of the GET requests to Stripe to a gzipped JSON lines file of the
+    archive directory, one file per sync, to be replayed later by `ArchiveReplay`.
+    """
+
+    def __init__(self, archive_dir):
+        os.makedirs(archive_dir, exist_ok=True)
+        self.path = os.path.join(archive_dir, 'pages-{}.jsonl.gz'.format(
+            datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')))
+        self.file = gzip.open(self.path, 'wt', encoding='utf-8')
+        self.lock = threading.Lock()
+        LOGGER.info('Archiving the responses of Stripe to %s', self.path)
+
+    def write(self, url, headers, body):
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        line = json.dumps({'account': get_request_account(headers), 'url': get_archive_url(url), 'body': body})
+        with self.lock:
+            self.file.write(line + '\n')
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class ArchiveReplay():
+    """
+    Answers the requests of a sync from the archive files written by `PageArchive`, without
+    the network. The objects of the list pages are indexed in a temporary SQLite file by list,
+    so the list requests of any date windows, page size or state are answered the same way as
+    Stripe filters and pages the objects, newest first. The other requests are answered with
+    their archived response.
+    """
+    paging_params = ('limit', 'starting_after', 'ending_before')
+    range_param = re.compile(r'^(\w+)\[(gte|gt|lte|lt)\]$')
+    range_operators = {'gte': '>=', 'gt': '>', 'lte': '<=', 'lt': '<'}
+    expand_param = re.compile(r'^expand(\[\d*\])?$')
+
+    def __init__(self, archive_dir):
+        self.index_dir = tempfile.mkdtemp(prefix='tap-stripe-replay-')
+        self.connection = sqlite3.connect(os.path.join(self.index_dir, 'index.db'), check_same_thread=False)
+        self.finalizer = weakref.finalize(self, close_archive_replay, self.connection, self.index_dir)
+        self.lock = threading.Lock()
+        self.sequence = itertools.count()
+        self.connection.executescript("""
+            CREATE TABLE lists (list_key TEXT PRIMARY KEY);
+            CREATE TABLE objects (list_key TEXT, id TEXT, created INTEGER, type TEXT, seq INTEGER, body TEXT,
+                                  PRIMARY KEY (list_key, id));
+            CREATE INDEX objects_created ON objects (list_key, created, seq);
+            CREATE TABLE responses (account TEXT, url TEXT, body TEXT, PRIMARY KEY (account, url));
+        """)
+        archive_paths = sorted(glob.glob(os.path.join(archive_dir, 'pages-*.jsonl.gz')))
+        if not archive_paths:
+            raise Exception("No archive to replay in {}.".format(archive_dir))
+        for archive_path in archive_paths:
+            LOGGER.info('Indexing the archive %s', archive_path)
+            with gzip.open(archive_path, 'rt', encoding='utf-8') as archive_file:
+                for line in archive_file:
+                    response = json.loads(line)
+                    self.add(response['account'], response['url'], response['body'])
+        self.connection.commit()
+
+    def get_list_key(self, account, path, params):
+        """
+        Returns the key of the list requested, without its paging, date range, type filter and
+        expanded fields, so a replay under another field selection is served the archived objects.
+        """
+        return json.dumps([account, path, sorted(
+            (name, value) for name, value in params
+            if name not in self.paging_params and name != 'type' and not self.range_param.match(name)
+            and not self.expand_param.match(name))])
+
+    def add(self, account, url, body):
+        parts = urlsplit(url)
+        response = json.loads(body)
+        if response.get('object') == 'list' and isinstance(response.get('data'), list):
+            list_key = self.get_list_key(account, parts.path, parse_qsl(parts.query))
+            self.connection.execute('INSERT OR IGNORE INTO lists VALUES (?)', (list_key,))
+            # A later response has the latest version of an object
+            self.connection.executemany(
+                'INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (list_key, id) DO UPDATE SET '
+                'created = excluded.created, type = excluded.type, body = excluded.body',
+                ((list_key, obj['id'], obj.get('created', 0), obj.get('type'), next(self.sequence), json.dumps(obj))
+                 for obj in response['data']))
+        else:
+            self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?)', (account, url, body))
+
+    def get_page_conditions(self, list_key, params):
+        """
+        Returns the SQL conditions and their args selecting the objects of a list page after its paging.
+        """
+        conditions, args = ['list_key = ?'], [list_key]
+        for name, value in params:
+            match = self.range_param.match(name)
+            if match:
+                field = 'created' if match.group(1) == 'created' else \
+                    "json_extract(body, '$.{}')".format(match.group(1))
+                conditions.append('{} {} ?'.format(field, self.range_operators[match.group(2)]))
+                args.append(int(value))
+            elif name == 'type':
+                conditions.append('type GLOB ?')
+                args.append(value)
+            elif name == 'starting_after':
+                last = self.connection.execute('SELECT created, seq FROM objects WHERE list_key = ? AND id = ?',
+                                               (list_key, value)).fetchone()
+                if last:
+                    conditions.append('(created < ? OR created = ? AND seq > ?)')
+                    args.extend([last[0], last[0], last[1]])
+        return conditions, args
+
+    def request(self, url, headers):
+        """
+        Returns the body, status code and headers of the response to a request from the archive.
+        """
+        account = get_request_account(headers)
+        parts = urlsplit(url)
+        params = parse_qsl(parts.query)
+        list_key = self.get_list_key(account, parts.path, params)
+        with self.lock:
+            row = self.connection.execute('SELECT body FROM responses WHERE account = ? AND url = ?',
+                                          (account, get_archive_url(url))).fetchone()
+            if row:
+                return row[0].encode('utf-8'), 200, {}
+            if not self.connection.execute('SELECT 1 FROM lists WHERE list_key = ?', (list_key,)).fetchone():
+                return json.dumps({'error': {'type': 'invalid_request_error',
+                                             'message': 'The request {} is not in the archive'.format(
+                                                 get_archive_url(url))}}).encode('utf-8'), 404, {}
+            conditions, args = self.get_page_conditions(list_key, params)
+            limit = int(dict(params).get('limit', 10))
+            rows = self.connection.execute(
+                'SELECT body FROM objects WHERE {} ORDER BY created DESC, seq LIMIT ?'.format(' AND '.join(conditions)),
+                args + [limit + 1]).fetchall()
+        body = '{{"object": "list", "data": [{}], "has_more": {}, "url": {}}}'.format(
+            ', '.join(row[0] for row in rows[:limit]), json.dumps(len(rows) > limit), json.dumps(parts.path))
+        return body.encode('utf-8'), 200, {}
+
+    def close(self):
+        self.finalizer()
+
+
+def close_archive_replay(connection, index_dir):
+    connection.close()
+    shutil.rmtree(index_dir, ignore_errors=True)
+
+
+def read_stream(stream):
+    if hasattr(stream, 'stream'):
+        # The urllib3 response of the requests client, which may be gzipped
+        return stream.read(decode_content=True)
+    return stream.read()
+
+
+def apply_page_archive_to_client(client):
+    """
+    Archives the responses of the Stripe SDK client object, or answers its requests from the archive in a replay.
+    """
+    def wrap_request(_original_request, is_streaming):
+        def wrapped_request(method, url, headers, *args, **kwargs):
+            if Context.archive_replay:
+                body, status_code, rheaders = Context.archive_replay.request(url, headers)
+                return (io.BytesIO(body) if is_streaming else body), status_code, rheaders
+            response = _original_request(method, url, headers, *args, **kwargs)
+            if Context.page_archive and method == 'get' and 200 <= response[1] < 300:
+                # The streamed pages are read fully to be archived
+                body = read_stream(response[0]) if is_streaming else response[0]
+                Context.page_archive.write(url, headers, body)
+                if is_streaming:
+                    response = (io.BytesIO(body),) + tuple(response[1:])
+            return response
+        return wrapped_request
+    client.request = wrap_request(client.request, False)
+    client.request_stream = wrap_request(client.request_stream, True)
+
+
+def apply_window_bisection_to_client(client):
+    """
+    Stops the Stripe SDK client object from retrying the requests of a date window that is split
+    when they time out or fail to connect, so the window is split at the first timeout.
+    """
+    _original_should_retry = client._should_retry  # pylint: disable=protected-access
+    def should_retry(response, api_connection_error, num_retries):
+        if response is None and BISECTING_WINDOW.get():
+            return False
+        return _original_should_retry(response, api_connection_error, num_retries)
+    client._should_retry = should_retry  # pylint: disable=protected-access
+
+
+def get_request_timeout():
+    request_timeout = Context.config.get('request_timeout')
+    # if request_timeout is other than 0, "0" or "" then use request_timeout
+    if request_timeout and float(request_timeout):
+        return float(request_timeout)
+    # If value is 0, "0" or "" then set default to 300 seconds.
+    return REQUEST_TIMEOUT
 
 
 def configure_stripe_client():
@@ -256,19 +1157,19 @@ def configure_stripe_client():
     # https://github.com/stripe/stripe-python/tree/a9a8d754b73ad47bdece6ac4b4850822fa19db4e#configuring-automatic-retries
     stripe.max_network_retries = 15
 
-    request_timeout = Context.config.get('request_timeout')
-    # if request_timeout is other than 0, "0" or "" then use request_timeout
-    if request_timeout and float(request_timeout):
-        request_timeout = float(request_timeout)
-    else:  # If value is 0, "0" or "" then set default to 300 seconds.
-        request_timeout = REQUEST_TIMEOUT
     # configure the clint with the request_timeout
-    client = stripe.http_client.RequestsClient(timeout=request_timeout)
+    client = stripe.http_client.RequestsClient(timeout=get_request_timeout())
+    apply_page_archive_to_client(client)
     apply_request_timer_to_client(client)
+    apply_concurrency_controller_to_client(client)
+    apply_window_bisection_to_client(client)
     stripe.default_http_client = client
     # Set stripe logging to INFO level
     # https://github.com/stripe/stripe-python/tree/a9a8d754b73ad47bdece6ac4b4850822fa19db4e#logging
     logging.getLogger('stripe').setLevel(logging.INFO)
+    if Context.archive_replay:
+        # A replay makes no requests to Stripe
+        return
     # Verify connectivity
     account = stripe.Account.retrieve(Context.config.get('account_id'))
     msg = "Successfully connected to Stripe Account with display name" \
@@ -276,6 +1177,268 @@ def configure_stripe_client():
     LOGGER.info(msg, account.settings.dashboard.display_name)
 
 
+def encode_params(params):
+    """
+    Encode the request params the same way as the Stripe SDK, keeping the square brackets readable.
+    """
+    return urlencode(list(_api_encode(params))).replace("%5B", "[").replace("%5D", "]")
+
+
+class AsyncioEngine():
+    """
+    Fetches list pages with an asyncio HTTP client and a bounded connection pool, so that
+    hundreds of requests can be in flight on a single event loop thread. The loop runs in a
+    background thread, `submit` schedules a coroutine on it and returns a future, which lets
+    the engine be used where a thread pool executor is used otherwise.
+    """
+    max_tries = 7  # Same as the retries of the 429 RateLimitError for the SDK requests
+
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS, request_timeout=REQUEST_TIMEOUT):
+        if aiohttp is None:
+            raise Exception("The asyncio http_engine requires the aiohttp package. "
+                            "Install it with `pip install tap-stripe[asyncio]`.")
+        self.max_connections = max_connections
+        self.request_timeout = request_timeout
+        self.session = None
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='tap-stripe-asyncio', daemon=True)
+        self.thread.start()
+
+    def submit(self, coroutine_function, *args):
+        """
+        Schedule the coroutine on the event loop and return a concurrent.futures.Future.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine_function(*args), self.loop)
+
+    def run(self, coroutine_function, *args):
+        return self.submit(coroutine_function, *args).result()
+
+    async def get(self, url, headers):
+        """
+        Issue a GET request and return the body, status code and headers of the response.
+        """
+        if Context.archive_replay:
+            body, status_code, rheaders = Context.archive_replay.request(url, headers)
+            return body, status_code, rheaders
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout))
+        endpoint = get_endpoint_template('get', url)
+        controller = Context.concurrency_controller
+        token = await controller.acquire_async() if controller else None
+        request_start = time.monotonic()
+        status_code = None
+        bytes_received = 0
+        try:
+            with metrics.Timer(metrics.Metric.http_request_duration, {metrics.Tag.endpoint: endpoint}) as timer:
+                async with self.session.get(url, headers=headers) as response:  # pylint: disable=not-async-context-manager
+                    status_code = timer.tags[metrics.Tag.http_status_code] = response.status
+                    body = await response.read()
+                    bytes_received = get_response_size(body, response.headers)
+                    if Context.page_archive and 200 <= response.status < 300:
+                        Context.page_archive.write(url, headers, body)
+                    return body, response.status, response.headers
+        finally:
+            seconds = time.monotonic() - request_start
+            HTTP_METRICS.record_attempt(endpoint, seconds, status_code or 'error', bytes_received)
+            if controller:
+                controller.release(token, seconds, status_code)
+
+    async def request(self, path, params, decode=json.loads):
+        """
+        Request a Stripe API path and return the JSON decoded with `decode`. Rate limited,
+        conflicting and server errors are retried with an exponential backoff, other errors
+        are raised as the same Stripe errors as the SDK raises.
+        """
+        requestor = APIRequestor(account=Context.get_account_id())
+        url = "{}{}?{}".format(stripe.api_base, path, encode_params(params))
+        headers = requestor.request_headers(stripe.api_key, 'get')
+        for tries in range(1, self.max_tries + 1):
+            try:
+                rbody, rcode, rheaders = await self.get(url, headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                if tries == self.max_tries:
+                    raise stripe.error.APIConnectionError(
+                        "Request to Stripe failed: {}".format(error)) from error
+            else:
+                if 200 <= rcode < 300:
+                    return decode(rbody)
+                if rcode not in (409, 429) and rcode < 500 or tries == self.max_tries:
+                    # Raises the Stripe error of the response
+                    requestor.interpret_response(rbody, rcode, rheaders)
+            sleep_seconds = random.uniform(0, 2 ** tries)
+            HTTP_METRICS.record_retry(sleep_seconds, get_endpoint_template('get', url))
+            await asyncio.sleep(sleep_seconds)
+        raise stripe.error.APIConnectionError("Request to Stripe failed after {} tries".format(self.max_tries))
+
+    async def list_all(self, path, params, raw=False, lazy=False, max_objects=None):
+        """
+        Return the objects of all the pages of a list request as StripeObjects, as plain
+        dicts decoded by `decode_raw_json` when `raw` is set, or as `LazyStripeObject`
+        views when `lazy` is set. The pagination stops once more than `max_objects` are listed.
+        """
+        objects = []
+        params = dict(params)
+        while True:
+            page = await self.request(path, params, decode_raw_json if raw else json.loads)
+            data, has_more = (page, page.has_more) if raw else (page['data'], page.get('has_more'))
+            objects.extend(data)
+            if not has_more or not data or max_objects and len(objects) > max_objects:
+                break
+            params['starting_after'] = data[-1]['id']
+        if raw:
+            return objects
+        if lazy:
+            return [LazyStripeObject(obj) for obj in objects]
+        return [stripe.util.convert_to_stripe_object(obj, stripe.api_key, stripe.api_version,
+                                                     Context.get_account_id())
+                for obj in objects]
+
+    def close(self):
+        if self.session is not None:
+            asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+class ListData(list):
+    """
+    The data of a Stripe list object, keeping whether the list has more pages.
+    """
+    has_more = False
+
+
+def unwrap_list_object(obj):
+    """
+    Decoding hook of `decode_raw_json`, bringing the data of list objects up to their parent's
+    level the same way as `unwrap_data_objects`.
+    """
+    if obj.get('object') == 'list' and 'data' in obj:
+        data = obj['data']
+        if isinstance(data, list):
+            data = ListData(data)
+            data.has_more = obj.get('has_more', False)
+        return data
+    return obj
+
+
+def decode_raw_json(body):
+    """
+    Decode a response body straight into plain dicts, with the list objects already unwrapped.
+    A list response is returned as a `ListData` of its objects.
+    """
+    return json.loads(body, object_hook=unwrap_list_object)
+
+
+class ListPageParser():  # pylint: disable=too-many-instance-attributes
+    """
+    Incremental parser of a list response, returning the objects of its `data` as soon as
+    their bytes have arrived. Only the object being read is buffered, and `has_more` is kept
+    once read. The objects are decoded the same way as `decode_raw_json`.
+    """
+    whitespace = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder(object_hook=unwrap_list_object)
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.state = 'start'
+        self.key = None
+        self.has_more = False
+        # A value failing to decode is only decoded again once its buffer has doubled
+        self.retry_length = 0
+
+    def parse(self, stream, chunk_size=STREAM_CHUNK_SIZE):
+        """ Yields the objects of the list read from the response stream. """
+        if hasattr(stream, 'stream'):
+            # The urllib3 response of the requests client, which may be gzipped
+            chunks = stream.stream(chunk_size, decode_content=True)
+        else:
+            chunks = iter(functools.partial(stream.read, chunk_size), b'')
+        for chunk in chunks:
+            yield from self.feed(chunk)
+        try:
+            objects = self.feed(b'', final=True)
+        except json.JSONDecodeError:
+            objects = None
+        if objects is None or self.state != 'done':
+            raise stripe.error.APIConnectionError('The list page ended before it was complete.')
+        yield from objects
+
+    def feed(self, chunk, final=False):
+        """ Returns the objects completed by the chunk. """
+        self.buffer = self.buffer[self.pos:] + self.text_decoder.decode(chunk, final)
+        self.pos = 0
+        objects = []
+        while self.parse_token(objects, final):
+            pass
+        return objects
+
+    def parse_token(self, objects, final):
+        """ Parses the next token of the buffer, returning False when more bytes are needed. """
+        self.pos = self.whitespace.match(self.buffer, self.pos).end()
+        if self.pos == len(self.buffer):
+            return False
+        char = self.buffer[self.pos]
+        if self.state in ('start', 'colon'):
+            self.expect(char, '{' if self.state == 'start' else ':')
+            self.state = 'key' if self.state == 'start' else 'value'
+        elif self.state == 'key' and char in ',}':
+            self.pos += 1
+            if char == '}':
+                self.state = 'done'
+        elif self.state == 'key':
+            return self.decode_value(final, self.set_key)
+        elif self.state == 'value' and self.key == 'data' and char == '[':
+            self.pos += 1
+            self.state = 'items'
+        elif self.state == 'value':
+            return self.decode_value(final, self.set_value)
+        elif self.state == 'items' and char in ',]':
+            self.pos += 1
+            if char == ']':
+                self.state = 'key'
+        elif self.state == 'items':
+            return self.decode_value(final, objects.append)
+        else:
+            self.expect(char, '')
+        return True
+
+    def expect(self, char, expected):
+        if char != expected:
+            raise json.JSONDecodeError('Expecting {!r}'.format(expected), self.buffer, self.pos)
+        self.pos += 1
+
+    def decode_value(self, final, on_value):
+        if not final and len(self.buffer) - self.pos < self.retry_length:
+            return False
+        try:
+            value, end = self.decoder.raw_decode(self.buffer, self.pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            self.retry_length = 2 * (len(self.buffer) - self.pos)
+            return False
+        if end == len(self.buffer) and not final:
+            # A number may go on in the next chunk
+            return False
+        self.retry_length = 0
+        self.pos = end
+        on_value(value)
+        return True
+
+    def set_key(self, key):
+        self.key = key
+        self.state = 'colon'
+
+    def set_value(self, value):
+        if self.key == 'has_more':
+            self.has_more = value
+        self.state = 'key'
+
+
 def unwrap_data_objects(rec):
     """
     Looks for levels in the record that look like:
@@ -306,6 +1469,317 @@ def unwrap_data_objects(rec):
     return rec
 
 
+def compile_metadata_filter(mdata):
+    """
+    Compile the field selection of the metadata into a tree of the fields to prune, with the
+    same rules as `Transformer.filter_data_by_metadata`: a field is pruned when it is not
+    selected or unsupported, unless its inclusion is automatic, which also keeps the fields
+    nested in it. Returns None when no field is pruned.
+    """
+    root = {}
+    for breadcrumb, field_metadata in (mdata or {}).items():
+        if not breadcrumb or not (field_metadata.get('selected') is False
+                                  or field_metadata.get('inclusion') == 'unsupported'):
+            continue
+        node = root
+        path = ()
+        tokens = list(breadcrumb)
+        while tokens:
+            if tokens[0] == 'items':
+                tokens.pop(0)
+                path += ('items',)
+                node = node.setdefault('items', {})
+            elif tokens[0] == 'properties' and len(tokens) >= 2:
+                field_name = tokens[1]
+                del tokens[:2]
+                path += ('properties', field_name)
+                if metadata.get(mdata, path, 'inclusion') == 'automatic':
+                    break
+                if not tokens:
+                    node.setdefault('prune', set()).add(field_name)
+                else:
+                    node = node.setdefault('properties', {}).setdefault(field_name, {})
+            else:
+                break
+    return root or None
+
+
+def filter_data(data, node):
+    """
+    Prune the fields of the tree compiled by `compile_metadata_filter` from the data.
+    """
+    if isinstance(data, dict):
+        for field_name in node.get('prune', ()):
+            data.pop(field_name, None)
+        for field_name, child in node.get('properties', {}).items():
+            if field_name in data:
+                data[field_name] = filter_data(data[field_name], child)
+    elif isinstance(data, list) and 'items' in node:
+        data = [filter_data(row, node['items']) for row in data]
+    return data
+
+
+def compile_schema(schema, transform_datetime, trusted=False, compiled=None):
+    """
+    Compile a resolved JSON schema into a function returning (success, value) for a value,
+    with the same type coercion as `Transformer.transform_recur`. The sub schemas are
+    compiled once and shared through `compiled`.
+    """
+    compiled = {} if compiled is None else compiled
+    if id(schema) in compiled:
+        return compiled[id(schema)]
+
+    if 'anyOf' in schema:
+        transforms = [compile_schema(sub_schema, transform_datetime, trusted, compiled)
+                      for sub_schema in schema['anyOf']]
+    elif 'type' not in schema:
+        # No typing information so the value is not transformed
+        transforms = [transform_untyped]
+    else:
+        types = schema['type'] if isinstance(schema['type'], list) else [schema['type']]
+        # Same as singer, "null" is tried last
+        if 'null' in types:
+            types = [typ for typ in types if typ != 'null'] + ['null']
+        transforms = [compile_type(typ, schema, transform_datetime, trusted, compiled) for typ in types]
+
+    if len(transforms) == 1:
+        transform = transforms[0]
+    else:
+        def transform(data):
+            for transform_type in transforms:
+                success, value = transform_type(data)
+                if success:
+                    return success, value
+            return False, None
+    compiled[id(schema)] = transform
+    return transform
+
+
+def transform_untyped(data):
+    return True, data
+
+
+def transform_null(data):
+    if data is None or data == "":
+        return True, None
+    return False, None
+
+
+def transform_trusted(data):
+    return data is not None, data
+
+
+def transform_string(data):
+    if data is None:
+        return False, None
+    try:
+        return True, str(data)
+    except Exception:  # pylint: disable=broad-except
+        return False, None
+
+
+def transform_integer(data):
+    if isinstance(data, str):
+        data = data.replace(",", "")
+    try:
+        return True, int(data)
+    except Exception:  # pylint: disable=broad-except
+        return False, None
+
+
+def transform_number(data):
+    if isinstance(data, str):
+        data = data.replace(",", "")
+    try:
+        return True, float(data)
+    except Exception:  # pylint: disable=broad-except
+        return False, None
+
+
+def transform_boolean(data):
+    if isinstance(data, str) and data.lower() == "false":
+        return True, False
+    try:
+        return True, bool(data)
+    except Exception:  # pylint: disable=broad-except
+        return False, None
+
+
+def transform_decimal(data):
+    if isinstance(data, (str, float, int)):
+        try:
+            return True, str(decimal.Decimal(str(data)))
+        except Exception:  # pylint: disable=broad-except
+            return False, None
+    if isinstance(data, decimal.Decimal):
+        try:
+            return True, 'NaN' if data.is_snan() else str(data)
+        except Exception:  # pylint: disable=broad-except
+            return False, None
+    return False, None
+
+
+SCALAR_TRANSFORMS = {
+    'string': transform_string,
+    'integer': transform_integer,
+    'number': transform_number,
+    'boolean': transform_boolean,
+}
+
+
+def compile_type(typ, schema, transform_datetime, trusted, compiled):  # pylint: disable=too-many-return-statements
+    """
+    Compile the transform of a value to one of the types of the schema, as `Transformer._transform`.
+    """
+    if typ == 'null':
+        return transform_null
+
+    if schema.get('format') == 'date-time':
+        def transform_date_time(data):
+            data = transform_datetime(data)
+            return data is not None, data
+        return transform_date_time
+
+    if schema.get('format') == 'singer.decimal':
+        return transform_decimal
+
+    if typ == 'object':
+        return compile_object(schema.get('properties', {}), schema.get('patternProperties'),
+                              transform_datetime, trusted, compiled)
+
+    if typ == 'array':
+        return compile_array(schema, transform_datetime, trusted, compiled)
+
+    if typ in SCALAR_TRANSFORMS:
+        # Trusted values are already of the type of the schema
+        return transform_trusted if trusted else SCALAR_TRANSFORMS[typ]
+
+    return transform_null_type_mismatch
+
+
+def transform_null_type_mismatch(_):
+    return False, None
+
+
+def compile_object(properties, pattern_properties, transform_datetime, trusted, compiled):
+    if properties == {} and not pattern_properties:
+        def transform_any_object(data):
+            return isinstance(data, dict), data
+        return transform_any_object
+
+    property_transforms = {key: compile_schema(sub_schema, transform_datetime, trusted, compiled)
+                           for key, sub_schema in properties.items()}
+    pattern_transforms = {}
+
+    def get_pattern_transform(key):
+        if key not in pattern_transforms:
+            pattern_schemas = [sub_schema for pattern, sub_schema in pattern_properties.items()
+                               if re.match(pattern, key)]
+            # The anyOf schema only lives here, so it is not shared through `compiled`
+            pattern_transforms[key] = pattern_schemas and compile_schema(
+                {'anyOf': pattern_schemas}, transform_datetime, trusted)
+        return pattern_transforms[key]
+
+    def transform_object(data):
+        if not isinstance(data, dict):
+            return False, data
+        result = {}
+        for key, value in data.items():
+            transform = property_transforms.get(key)
+            if transform is None:
+                # Fields missing from the schema are removed
+                transform = pattern_properties and get_pattern_transform(key)
+                if not transform:
+                    continue
+            success, result[key] = transform(value)
+            if not success:
+                return False, None
+        return True, result
+    return transform_object
+
+
+def compile_array(schema, transform_datetime, trusted, compiled):
+    if 'items' not in schema:
+        def transform_invalid_array(_):
+            # An array without items fails like in singer
+            raise KeyError('items')
+        return transform_invalid_array
+
+    transform_item = compile_schema(schema['items'], transform_datetime, trusted, compiled)
+
+    def transform_array(data):
+        if not isinstance(data, list):
+            return False, data
+        result = []
+        for row in data:
+            success, value = transform_item(row)
+            if not success:
+                return False, None
+            result.append(value)
+        return True, result
+    return transform_array
+
+
+class CompiledTransformer(Transformer):
+    """
+    A singer Transformer that compiles the schema and the field selection of a stream into
+    nested functions the first time it transforms a record of the stream, rather than
+    interpreting the schema for every record. The records are transformed the same way, and
+    a record that does not match the schema is transformed again by singer to raise the same
+    SchemaMismatch.
+    With `trusted`, the values of the string, integer, number and boolean fields are not
+    validated nor coerced; fields are still pruned and date-times still formatted.
+    The compiled functions are shared by the transformers of all the passes, threads and
+    accounts, as a transformer is opened per event and per parent object.
+    """
+    compiled = {}
+    compile_lock = threading.Lock()
+
+    def __init__(self, integer_datetime_fmt=singer.UNIX_SECONDS_INTEGER_DATETIME_PARSING, trusted=False):
+        super().__init__(integer_datetime_fmt)
+        self.trusted = trusted
+
+    def compile(self, schema, mdata):
+        return (schema,
+                mdata,
+                compile_metadata_filter(mdata),
+                compile_schema(schema, self._transform_datetime, self.trusted))
+
+    def get_compiled(self, schema, metadata):  # pylint: disable=redefined-outer-name
+        """
+        Returns the compiled functions of the schema and the field selection, compiled once.
+        """
+        key = (id(schema), self.integer_datetime_fmt, self.trusted)
+        compiled = self.compiled.get(key)
+        if compiled is None or compiled[1] is not metadata and compiled[1] != metadata:
+            with self.compile_lock:
+                compiled = self.compiled.get(key)
+                if compiled is None or compiled[1] is not metadata and compiled[1] != metadata:
+                    compiled = self.compiled[key] = self.compile(schema, metadata)
+        return compiled
+
+    def transform(self, data, schema, metadata=None):  # pylint: disable=redefined-outer-name
+        _, _, metadata_filter, transform = self.get_compiled(schema, metadata)
+
+        if metadata_filter:
+            data = filter_data(data, metadata_filter)
+        success, transformed_data = transform(data)
+        if not success:
+            # Let singer report the fields that do not match the schema
+            return super().transform(data, schema, metadata)
+        return transformed_data
+
+
+def get_transformer():
+    """
+    Returns the transformer of the records for the configured transform mode.
+    """
+    if Context.transform_mode == 'singer':
+        return Transformer(singer.UNIX_SECONDS_INTEGER_DATETIME_PARSING)
+    return CompiledTransformer(singer.UNIX_SECONDS_INTEGER_DATETIME_PARSING,
+                               trusted=Context.transform_mode == 'trusted')
+
+
 class DependencyException(Exception):
     pass
 
@@ -366,10 +1840,12 @@ def get_discovery_metadata(schema, key_properties, replication_method, replicati
 def discover():
     raw_schemas = load_schemas()
     streams = []
+    # The shared schemas are resolved in place the first time they are referenced,
+    # and then reused by the other streams
+    refs = load_shared_schema_refs()
 
     for stream_name, stream_map in STREAM_SDK_OBJECTS.items():
         schema = raw_schemas[stream_name]['schema']
-        refs = load_shared_schema_refs()
         # create and add catalog entry
         catalog_entry = {
             'stream': stream_name,
@@ -461,7 +1937,8 @@ def reduce_foreign_keys(rec, stream_name):
 @backoff.on_exception(backoff.expo,
                         stripe.error.RateLimitError,
                         max_tries=7,
-                        factor=2)
+                        factor=2,
+                        on_backoff=record_backoff)
 def new_request(self, method, url, params=None, headers=None):
     '''The new request function to overwrite the request() function of the APIRequestor class of SDK.'''
     rbody, rcode, rheaders, my_api_key = self.request_raw(
@@ -477,18 +1954,171 @@ def new_request(self, method, url, params=None, headers=None):
 APIRequestor.request = new_request
 
 
+# Retry 429 RateLimitError 7 times, as `new_request` does.
+@backoff.on_exception(backoff.expo,
+                      stripe.error.RateLimitError,
+                      max_tries=7,
+                      factor=2,
+                      on_backoff=record_backoff)
+def request_raw_page(requestor, url, params, decode=decode_raw_json):
+    """
+    Request a list page and decode it with `decode_raw_json`, without building the StripeObjects.
+    """
+    rbody, rcode, rheaders, _ = requestor.request_raw('get', url, params, None, is_streaming=False)
+    if not 200 <= rcode < 300:
+        # Raises the Stripe error of the response
+        requestor.interpret_response(rbody, rcode, rheaders)
+    LOGGER.debug('request id : %s', rheaders.get('request-id'))
+    return decode(rbody)
+
+
+# Retry 429 RateLimitError 7 times, as `new_request` does.
+@backoff.on_exception(backoff.expo,
+                      stripe.error.RateLimitError,
+                      max_tries=7,
+                      factor=2,
+                      on_backoff=record_backoff)
+def request_streamed_page(requestor, url, params):
+    """
+    Request a list page, returning the response stream to be read by a `ListPageParser`.
+    """
+    stream, rcode, rheaders, _ = requestor.request_raw('get', url, params, None, is_streaming=True)
+    if not 200 <= rcode < 300:
+        # Raises the Stripe error of the response
+        requestor.interpret_streaming_response(stream, rcode, rheaders)
+    LOGGER.debug('request id : %s', rheaders.get('request-id'))
+    return stream
+
+
+def iter_streamed_page(requestor, url, params):
+    """
+    Yields the objects of a list page as they arrive, then returns whether the list has more pages.
+    A page cut short is requested again from the last object yielded.
+    """
+    tries = 0
+    while True:
+        parser = ListPageParser()
+        stream = request_streamed_page(requestor, url, params)
+        has_objects = False
+        try:
+            for obj in parser.parse(stream):
+                tries = 0
+                has_objects = True
+                params['starting_after'] = obj['id']
+                yield obj
+            return parser.has_more and has_objects
+        except (urllib3.exceptions.HTTPError, stripe.error.APIConnectionError) as ex:
+            tries += 1
+            if tries > stripe.max_network_retries or BISECTING_WINDOW.get():
+                raise stripe.error.APIConnectionError(
+                    'Reading a list page of {} failed: {}'.format(url, ex)) from ex
+            LOGGER.warning('Reading a list page of %s failed, requesting it again: %s', url, ex)
+        finally:
+            stream.close()
+
+
+def get_list_params(filter_key, start_date, end_date, stream_name, request_args=None, limit=100):
+    return {
+        'limit': limit,
+        'expand': get_expand_fields(stream_name),
+        filter_key + "[gte]": start_date,
+        filter_key + "[lt]": end_date,
+        **(request_args or {})
+    }
+
+
+async def paginate_async(sdk_obj, filter_key, start_date, end_date, stream_name, request_args=None, limit=100,
+                         raw=False, lazy=False):
+    """
+    Same as `paginate` through the asyncio http engine, returning all the objects of the date window.
+    """
+    return await Context.async_engine.list_all(
+        sdk_obj.class_url(),
+        get_list_params(filter_key, start_date, end_date, stream_name, request_args, limit),
+        raw, lazy)
+
+
+class LazyStripeObject():
+    """
+    A view of an object of a list page decoded as plain JSON, converting into StripeObjects
+    only the fields that are read. The parents of a sub stream synced without them only have
+    their replication key and their child list read.
+    """
+
+    def __init__(self, values):
+        self.values = values
+        self.account_id = Context.get_account_id()
+        self.converted = {}
+
+    def __getitem__(self, key):
+        if key not in self.converted:
+            self.converted[key] = stripe.util.convert_to_stripe_object(self.values[key], stripe.api_key,
+                                                                       stripe.api_version, self.account_id)
+        return self.converted[key]
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def get(self, key, default=None):
+        return self[key] if key in self.values else default
+
+
+def paginate_lazy(sdk_obj, filter_key, start_date, end_date, stream_name, request_args=None, limit=100):
+    """
+    Same as `paginate`, yielding the objects as `LazyStripeObject` views.
+    """
+    requestor = APIRequestor(account=Context.get_account_id())
+    params = get_list_params(filter_key, start_date, end_date, stream_name, request_args, limit)
+    while True:
+        page = request_raw_page(requestor, sdk_obj.class_url(), params, decode=json.loads)
+        yield from (LazyStripeObject(obj) for obj in page['data'])
+        if not page.get('has_more') or not page['data']:
+            return
+        params['starting_after'] = page['data'][-1]['id']
+
+
+def paginate_raw(sdk_obj, filter_key, start_date, end_date, stream_name, request_args=None, limit=100):
+    """
+    Same as `paginate`, yielding the objects as plain dicts decoded by `decode_raw_json`.
+    """
+    requestor = APIRequestor(account=Context.get_account_id())
+    params = get_list_params(filter_key, start_date, end_date, stream_name, request_args, limit)
+    if Context.stream_pages:
+        # `iter_streamed_page` moves `starting_after` along the objects it yields
+        while (yield from iter_streamed_page(requestor, sdk_obj.class_url(), params)):
+            pass
+        return
+    while True:
+        page = request_raw_page(requestor, sdk_obj.class_url(), params)
+        yield from page
+        if not page.has_more or not page:
+            return
+        params['starting_after'] = page[-1]['id']
+
+
 def paginate(sdk_obj, filter_key, start_date, end_date, stream_name, request_args=None, limit=100):
+    stream_plan = Context.get_stream_plan(stream_name)
+    if stream_plan.sub_stream and not stream_plan.selected:
+        # Only the replication key and the child list are read from the parents of a selected sub stream
+        yield from paginate_lazy(sdk_obj, filter_key, start_date, end_date, stream_name, request_args, limit)
+        return
     yield from sdk_obj.list(
         limit=limit,
-        stripe_account=Context.config.get('account_id'),
+        stripe_account=Context.get_account_id(),
         # Some fields are not available by default with latest API version so
         # retrieve it by passing expand paramater in SDK object
-        expand=STREAM_TO_EXPAND_FIELDS.get(stream_name, []),
+        expand=get_expand_fields(stream_name),
         # None passed to starting_after appears to retrieve
         # all of them so this should always be safe.
         **{filter_key + "[gte]": start_date,
            filter_key + "[lt]": end_date},
-        **request_args or {}
+        **(request_args or {})
     ).auto_paging_iter()
 
 
@@ -550,16 +2180,17 @@ def write_bookmark_for_stream(stream_name, replication_key, stream_bookmark):
     # Invoices's replication key changed from `date` to `created` in latest API version.
     # Invoice line Items write bookmark with Invoice's replication key but it changed to `created`
     # so kept `date` in bookmarking for Invoices and Invoice line Items as it has to respect bookmark of active connection too.
-    if stream_name in ['invoices', 'invoice_line_items']:
-        singer.write_bookmark(Context.state,
-                              stream_name,
-                              'date',
-                              stream_bookmark)
-    else:
-        singer.write_bookmark(Context.state,
-                              stream_name,
-                              replication_key,
-                              stream_bookmark)
+    with MESSAGE_LOCK:
+        if stream_name in ['invoices', 'invoice_line_items']:
+            singer.write_bookmark(Context.state,
+                                  stream_name,
+                                  'date',
+                                  stream_bookmark)
+        else:
+            singer.write_bookmark(Context.state,
+                                  stream_name,
+                                  replication_key,
+                                  stream_bookmark)
 
 
 # pylint: disable=too-many-locals
@@ -576,22 +2207,21 @@ def sync_stream(stream_name, is_sub_stream=False):
     """
     LOGGER.info("Started syncing stream %s", stream_name)
 
-    stream_metadata = metadata.to_map(Context.get_catalog_entry(stream_name)['metadata'])
-    stream_field_whitelist = json.loads(Context.config.get('whitelist_map', '{}')).get(stream_name)
+    stream_plan = Context.get_stream_plan(stream_name)
+    stream_metadata = stream_plan.metadata
+    stream_field_whitelist = stream_plan.whitelist
 
     extraction_time = singer.utils.now()
 
     if is_sub_stream:
         # We need to get the parent data first for syncing the child streams. Hence,
         # changing stream_name to parent stream when only child is selected.
-        stream_name = PARENT_STREAM_MAP.get(stream_name)
+        stream_name = stream_plan.parent
+        stream_plan = Context.get_stream_plan(stream_name)
 
-    replication_key = STREAM_REPLICATION_KEY.get(stream_name)
-
-    # Invoice Items bookmarks on `date`, but queries on `created`
-    filter_key = 'created' if stream_name == 'invoice_items' else replication_key
-
-    sub_stream_name = SUB_STREAMS.get(stream_name)
+    replication_key = stream_plan.replication_key
+    filter_key = stream_plan.filter_key
+    sub_stream_name = stream_plan.sub_stream
 
     # Get bookmark for the stream
     stream_bookmark = get_bookmark_for_stream(stream_name, replication_key)
@@ -612,7 +2242,10 @@ def sync_stream(stream_name, is_sub_stream=False):
     else:
         sub_stream_bookmark = None
 
-    with Transformer(singer.UNIX_SECONDS_INTEGER_DATETIME_PARSING) as transformer:
+    with get_transformer() as transformer, \
+            SubStreamFetcher(sub_stream_name, Context.sub_stream_concurrency) as sub_stream_fetcher, \
+            profile_stream(stream_name, stream_name), \
+            PhaseTimer(stream_name) as phase_timer:
         end_time = dt_to_epoch(utils.now())
 
         window_size = Context.window_size
@@ -651,49 +2284,135 @@ def sync_stream(stream_name, is_sub_stream=False):
                 start_window = evaluate_start_time_based_on_lookback(start_window, lookback_window)
             stream_bookmark = start_window
 
+        # The sub streams paginate the lists of the parent objects through the SDK
+        raw_records = Context.raw_json and not should_sync_sub_stream
+
+        # The bookmarks of the streams written by this sync
+        bookmark_keys = [stream_name] if not is_sub_stream else []
+        if should_sync_sub_stream:
+            bookmark_keys.append(sub_stream_name)
+        window_checkpoint = WindowCheckpoint(bookmark_keys, Context.checkpoint_interval, sub_stream_fetcher.drain)
+        checkpoint = window_checkpoint.resume(start_window, end_time)
+
+        empty_range_probe = None
+        if Context.probe_empty_ranges:
+            empty_range_probe = EmptyRangeProbe(stream_name, bookmark_keys[0], filter_key, window_size * 24 * 60 * 60)
+            empty_range_probe.plan(checkpoint['stop'] if checkpoint else start_window, end_time)
+
+        def fetch_window(window_start, window_stop):
+            if is_window_checkpointed(checkpoint, window_start, window_stop) or \
+                    empty_range_probe and empty_range_probe.is_empty(window_start, window_stop):
+                return []
+            return (paginate_raw if raw_records else paginate)(
+                STREAM_SDK_OBJECTS[stream_name]['sdk_object'],
+                filter_key,
+                window_start,
+                window_stop,
+                stream_name,
+                get_checkpoint_request_args(STREAM_SDK_OBJECTS[stream_name].get('request_args'),
+                                            checkpoint, window_start, window_stop)
+            )
+
+        if Context.async_engine:
+            # The windows are not split on timeouts, so a resumed window holds the object of its checkpoint
+            async def fetch_window(window_start, window_stop):  # pylint: disable=function-redefined
+                if empty_range_probe and empty_range_probe.is_empty(window_start, window_stop):
+                    return []
+                return await paginate_async(STREAM_SDK_OBJECTS[stream_name]['sdk_object'],
+                                            filter_key,
+                                            window_start,
+                                            window_stop,
+                                            stream_name=stream_name,
+                                            request_args=get_checkpoint_request_args(
+                                                STREAM_SDK_OBJECTS[stream_name].get('request_args'),
+                                                checkpoint, window_start, window_stop),
+                                            raw=raw_records,
+                                            lazy=is_sub_stream)
+
+        # A window resumed from its checkpoint keeps its bounds, after the lookback before it
+        resumed_windows = []
+        if checkpoint:
+            if start_window < checkpoint['start']:
+                resumed_windows.append((start_window, checkpoint['start']))
+            resumed_windows.append((checkpoint['start'], checkpoint['stop']))
+            start_window = checkpoint['stop']
+
+        windows = iter_date_windows(start_window, end_time, window_size)
+        window_sizer = None
+        if Context.adaptive_window_size:
+            # Size the windows from the density of records of the selected stream
+            window_sizer = AdaptiveWindowSize(sub_stream_name if is_sub_stream else stream_name,
+                                              window_size * 24 * 60 * 60)
+            windows = window_sizer.iter_windows(start_window, end_time)
+            if not Context.async_engine:
+                fetch_window = window_sizer.bisect_on_timeout(fetch_window)
+        windows = itertools.chain(resumed_windows, windows)
+
         # NB: We observed records coming through newest->oldest and so
         # date-windowing was added and the tap only bookmarks after it has
         # gotten through a date window
-        while start_window < end_time:
-            stop_window = dt_to_epoch(epoch_to_dt(start_window) + timedelta(days=window_size))
-            # cut off the last window at the end time
-            stop_window = min(stop_window, end_time)
-            for stream_obj in paginate(
-                    STREAM_SDK_OBJECTS[stream_name]['sdk_object'],
-                    filter_key,
-                    start_window,
-                    stop_window,
-                    stream_name,
-                    STREAM_SDK_OBJECTS[stream_name].get('request_args')
-            ):
+        for window_start, stop_window, stream_objs in fetch_date_windows(
+                windows,
+                fetch_window,
+                Context.window_concurrency,
+                Context.async_engine):
+            window_record_count = 0
+            for stream_obj in stream_objs:
+                window_record_count += 1
+                phase_timer.lap('paginate')
 
                 # get the replication key value from the object
-                rec = unwrap_data_objects(stream_obj.to_dict_recursive())
-                rec = reduce_foreign_keys(rec, stream_name)
+                if is_sub_stream:
+                    # The parent is not written, so it is not converted to a record
+                    rec = {key: stream_obj.get(key) for key in ('id', replication_key, filter_key)}
+                else:
+                    if raw_records:
+                        rec = stream_obj
+                    else:
+                        rec = stream_obj.to_dict_recursive()
+                        phase_timer.lap('to_dict')
+                        rec = unwrap_data_objects(rec)
+                        phase_timer.lap('unwrap')
+                    rec = reduce_foreign_keys(rec, stream_name)
+                    phase_timer.lap('reduce_foreign_keys')
                 stream_obj_created = rec[replication_key]
+                object_id, object_filter_value = rec.get('id'), rec.get(filter_key)
                 rec['updated'] = stream_obj_created
 
                 # sync stream if object is greater than or equal to the bookmark and if parent is selected
                 if stream_obj_created >= stream_bookmark and not is_sub_stream:
                     rec = transformer.transform(rec,
-                                                Context.get_catalog_entry(stream_name)['schema'],
+                                                stream_plan.schema,
                                                 stream_metadata)
+                    phase_timer.lap('transform')
 
                     # At this point, the record has been transformed and so
                     # any de-selected fields have been pruned. Now, prune off
                     # any fields that aren't present in the whitelist.
                     if stream_field_whitelist:
                         rec = apply_whitelist(rec, stream_field_whitelist)
+                        phase_timer.lap('apply_whitelist')
 
-                    singer.write_record(stream_name,
-                                        rec,
-                                        time_extracted=extraction_time)
+                    write_record(stream_name,
+                                 rec,
+                                 time_extracted=extraction_time)
 
-                    Context.new_counts[stream_name] += 1
+                    increment_count(Context.new_counts, stream_name)
+                    phase_timer.lap('write_record')
 
                 # sync sub streams if it is selected and the parent object is greater than its bookmark
                 if should_sync_sub_stream and stream_obj_created > sub_stream_bookmark:
-                    sync_sub_stream(sub_stream_name, stream_obj)
+                    sub_stream_fetcher.submit(stream_obj)
+                    phase_timer.lap('sub_stream')
+
+                window_checkpoint.object_processed(window_start, stop_window, object_id, object_filter_value)
+                phase_timer.lap('state')
+
+            # Every sub stream record of the window is written before the bookmarks
+            phase_timer.lap('paginate')
+            sub_stream_fetcher.drain()
+            phase_timer.lap('sub_stream')
+            window_checkpoint.window_done()
 
             # Update stream bookmark as stop window when parent stream is selected
             if not is_sub_stream and stop_window > stream_bookmark:
@@ -705,12 +2424,346 @@ def sync_stream(stream_name, is_sub_stream=False):
                 sub_stream_bookmark = stop_window
                 write_bookmark_for_stream(sub_stream_name, replication_key, sub_stream_bookmark)
 
-            singer.write_state(Context.state)
+            if window_sizer:
+                window_sizer.record_window(stop_window - window_start, window_record_count)
+
+            write_state()
+            phase_timer.lap('state')
+
+    write_state()
+
+
+def iter_date_windows(start_window, end_time, window_size):
+    """
+    Yields the (start_window, stop_window) pairs of `window_size` days that cover
+    the range from start_window up to end_time.
+    """
+    while start_window < end_time:
+        stop_window = dt_to_epoch(epoch_to_dt(start_window) + timedelta(days=window_size))
+        # cut off the last window at the end time
+        stop_window = min(stop_window, end_time)
+        yield start_window, stop_window
+        # update window for next iteration
+        start_window = stop_window
+
+
+class WindowCheckpoint():
+    """
+    Saves in the state, every `interval` objects of a date window, the window and the last
+    object processed as the `window_checkpoint` of the bookmark keys, so that a sync stopped in
+    the middle of a window resumes after that object instead of fetching the window again.
+    `drain` is called before saving so that nothing up to the object is left unwritten.
+    """
+    def __init__(self, bookmark_keys, interval, drain=None):
+        self.bookmark_keys = bookmark_keys
+        self.interval = interval
+        self.drain = drain
+        self.count = 0
+
+    def resume(self, window_start, end_time):
+        """
+        Returns the checkpoint saved by a previous sync for a window of the range from `window_start`.
+        The checkpoint is dropped before the bookmark moves past its window, so it is the window
+        following the bookmark, even when the range starts a lookback before the bookmark or the
+        bookmark is the last object synced rather than the end of the previous window.
+        """
+        checkpoints = [Context.state.get('bookmarks', {}).get(bookmark_key, {}).get('window_checkpoint')
+                       for bookmark_key in self.bookmark_keys]
+        checkpoint = checkpoints[0]
+        if not checkpoint or checkpoint.get('start', -1) < window_start or checkpoint['stop'] > end_time:
+            return None
+        # A checkpoint only saved for some of the streams, e.g. before a sub stream was selected, is not used
+        if any(other != checkpoint for other in checkpoints[1:]):
+            return None
+        LOGGER.info('Resuming the window %s - %s of %s after %s', checkpoint['start'], checkpoint['stop'],
+                    self.bookmark_keys[0], checkpoint['starting_after'])
+        return checkpoint
+
+    def object_processed(self, window_start, window_stop, object_id, created):
+        if not self.interval:
+            return
+        self.count += 1
+        if self.count % self.interval:
+            return
+        if self.drain:
+            self.drain()
+        checkpoint = {'start': window_start, 'stop': window_stop, 'starting_after': object_id, 'created': created}
+        with MESSAGE_LOCK:
+            for bookmark_key in self.bookmark_keys:
+                singer.write_bookmark(Context.state, bookmark_key, 'window_checkpoint', checkpoint)
+        write_state()
+
+    def window_done(self):
+        """
+        Drops the checkpoint once the window is bookmarked, before the state is written.
+        """
+        self.count = 0
+        with MESSAGE_LOCK:
+            for bookmark_key in self.bookmark_keys:
+                Context.state.get('bookmarks', {}).get(bookmark_key, {}).pop('window_checkpoint', None)
+
+
+def is_window_checkpointed(checkpoint, window_start, window_stop):
+    """
+    Returns whether all the objects of the window, a part of the checkpoint window split on
+    timeouts, were processed before the checkpoint.
+    """
+    return bool(checkpoint) and checkpoint['start'] <= window_start < window_stop <= checkpoint['stop'] \
+        and window_start > checkpoint['created']
+
+
+def get_checkpoint_request_args(request_args, checkpoint, window_start, window_stop):
+    """
+    Returns the request args of a window, paginating after the object of the checkpoint when
+    the window holds it.
+    """
+    if checkpoint and checkpoint['start'] <= window_start <= checkpoint['created'] < window_stop <= checkpoint['stop']:
+        return {**(request_args or {}), 'starting_after': checkpoint['starting_after']}
+    return request_args
+
 
-            # update window for next iteration
+class AdaptiveWindowSize():
+    """
+    Sizes the date windows of a stream from the density of records seen in its previous
+    windows, so that a window holds about `target_records` records. Windows grow when they
+    come back sparse and shrink when they are dense. The density is saved in the state as
+    `records_per_day` of the stream so the next sync starts with well sized windows.
+    """
+    min_window_seconds = 60 * 60  # 1 hour
+    max_window_seconds = 365 * 24 * 60 * 60  # 1 year
+    max_growth = 4  # A window is at most 4 times larger than the previous one
+
+    def __init__(self, bookmark_stream, window_seconds, target_records=None, max_window_seconds=None):
+        self.bookmark_stream = bookmark_stream
+        self.max_window_seconds = max_window_seconds or self.max_window_seconds
+        self.window_seconds = int(window_seconds)
+        self.target_records = target_records or Context.target_window_records
+        self.records_per_day = singer.get_bookmark(Context.state, bookmark_stream, 'records_per_day')
+        if self.records_per_day is not None:
+            self.window_seconds = self.fit_window_seconds(self.max_window_seconds)
+            LOGGER.info('Starting %s with date windows of %.2f days for %.2f records per day',
+                        bookmark_stream, self.window_seconds / 86400, self.records_per_day)
+
+    def fit_window_seconds(self, max_window_seconds):
+        if self.records_per_day:
+            window_seconds = self.target_records / self.records_per_day * 86400
+        else:
+            window_seconds = max_window_seconds
+        return int(max(self.min_window_seconds, min(window_seconds, max_window_seconds, self.max_window_seconds)))
+
+    def iter_windows(self, start_window, end_time):
+        """
+        Yields the (start_window, stop_window) pairs covering the range from start_window up to
+        end_time, sizing each window when it is requested.
+        """
+        while start_window < end_time:
+            stop_window = min(start_window + self.window_seconds, end_time)
+            yield start_window, stop_window
             start_window = stop_window
 
-    singer.write_state(Context.state)
+    def record_window(self, window_seconds, record_count):
+        """
+        Update the density of records from a synced window and size the next windows.
+        """
+        if window_seconds <= 0:
+            return
+        window_density = record_count * 86400 / window_seconds
+        if self.records_per_day is None:
+            self.records_per_day = window_density
+        else:
+            # Smooth the density so that a single odd window does not swing the window size
+            self.records_per_day = (self.records_per_day + window_density) / 2
+        self.window_seconds = self.fit_window_seconds(self.window_seconds * self.max_growth)
+        with MESSAGE_LOCK:
+            singer.write_bookmark(Context.state, self.bookmark_stream, 'records_per_day',
+                                  round(self.records_per_day, 3))
+
+    def bisect_on_timeout(self, fetch_window):
+        """
+        Wraps `fetch_window` so that a window whose requests keep timing out is split in two
+        halves that are fetched one after another. The objects already fetched from the
+        window are not returned again. The requests of a window that can still be split are
+        not retried on network errors, so it is split at the first timeout.
+        """
+        def call_bisecting(bisecting, function, *args):
+            token = BISECTING_WINDOW.set(bisecting)
+            try:
+                return function(*args)
+            finally:
+                BISECTING_WINDOW.reset(token)
+
+        def fetch_window_bisecting(window_start, window_stop, fetched_ids=None):
+            fetched_ids = set() if fetched_ids is None else fetched_ids
+            bisecting = window_stop - window_start > self.min_window_seconds
+            try:
+                stream_objs = iter(call_bisecting(bisecting, fetch_window, window_start, window_stop))
+                stream_obj = call_bisecting(bisecting, next, stream_objs, None)
+                while stream_obj is not None:
+                    if stream_obj.get('id') not in fetched_ids:
+                        fetched_ids.add(stream_obj.get('id'))
+                        yield stream_obj
+                    stream_obj = call_bisecting(bisecting, next, stream_objs, None)
+            except stripe.error.APIConnectionError:
+                if not bisecting:
+                    raise
+                middle = window_start + (window_stop - window_start) // 2
+                # Smaller windows for the rest of the sync as well
+                self.window_seconds = max(self.min_window_seconds, self.window_seconds // 2)
+                LOGGER.warning('Request timed out for the %s window %d - %d, splitting it at %d',
+                               self.bookmark_stream, window_start, window_stop, middle)
+                yield from fetch_window_bisecting(middle, window_stop, fetched_ids)
+                yield from fetch_window_bisecting(window_start, middle, fetched_ids)
+
+        return fetch_window_bisecting
+
+
+class EmptyRangeProbe():  # pylint: disable=too-many-instance-attributes
+    """
+    Finds the ranges of created times holding objects of a stream with `limit=1` list requests,
+    so that the date windows outside of them are bookmarked without being requested. A probe
+    returns the newest object of its range, so nothing was created after it, and the range up
+    to it is bisected until it is no larger than `min_range_seconds`. The populated ranges are
+    saved in the state as `probed_ranges` of the bookmark stream, so that a sync resumed within
+    them only probes the range created since.
+    """
+
+    def __init__(self, stream_name, bookmark_stream, filter_key, min_range_seconds):
+        self.stream_name = stream_name
+        self.bookmark_stream = bookmark_stream
+        self.filter_key = filter_key
+        self.min_range_seconds = int(min_range_seconds)
+        self.start = self.stop = None
+        self.populated = []
+        self.probe_count = 0
+
+    def get_newest(self, start, stop):
+        """
+        Returns the created time of the newest object of the range, or None when it is empty.
+        """
+        self.probe_count += 1
+        params = {'limit': 1, self.filter_key + '[gte]': start, self.filter_key + '[lt]': stop,
+                  **(STREAM_SDK_OBJECTS[self.stream_name].get('request_args') or {})}
+        page = request_raw_page(APIRequestor(account=Context.get_account_id()),
+                                STREAM_SDK_OBJECTS[self.stream_name]['sdk_object'].class_url(), params)
+        return page[0][self.filter_key] if page else None
+
+    def probe(self, start, stop, newest=None):
+        """
+        Returns the populated ranges of the range, its newest object being given when known.
+        """
+        if newest is None:
+            newest = self.get_newest(start, stop) if start < stop else None
+            if newest is None:
+                return []
+        stop = newest + 1
+        if stop - start <= self.min_range_seconds:
+            return [[start, stop]]
+        middle = (start + stop) // 2
+        return self.probe(start, middle) + self.probe(middle, stop, newest)
+
+    def plan(self, start, stop):
+        """
+        Probe the range from start to stop, reusing the populated ranges saved by a previous sync.
+        """
+        self.start, self.stop = start, stop
+        if stop - start <= self.min_range_seconds:
+            # A single window is requested anyway, the ranges probed by a previous sync are behind
+            self.populated = [[start, stop]]
+            with MESSAGE_LOCK:
+                Context.state.get('bookmarks', {}).get(self.bookmark_stream, {}).pop('probed_ranges', None)
+            return
+        probed = singer.get_bookmark(Context.state, self.bookmark_stream, 'probed_ranges')
+        if probed and probed['start'] <= start < probed['stop'] <= stop:
+            populated = [[max(range_start, start), range_stop]
+                         for range_start, range_stop in probed['populated'] if range_stop > start]
+            populated.extend(self.probe(probed['stop'], stop))
+        else:
+            populated = self.probe(start, stop)
+
+        # Merge the adjacent ranges
+        self.populated = []
+        for range_start, range_stop in populated:
+            if self.populated and range_start <= self.populated[-1][1]:
+                self.populated[-1][1] = max(self.populated[-1][1], range_stop)
+            else:
+                self.populated.append([range_start, range_stop])
+        LOGGER.info('Probed %s with %d requests: %d populated ranges, skipping %.1f of %.1f days',
+                    self.stream_name, self.probe_count, len(self.populated),
+                    (stop - start - sum(range_stop - range_start for range_start, range_stop in self.populated))
+                    / 86400, (stop - start) / 86400)
+
+        # The objects created just before the end of the range may not be listed yet
+        probed_stop = max(start, stop - IMMUTABLE_STREAM_LOOKBACK)
+        with MESSAGE_LOCK:
+            singer.write_bookmark(Context.state, self.bookmark_stream, 'probed_ranges', {
+                'start': start,
+                'stop': probed_stop,
+                'populated': [[range_start, min(range_stop, probed_stop)]
+                              for range_start, range_stop in self.populated if range_start < probed_stop]})
+
+    def is_empty(self, window_start, window_stop):
+        """
+        Returns whether the window is within the probed range and holds no object.
+        """
+        if self.start is None or window_start < self.start or window_stop > self.stop:
+            return False
+        return not any(range_start < window_stop and window_start < range_stop
+                       for range_start, range_stop in self.populated)
+
+
+def submit_in_context(executor, fn, *args):
+    """
+    Submit a function to a pool of threads, to run with the context of the caller, such as
+    the connected account it syncs.
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def fetch_date_windows(windows, fetch_window, concurrency=DEFAULT_WINDOW_CONCURRENCY, executor=None):
+    """
+    Yields (start_window, stop_window, stream_objs) for every window, in window order.
+    With a concurrency of 1 the objects of a window are paginated lazily by the caller.
+    Otherwise up to `concurrency` windows are fetched ahead by a pool of workers while
+    the caller consumes the oldest one, so records and bookmarks are still committed
+    in window order. When an executor such as the asyncio engine is given, it runs
+    `fetch_window` itself instead of a pool of workers.
+    """
+    if concurrency <= 1 and executor is None:
+        for start_window, stop_window in windows:
+            yield start_window, stop_window, fetch_window(start_window, stop_window)
+        return
+
+    def fetch_all(window_start, window_stop):
+        return list(fetch_window(window_start, window_stop))
+
+    if executor is None:
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+        submit = functools.partial(submit_in_context, pool, fetch_all)
+    else:
+        pool = None
+        submit = functools.partial(executor.submit, fetch_window)
+
+    windows = iter(windows)
+    pending = deque()
+    try:
+        for start_window, stop_window in windows:
+            pending.append((start_window, stop_window, submit(start_window, stop_window)))
+            if len(pending) >= concurrency:
+                break
+
+        while pending:
+            start_window, stop_window, future = pending.popleft()
+            stream_objs = future.result()
+            # Keep the pool busy with the next window while this one is processed
+            next_window = next(windows, None)
+            if next_window:
+                pending.append((*next_window, submit(*next_window)))
+            yield start_window, stop_window, stream_objs
+    finally:
+        for _, _, future in pending:
+            future.cancel()
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
 
 
 def get_object_list_iterator(object_list):
@@ -740,6 +2793,21 @@ def get_object_list_iterator(object_list):
 INITIAL_SUB_STREAM_OBJECT_LIST_LENGTH = 10
 
 
+def fetch_object_list_async(object_list, max_objects=None):
+    """
+    Returns the objects of a list embedded in a parent object, its next pages fetched by the asyncio engine.
+    """
+    objects = list(object_list.data)
+    if object_list.get('has_more') and object_list.get('url') and objects:
+        objects.extend(Context.async_engine.run(Context.async_engine.list_all,
+                                                object_list.url,
+                                                {'limit': 100, 'starting_after': objects[-1].id},
+                                                False,
+                                                False,
+                                                max_objects))
+    return objects
+
+
 def is_parent_selected(sub_stream_name):
     """
     Given a child stream, check if the parent is selected.
@@ -753,7 +2821,94 @@ def sync_sub_stream(sub_stream_name, parent_obj, updates=False):
     Given a parent object, retrieve its values for the specified substream.
     """
     extraction_time = singer.utils.now()
+    with PhaseTimer(sub_stream_name):
+        write_sub_stream_records(sub_stream_name,
+                                 iter_sub_stream_records(sub_stream_name, parent_obj, updates),
+                                 extraction_time,
+                                 updates)
 
+
+def fetch_sub_stream_records(sub_stream_name, parent_obj, updates=False):
+    """
+    Returns the extraction time and all the records of the sub stream of a parent object.
+    """
+    extraction_time = singer.utils.now()
+    with PhaseTimer(sub_stream_name):
+        return extraction_time, list(iter_sub_stream_records(sub_stream_name, parent_obj, updates))
+
+
+def write_sub_stream_records(sub_stream_name, records, extraction_time, updates=False):
+    phase_timer = PhaseTimer.current()
+    for rec in records:
+        # NB: Older structures (such as invoice_line_items) may not have had their ID present.
+        #     Skip these if they don't match the structure we expect.
+        if "id" in rec:
+            write_record(sub_stream_name,
+                         rec,
+                         time_extracted=extraction_time)
+        if updates:
+            increment_count(Context.updated_counts, sub_stream_name)
+        else:
+            increment_count(Context.new_counts, sub_stream_name)
+        phase_timer.lap('write_record')
+
+
+class SubStreamFetcher():
+    """
+    Syncs the sub stream of the parent objects. With a concurrency above 1, the records are
+    fetched on a bounded pool of threads while the parent stream keeps paginating, and are
+    written in the order of the parents by the thread that submits them, once `concurrency`
+    parents are ahead of them or when `drain` is called. Drain before writing the sub stream
+    bookmark so that it never moves past records that are not written yet.
+    """
+    def __init__(self, sub_stream_name, concurrency=1, updates=False):
+        self.sub_stream_name = sub_stream_name
+        self.concurrency = concurrency
+        self.updates = updates
+        self.pending = deque()
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        for future in self.pending:
+            future.cancel()
+        if self.pool:
+            self.pool.shutdown(wait=True)
+
+    def submit(self, parent_obj):
+        if self.concurrency <= 1:
+            sync_sub_stream(self.sub_stream_name, parent_obj, updates=self.updates)
+            return
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.concurrency,
+                                           thread_name_prefix='tap-stripe-' + self.sub_stream_name)
+        self.pending.append(submit_in_context(self.pool,
+                                              fetch_sub_stream_records,
+                                              self.sub_stream_name,
+                                              parent_obj,
+                                              self.updates))
+        while len(self.pending) > self.concurrency:
+            self.write_next()
+
+    def write_next(self):
+        extraction_time, records = self.pending.popleft().result()
+        with PhaseTimer(self.sub_stream_name):
+            write_sub_stream_records(self.sub_stream_name, records, extraction_time, self.updates)
+
+    def drain(self):
+        """
+        Write the records of all the submitted parents.
+        """
+        while self.pending:
+            self.write_next()
+
+
+def iter_sub_stream_records(sub_stream_name, parent_obj, updates=False):
+    """
+    Yields the transformed records of the sub stream of a parent object.
+    """
     if sub_stream_name == "invoice_line_items":
         object_list = parent_obj.lines
     elif sub_stream_name == "transfer_reversals":
@@ -763,10 +2918,14 @@ def sync_sub_stream(sub_stream_name, parent_obj, updates=False):
         object_list = parent_obj.get("items")
     elif sub_stream_name == "payout_transactions":
         payout_id = parent_obj['id']
-        acct_id = Context.config.get('account_id')
+        acct_id = Context.get_account_id()
         # Balance transaction history with a payout id param
         # provides the link of transactions to payouts
-        if 'automatic' in parent_obj and parent_obj['automatic']:
+        if 'automatic' in parent_obj and parent_obj['automatic'] and Context.async_engine:
+            object_list = Context.async_engine.run(Context.async_engine.list_all,
+                                                   stripe.BalanceTransaction.class_url(),
+                                                   {'limit': 100, 'payout': payout_id})
+        elif 'automatic' in parent_obj and parent_obj['automatic']:
             object_list = stripe.BalanceTransaction.list(limit=100,
                                                          stripe_account=acct_id,
                                                          payout=payout_id)
@@ -810,9 +2969,17 @@ def sync_sub_stream(sub_stream_name, parent_obj, updates=False):
             "has no total_count attribute or is not "
             "invoice_line_items substream."))
 
-    with Transformer(singer.UNIX_SECONDS_INTEGER_DATETIME_PARSING) as transformer:
+    if Context.async_engine and isinstance(object_list, ListObject):
+        # Past the cycle detection, the pages of a list stuck in a cycle are not fetched
+        object_list = fetch_object_list_async(
+            object_list, expected_count and expected_count + INITIAL_SUB_STREAM_OBJECT_LIST_LENGTH)
+
+    sub_stream_plan = Context.get_stream_plan(sub_stream_name)
+    phase_timer = PhaseTimer.current()
+    with get_transformer() as transformer:
         iterator = get_object_list_iterator(object_list)
         for sub_stream_obj in iterator:
+            phase_timer.lap('paginate')
             if expected_count:
                 substream_count += 1
                 if (expected_count + INITIAL_SUB_STREAM_OBJECT_LIST_LENGTH) < substream_count:
@@ -832,6 +2999,7 @@ def sync_sub_stream(sub_stream_name, parent_obj, updates=False):
                     ).format(stripe.api_version,
                              parent_obj.id))
             obj_ad_dict = sub_stream_obj.to_dict_recursive()
+            phase_timer.lap('to_dict')
 
             if sub_stream_name == "invoice_line_items":
                 # we will get "unique_id" for default API versions older than "2019-12-03"
@@ -876,21 +3044,13 @@ def sync_sub_stream(sub_stream_name, parent_obj, updates=False):
                 # payout_transactions is a join table
                 obj_ad_dict = {"id": obj_ad_dict['id'], "payout_id": parent_obj['id']}
 
-            rec = transformer.transform(unwrap_data_objects(obj_ad_dict),
-                                        Context.get_catalog_entry(sub_stream_name)['schema'],
-                                        metadata.to_map(
-                                            Context.get_catalog_entry(sub_stream_name)['metadata']
-            ))
-            # NB: Older structures (such as invoice_line_items) may not have had their ID present.
-            #     Skip these if they don't match the structure we expect.
-            if "id" in rec:
-                singer.write_record(sub_stream_name,
-                                    rec,
-                                    time_extracted=extraction_time)
-            if updates:
-                Context.updated_counts[sub_stream_name] += 1
-            else:
-                Context.new_counts[sub_stream_name] += 1
+            obj_ad_dict = unwrap_data_objects(obj_ad_dict)
+            phase_timer.lap('unwrap')
+            rec = transformer.transform(obj_ad_dict,
+                                        sub_stream_plan.schema,
+                                        sub_stream_plan.metadata)
+            phase_timer.lap('transform')
+            yield rec
 
 
 def should_sync_event(events_obj, object_type, id_to_created_map):
@@ -915,6 +3075,218 @@ def should_sync_event(events_obj, object_type, id_to_created_map):
     return should_sync
 
 
+class EventDedupIndex():
+    """
+    Maps the ids of the objects seen by an event updates scan to the created time of their
+    latest event, like a dict, in 16 bytes per slot: the 64 bit hashes of the ids and the
+    times are kept in two arrays of an open addressing table rather than as Python objects.
+    Past `max_memory_bytes`, the table is spilled to a SQLite file in a temporary directory
+    and emptied, the ids missing from memory are then looked up on disk.
+    """
+    initial_capacity = 1024
+    max_load = 0.66
+
+    def __init__(self, max_memory_bytes=None):
+        self.max_memory_bytes = max_memory_bytes
+        self.keys = array('q', [0]) * self.initial_capacity
+        self.values = array('q', [0]) * self.initial_capacity
+        self.size = 0
+        self.spilled = 0
+        self.store = None
+        self.finalizer = None
+
+    @staticmethod
+    def hash_id(object_id):
+        # 0 marks the empty slots
+        return hash(object_id) or 1
+
+    def find_slot(self, key):
+        mask = len(self.keys) - 1
+        slot = key & mask
+        while self.keys[slot] and self.keys[slot] != key:
+            slot = (slot + 1) & mask
+        return slot
+
+    def get(self, object_id, default=None):
+        key = self.hash_id(object_id)
+        slot = self.find_slot(key)
+        if self.keys[slot]:
+            return self.values[slot]
+        if self.store:
+            row = self.store.execute('SELECT created FROM objects WHERE key = ?', (key,)).fetchone()
+            if row:
+                return row[0]
+        return default
+
+    def __setitem__(self, object_id, created):
+        key = self.hash_id(object_id)
+        slot = self.find_slot(key)
+        if not self.keys[slot]:
+            self.keys[slot] = key
+            self.size += 1
+        self.values[slot] = created
+        if self.size > len(self.keys) * self.max_load:
+            if self.max_memory_bytes and self.memory_bytes() * 2 > self.max_memory_bytes:
+                self.spill()
+            else:
+                self.resize(len(self.keys) * 2)
+
+    def __len__(self):
+        return self.size + self.spilled
+
+    def resize(self, capacity):
+        keys, values = self.keys, self.values
+        self.keys = array('q', [0]) * capacity
+        self.values = array('q', [0]) * capacity
+        for key, value in zip(keys, values):
+            if key:
+                slot = self.find_slot(key)
+                self.keys[slot] = key
+                self.values[slot] = value
+
+    def spill(self):
+        """
+        Move the ids in memory to the SQLite file.
+        """
+        if self.store is None:
+            store_dir = tempfile.mkdtemp(prefix='tap-stripe-events-')
+            self.store = sqlite3.connect(os.path.join(store_dir, 'index.db'), check_same_thread=False)
+            self.store.execute('CREATE TABLE objects (key INTEGER PRIMARY KEY, created INTEGER)')
+            self.finalizer = weakref.finalize(self, close_event_dedup_store, self.store, store_dir)
+            LOGGER.info('Spilling the index of the event updates to %s', store_dir)
+        self.store.executemany('INSERT OR REPLACE INTO objects VALUES (?, ?)',
+                               ((key, value) for key, value in zip(self.keys, self.values) if key))
+        self.store.commit()
+        self.spilled = self.store.execute('SELECT COUNT(*) FROM objects').fetchone()[0]
+        self.keys = array('q', [0]) * self.initial_capacity
+        self.values = array('q', [0]) * self.initial_capacity
+        self.size = 0
+
+    def memory_bytes(self):
+        return self.keys.buffer_info()[1] * self.keys.itemsize + self.values.buffer_info()[1] * self.values.itemsize
+
+    def log_metrics(self, stream_name):
+        """
+        Report the number of ids and the memory footprint of the index of the event updates of the stream.
+        """
+        metrics.log(LOGGER, metrics.Point('gauge', 'event_dedup_index_bytes', self.memory_bytes(),
+                                          {'stream': stream_name, 'ids': len(self), 'spilled_ids': self.spilled}))
+
+    def close(self):
+        if self.finalizer:
+            self.finalizer()
+
+
+def close_event_dedup_store(store, store_dir):
+    store.close()
+    shutil.rmtree(store_dir, ignore_errors=True)
+
+
+class EventsStore():
+    """
+    Keeps the events of all types in a SQLite file shared by the event updates passes of the
+    streams and across runs. The range of created times fetched from Stripe is kept for every
+    account, so a pass only requests the events missing from the store before reading the
+    events of its type from the store, newest first as the events endpoint lists them.
+    """
+    page_size = 100
+    retention_seconds = 30 * 24 * 60 * 60  # Stripe keeps the events of the last 30 days
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.fill_locks = {}
+        with self.lock:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS events (account TEXT, id TEXT, created INTEGER, type TEXT, body TEXT,
+                                                   PRIMARY KEY (account, id));
+                CREATE INDEX IF NOT EXISTS events_created ON events (account, created, id);
+                CREATE TABLE IF NOT EXISTS coverage (account TEXT PRIMARY KEY, start INTEGER, stop INTEGER);
+            """)
+
+    def get_coverage(self, account_id):
+        with self.lock:
+            return self.connection.execute('SELECT start, stop FROM coverage WHERE account = ?',
+                                           (account_id,)).fetchone()
+
+    def fill(self, start, now):
+        """
+        Fetch the events created from start until now that are missing from the store.
+        """
+        account_id = Context.get_account_id() or ''
+        cutoff = now - self.retention_seconds
+        start = max(start, cutoff)
+        with self.lock:
+            fill_lock = self.fill_locks.setdefault(account_id, threading.Lock())
+        # The passes of the account running at the same time wait for the one filling the store
+        with fill_lock:
+            coverage = self.get_coverage(account_id)
+            missing = []
+            if coverage is None:
+                missing.append((start, now))
+            else:
+                if start < coverage[0]:
+                    missing.append((start, coverage[0]))
+                missing.append((coverage[1], now))
+                start = min(start, coverage[0])
+            for missing_start, missing_stop in missing:
+                if missing_start < missing_stop:
+                    LOGGER.info('Fetching the events from %s to %s into the events store',
+                                epoch_to_dt(missing_start), epoch_to_dt(missing_stop))
+                    self.fetch(account_id, missing_start, missing_stop)
+
+            # The events created just before now may not be listed yet, they are fetched again next time
+            with self.lock:
+                self.connection.execute('DELETE FROM events WHERE account = ? AND created < ?', (account_id, cutoff))
+                self.connection.execute('INSERT OR REPLACE INTO coverage VALUES (?, ?, ?)',
+                                        (account_id, max(start, cutoff), now - IMMUTABLE_STREAM_LOOKBACK))
+                self.connection.commit()
+
+    def fetch(self, account_id, start, stop):
+        requestor = APIRequestor(account=account_id or None)
+        params = {'limit': self.page_size, 'created[gte]': start, 'created[lt]': stop}
+        while True:
+            page = request_raw_page(requestor, stripe.Event.class_url(), params, decode=json.loads)
+            with self.lock:
+                self.connection.executemany('INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?)',
+                                            ((account_id, event['id'], event['created'], event['type'],
+                                              json.dumps(event))
+                                             for event in page['data']))
+                self.connection.commit()
+            if not page.get('has_more') or not page['data']:
+                return
+            params['starting_after'] = page['data'][-1]['id']
+
+    def iter_events(self, start, stop, type_filter=None):
+        """
+        Yields the events of the type filter created between start and stop as StripeObjects, newest first.
+        """
+        account_id = Context.get_account_id()
+        created, event_id = stop, ''
+        while True:
+            with self.lock:
+                rows = self.connection.execute(
+                    'SELECT id, created, body FROM events WHERE account = ? AND type GLOB ? AND created >= ? '
+                    'AND (created < ? OR created = ? AND id < ?) ORDER BY created DESC, id DESC LIMIT ?',
+                    (account_id or '', type_filter or '*', start, created, created, event_id, self.page_size)
+                ).fetchall()
+            for event_id, created, body in rows:
+                yield stripe.util.convert_to_stripe_object(json.loads(body), stripe.api_key, stripe.api_version,
+                                                           account_id)
+            if len(rows) < self.page_size:
+                return
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def get_event_dedup_index():
+    memory_limit = Context.config.get('event_dedup_memory_limit')
+    return EventDedupIndex(int(float(memory_limit) * 1024 * 1024) if memory_limit else None)
+
+
 def recursive_to_dict(some_obj):
     if isinstance(some_obj, stripe.stripe_object.StripeObject):
         return recursive_to_dict(dict(some_obj))
@@ -929,29 +3301,12 @@ def recursive_to_dict(some_obj):
     return some_obj
 
 
-def sync_event_updates(stream_name, is_sub_stream):
-    '''
-    Get updates via events endpoint
-    look at 'events update' bookmark and pull events after that
-    :param
-    stream_name - Name of the stream
-    is_sub_stream - Check whether the function is called via the parent stream(only parent/both are selected)
-                    or when called through only child stream i.e. when parent is not selected.
-    '''
-    LOGGER.info("Started syncing event based updates")
+def get_bookmark_for_event_updates(stream_name, sub_stream_name, is_sub_stream, start_date):
+    """
+    Returns the event updates bookmark of the parent and/or child stream that are selected
+    and whether the bookmark of the parent or child stream has to be reset to the start date.
+    """
     reset_brk_flag_value = False
-    event_update_window_size = Context.event_update_window_size
-    events_update_date_window_size = int(60 * 60 * 24 * event_update_window_size) # event_update_window_size in seconds
-    sync_start_time = dt_to_epoch(utils.now())
-    start_date = int(utils.strptime_to_utc(Context.config["start_date"]).timestamp())
-
-    if is_sub_stream:
-        # We need to get the parent data first for syncing the child streams. Hence,
-        # changing stream_name to parent stream when only child is selected.
-        stream_name = PARENT_STREAM_MAP.get(stream_name)
-
-    sub_stream_name = SUB_STREAMS.get(stream_name)
-
     parent_bookmark_value = singer.get_bookmark(Context.state,
                                                 stream_name + '_events',
                                                 'updates_created') or start_date
@@ -976,6 +3331,37 @@ def sync_event_updates(stream_name, is_sub_stream):
     else:
         bookmark_value = parent_bookmark_value
 
+    return bookmark_value, reset_brk_flag_value
+
+
+def is_event_updates_bookmark_expired(stream_name, is_sub_stream):
+    """
+    Checks whether `sync_event_updates` will reset the bookmarks of the stream because its
+    event updates bookmark is older than the 30 days of events returned by Stripe.
+    """
+    start_date = int(utils.strptime_to_utc(Context.config["start_date"]).timestamp())
+    if is_sub_stream:
+        stream_name = PARENT_STREAM_MAP.get(stream_name)
+
+    bookmark_value, reset_brk_flag_value = get_bookmark_for_event_updates(stream_name,
+                                                                          SUB_STREAMS.get(stream_name),
+                                                                          is_sub_stream,
+                                                                          start_date)
+    max_event_start_date = (utils.now() - timedelta(days=30)).timestamp()
+    return max_event_start_date > bookmark_value and (bookmark_value != start_date or reset_brk_flag_value)
+
+
+def get_event_updates_start(stream_name, sub_stream_name, is_sub_stream, sync_start_time, start_date):
+    """
+    Returns the event updates bookmark of the stream and the time to start the event scan from.
+    Resets the bookmarks of the stream and raises an exception when the bookmark is older than
+    the 30 days of events returned by Stripe.
+    """
+    bookmark_value, reset_brk_flag_value = get_bookmark_for_event_updates(stream_name,
+                                                                          sub_stream_name,
+                                                                          is_sub_stream,
+                                                                          start_date)
+
     # Start sync for event updates record from the last 30 days before if bookmark/start_date is older than 30 days.
     max_event_start_date = (epoch_to_dt(sync_start_time) - timedelta(days=30)).timestamp()
     max_created = int(max(bookmark_value, max_event_start_date))
@@ -985,96 +3371,246 @@ def sync_event_updates(stream_name, is_sub_stream):
         raise Exception("Provided current bookmark date for event updates is older than 30 days."\
             " Hence, resetting the bookmark date of respective {}/{} stream to start date.".format(stream_name, sub_stream_name))
 
-    date_window_start = max_created
-    date_window_end = max_created + events_update_date_window_size
-    stop_paging = False
+    return bookmark_value, max_created
 
-    # Create a map to hold relate event object ids to timestamps
-    updated_object_timestamps = {}
 
+def sync_event_update(events_obj, stream_name, is_sub_stream, bookmark_value,
+                      updated_object_timestamps, extraction_time, sub_stream_fetcher=None):
+    """
+    Write the object of an event as an update of the stream and/or its selected sub stream,
+    through the `sub_stream_fetcher` when given.
+    """
+    sub_stream_name = SUB_STREAMS.get(stream_name)
+    event_resource_obj = events_obj.data.object
+    phase_timer = PhaseTimer.current()
+
+    # Check whether we should sync the event based on its created time
+    should_sync = should_sync_event(events_obj,
+                                    STREAM_TO_TYPE_FILTER[stream_name]['object'],
+                                    updated_object_timestamps)
+    phase_timer.lap('dedup')
+    if not should_sync:
+        return
+
+    # Syncing an event as its the first time we've seen it or its the most recent version
+    stream_plan = Context.get_stream_plan(stream_name)
+    with get_transformer() as transformer:
+
+        # Filter out line items with null ids
+        if isinstance(events_obj.get('data').get('object'), stripe.Invoice):
+            invoice_obj = events_obj.get('data', {}).get('object', {})
+            line_items = invoice_obj.get('lines', {}).get('data')
+
+            if line_items:
+                filtered_line_items = [line_item for line_item in line_items
+                                       if line_item.get('id')]
+
+                invoice_obj['lines']['data'] = filtered_line_items
+
+        rec = recursive_to_dict(event_resource_obj)
+        phase_timer.lap('to_dict')
+        rec = unwrap_data_objects(rec)
+        phase_timer.lap('unwrap')
+        rec = reduce_foreign_keys(rec, stream_name)
+        phase_timer.lap('reduce_foreign_keys')
+        rec["updated"] = events_obj.created
+        rec["updated_by_event_type"] = events_obj.type
+        rec = transformer.transform(
+            rec,
+            stream_plan.schema,
+            stream_plan.metadata
+        )
+        phase_timer.lap('transform')
+
+        if events_obj.created >= bookmark_value:
+            if rec.get('id') is not None:
+                # Write parent records only when the parent is selected
+                if not is_sub_stream:
+                    write_record(stream_name,
+                                 rec,
+                                 time_extracted=extraction_time)
+                    increment_count(Context.updated_counts, stream_name)
+                    phase_timer.lap('write_record')
+
+                # Delete events should be synced but not their subobjects
+                if events_obj.get('type', '').endswith('.deleted'):
+                    return
+
+                # Write child stream records only when the child stream is selected
+                if sub_stream_name and Context.is_selected(sub_stream_name):
+                    if event_resource_obj and sub_stream_fetcher:
+                        sub_stream_fetcher.submit(event_resource_obj)
+                    elif event_resource_obj:
+                        sync_sub_stream(sub_stream_name,
+                                        event_resource_obj,
+                                        updates=True)
+                    phase_timer.lap('sub_stream')
+
+
+def fetch_event_windows(date_window_start, window_seconds, request_args, window_sizer=None, first_window_end=None):
+    """
+    Yields (date_window_end, extraction_time, events) for the windows of `window_seconds`
+    from date_window_start until the current time, with the events of the given request
+    args created in each window. With the asyncio engine the windows are fetched ahead
+    concurrently, otherwise each window is paginated by the caller and sized by the
+    `window_sizer` when given. The first window ends at `first_window_end` when given.
+    """
+    if Context.events_store:
+        now = dt_to_epoch(singer.utils.now())
+        Context.events_store.fill(date_window_start, now)
+        while date_window_start < now:
+            if window_sizer:
+                window_seconds = window_sizer.window_seconds
+            date_window_end = first_window_end or date_window_start + window_seconds
+            first_window_end = None
+            yield date_window_end, singer.utils.now(), Context.events_store.iter_events(date_window_start,
+                                                                                       date_window_end,
+                                                                                       request_args.get('type'))
+            date_window_start = date_window_end
+        return
+
+    if Context.async_engine:
+        now = dt_to_epoch(singer.utils.now())
+        windows = []
+        while date_window_start < now:
+            date_window_end = first_window_end or date_window_start + window_seconds
+            first_window_end = None
+            windows.append((date_window_start, date_window_end))
+            date_window_start = date_window_end
+        fetch_window = functools.partial(paginate_async, STREAM_SDK_OBJECTS['events']['sdk_object'],
+                                         'created', stream_name='events', request_args=request_args)
+        for _, date_window_end, events in fetch_date_windows(windows, fetch_window,
+                                                             Context.window_concurrency,
+                                                             Context.async_engine):
+            yield date_window_end, singer.utils.now(), events
+        return
+
+    stop_paging = False
     while not stop_paging:
         extraction_time = singer.utils.now()
+        if window_sizer:
+            window_seconds = window_sizer.window_seconds
+        date_window_end = first_window_end or date_window_start + window_seconds
+        first_window_end = None
 
         response = STREAM_SDK_OBJECTS['events']['sdk_object'].list(**{
             "limit": 100,
-            "type": STREAM_TO_TYPE_FILTER[stream_name]['type'],
-            "stripe_account": Context.config.get('account_id'),
+            "stripe_account": Context.get_account_id(),
             # None passed to starting_after appears to retrieve
             # all of them so this should always be safe.
             "created[gte]": date_window_start,
             "created[lt]": date_window_end,
+            **request_args
         })
 
         # If no results, and we are not up to current time
         if not len(response) and date_window_end > extraction_time.timestamp():  # pylint: disable=len-as-condition
             stop_paging = True
 
-        for events_obj in response.auto_paging_iter():
-            event_resource_obj = events_obj.data.object
-
-            # Check whether we should sync the event based on its created time
-            if not should_sync_event(events_obj,
-                                     STREAM_TO_TYPE_FILTER[stream_name]['object'],
-                                     updated_object_timestamps):
-                continue
-
-            # Syncing an event as its the first time we've seen it or its the most recent version
-            with Transformer(singer.UNIX_SECONDS_INTEGER_DATETIME_PARSING) as transformer:
-                event_resource_metadata = metadata.to_map(
-                    Context.get_catalog_entry(stream_name)['metadata']
-                )
-
-                # Filter out line items with null ids
-                if isinstance(events_obj.get('data').get('object'), stripe.Invoice):
-                    invoice_obj = events_obj.get('data', {}).get('object', {})
-                    line_items = invoice_obj.get('lines', {}).get('data')
-
-                    if line_items:
-                        filtered_line_items = [line_item for line_item in line_items
-                                               if line_item.get('id')]
-
-                        invoice_obj['lines']['data'] = filtered_line_items
-
-                rec = recursive_to_dict(event_resource_obj)
-                rec = unwrap_data_objects(rec)
-                rec = reduce_foreign_keys(rec, stream_name)
-                rec["updated"] = events_obj.created
-                rec["updated_by_event_type"] = events_obj.type
-                rec = transformer.transform(
-                    rec,
-                    Context.get_catalog_entry(stream_name)['schema'],
-                    event_resource_metadata
-                )
-
-                if events_obj.created >= bookmark_value:
-                    if rec.get('id') is not None:
-                        # Write parent records only when the parent is selected
-                        if not is_sub_stream:
-                            singer.write_record(stream_name,
-                                                rec,
-                                                time_extracted=extraction_time)
-                            Context.updated_counts[stream_name] += 1
-
-                        # Delete events should be synced but not their subobjects
-                        if events_obj.get('type', '').endswith('.deleted'):
-                            continue
-
-                        # Write child stream records only when the child stream is selected
-                        if sub_stream_name and Context.is_selected(sub_stream_name):
-                            if event_resource_obj:
-                                sync_sub_stream(sub_stream_name,
-                                                event_resource_obj,
-                                                updates=True)
-            if events_obj.created > max_created:
-                max_created = events_obj.created
-
-        # The events stream returns results in descending order, so we
-        # cannot bookmark until the entire page is processed
+        yield date_window_end, extraction_time, response.auto_paging_iter()
         date_window_start = date_window_end
-        date_window_end = date_window_end + events_update_date_window_size
 
-        # Write bookmark for parent or child stream if it is selected
-        write_bookmark_for_event_updates(is_sub_stream, stream_name, sub_stream_name, max_created)
+
+def sync_event_updates(stream_name, is_sub_stream):
+    '''
+    Get updates via events endpoint
+    look at 'events update' bookmark and pull events after that
+    :param
+    stream_name - Name of the stream
+    is_sub_stream - Check whether the function is called via the parent stream(only parent/both are selected)
+                    or when called through only child stream i.e. when parent is not selected.
+    '''
+    LOGGER.info("Started syncing event based updates")
+    event_update_window_size = Context.event_update_window_size
+    events_update_date_window_size = int(60 * 60 * 24 * event_update_window_size) # event_update_window_size in seconds
+    sync_start_time = dt_to_epoch(utils.now())
+    start_date = int(utils.strptime_to_utc(Context.config["start_date"]).timestamp())
+
+    if is_sub_stream:
+        # We need to get the parent data first for syncing the child streams. Hence,
+        # changing stream_name to parent stream when only child is selected.
+        stream_name = PARENT_STREAM_MAP.get(stream_name)
+
+    sub_stream_name = SUB_STREAMS.get(stream_name)
+
+    bookmark_value, max_created = get_event_updates_start(stream_name,
+                                                          sub_stream_name,
+                                                          is_sub_stream,
+                                                          sync_start_time,
+                                                          start_date)
+
+    # Create a map to hold relate event object ids to timestamps
+    updated_object_timestamps = get_event_dedup_index()
+
+    window_sizer = None
+    if Context.adaptive_window_size:
+        # Stripe keeps the events of the last 30 days only
+        window_sizer = AdaptiveWindowSize(stream_name + '_events',
+                                          events_update_date_window_size,
+                                          max_window_seconds=30 * 24 * 60 * 60)
+    date_window_start = max_created
+
+    # The event updates bookmarks written by this sync
+    bookmark_keys = [stream_name + '_events'] if not is_sub_stream else []
+    if sub_stream_name and Context.is_selected(sub_stream_name):
+        bookmark_keys.append(sub_stream_name + '_events')
+
+    with SubStreamFetcher(sub_stream_name, Context.sub_stream_concurrency, updates=True) as sub_stream_fetcher, \
+            profile_stream(stream_name, stream_name + '_events'), \
+            PhaseTimer(stream_name + '_events') as phase_timer:
+        window_checkpoint = WindowCheckpoint(bookmark_keys, Context.checkpoint_interval, sub_stream_fetcher.drain)
+        checkpoint = window_checkpoint.resume(max_created, sync_start_time)
+        for date_window_end, extraction_time, events in fetch_event_windows(max_created,
+                                                                            events_update_date_window_size,
+                                                                            {"type": STREAM_TO_TYPE_FILTER[stream_name]['type']},
+                                                                            window_sizer,
+                                                                            checkpoint and checkpoint['stop']):
+            window_record_count = 0
+            for events_obj in events:
+                window_record_count += 1
+                phase_timer.lap('paginate')
+                if events_obj.created > max_created:
+                    max_created = events_obj.created
+
+                # The events up to the checkpoint were synced by the previous sync. They are read again
+                # only to remember their objects, which older events of the window must not overwrite.
+                if checkpoint and events_obj.created >= checkpoint['created']:
+                    should_sync_event(events_obj,
+                                      STREAM_TO_TYPE_FILTER[stream_name]['object'],
+                                      updated_object_timestamps)
+                    phase_timer.lap('dedup')
+                    if events_obj.id == checkpoint['starting_after']:
+                        checkpoint = None
+                    continue
+                checkpoint = None
+
+                sync_event_update(events_obj,
+                                  stream_name,
+                                  is_sub_stream,
+                                  bookmark_value,
+                                  updated_object_timestamps,
+                                  extraction_time,
+                                  sub_stream_fetcher)
+                window_checkpoint.object_processed(date_window_start, date_window_end,
+                                                   events_obj.id, events_obj.created)
+                phase_timer.lap('state')
+
+            phase_timer.lap('paginate')
+            if window_sizer:
+                window_sizer.record_window(date_window_end - date_window_start, window_record_count)
+            date_window_start = date_window_end
+            checkpoint = None
+
+            # Every sub stream record of the window is written before the bookmarks
+            sub_stream_fetcher.drain()
+            phase_timer.lap('sub_stream')
+            window_checkpoint.window_done()
+
+            # The events stream returns results in descending order, so we
+            # cannot bookmark until the entire page is processed
+            # Write bookmark for parent or child stream if it is selected
+            write_bookmark_for_event_updates(is_sub_stream, stream_name, sub_stream_name, max_created)
+            phase_timer.lap('state')
 
     # max_created is the maximum replication key value among all records.
     # sync_start_time is epoch time when tap started to sync event updates.
@@ -1085,75 +3621,282 @@ def sync_event_updates(stream_name, is_sub_stream):
     max_created = max(max_created, sync_start_time - events_update_date_window_size)
     write_bookmark_for_event_updates(is_sub_stream, stream_name, sub_stream_name, max_created)
 
+    updated_object_timestamps.log_metrics(stream_name)
+    updated_object_timestamps.close()
+
+
+def get_shared_event_type_filter(type_filters):
+    """
+    Returns the single event type filter that matches all the given type filters,
+    e.g. 'customer.*' for 'customer.*' and 'customer.subscription.*', or None when
+    the events of several types are needed.
+    """
+    type_filters = set(type_filters)
+    covering = [type_filter for type_filter in type_filters
+                if all(fnmatch.fnmatchcase(other, type_filter) for other in type_filters)]
+    return covering[0] if covering else None
+
+
+def sync_shared_event_updates(streams_to_sync):
+    """
+    Get updates of all the given (stream_name, is_sub_stream) via a single scan of the events
+    endpoint. Every event is handed to the streams whose type filter matches it, and every
+    stream keeps its own event updates bookmark.
+    """
+    LOGGER.info("Started syncing event based updates of %d streams with a shared scan",
+                len(streams_to_sync))
+    events_update_date_window_size = int(60 * 60 * 24 * Context.event_update_window_size)
+    sync_start_time = dt_to_epoch(utils.now())
+    start_date = int(utils.strptime_to_utc(Context.config["start_date"]).timestamp())
+
+    scans = []
+    for stream_name, is_sub_stream in streams_to_sync:
+        if is_sub_stream:
+            stream_name = PARENT_STREAM_MAP.get(stream_name)
+        bookmark_value, max_created = get_event_updates_start(stream_name,
+                                                              SUB_STREAMS.get(stream_name),
+                                                              is_sub_stream,
+                                                              sync_start_time,
+                                                              start_date)
+        scans.append({'stream_name': stream_name,
+                      'is_sub_stream': is_sub_stream,
+                      'type': STREAM_TO_TYPE_FILTER[stream_name]['type'],
+                      'bookmark_value': bookmark_value,
+                      'start': max_created,
+                      'max_created': max_created,
+                      'updated_object_timestamps': get_event_dedup_index()})
+
+    if not scans:
+        return
+
+    type_filter = get_shared_event_type_filter(scan['type'] for scan in scans)
+    request_args = {'type': type_filter} if type_filter else {}
+    LOGGER.info("Scanning events of type %s", type_filter or 'any')
+
+    with PhaseTimer('events_shared_scan') as phase_timer:
+        for date_window_end, extraction_time, events in fetch_event_windows(min(scan['start'] for scan in scans),
+                                                                            events_update_date_window_size,
+                                                                            request_args):
+            for events_obj in events:
+                phase_timer.lap('paginate')
+                for scan in scans:
+                    # Skip the events before the bookmark of the stream or of a different type
+                    if events_obj.created < scan['start'] or \
+                            not fnmatch.fnmatchcase(events_obj.type, scan['type']):
+                        continue
+                    sync_event_update(events_obj,
+                                      scan['stream_name'],
+                                      scan['is_sub_stream'],
+                                      scan['bookmark_value'],
+                                      scan['updated_object_timestamps'],
+                                      extraction_time)
+                    if events_obj.created > scan['max_created']:
+                        scan['max_created'] = events_obj.created
+
+            phase_timer.lap('paginate')
+            for scan in scans:
+                # Streams with a later bookmark are bookmarked once the scan reaches it
+                if date_window_end > scan['start']:
+                    write_bookmark_for_event_updates(scan['is_sub_stream'],
+                                                     scan['stream_name'],
+                                                     SUB_STREAMS.get(scan['stream_name']),
+                                                     scan['max_created'])
+            phase_timer.lap('state')
+
+    for scan in scans:
+        max_created = max(scan['max_created'], sync_start_time - events_update_date_window_size)
+        write_bookmark_for_event_updates(scan['is_sub_stream'],
+                                         scan['stream_name'],
+                                         SUB_STREAMS.get(scan['stream_name']),
+                                         max_created)
+        scan['updated_object_timestamps'].log_metrics(scan['stream_name'])
+        scan['updated_object_timestamps'].close()
+
 
 def write_bookmark_for_event_updates(is_sub_stream, stream_name, sub_stream_name, max_created):
     """
     Write bookmark for parent and child streams.
     """
-    # Write the parent bookmark value only when the parent is selected
-    if not is_sub_stream:
-        singer.write_bookmark(Context.state,
-                              stream_name + '_events',
-                              'updates_created',
-                              max_created)
+    with MESSAGE_LOCK:
+        # Write the parent bookmark value only when the parent is selected
+        if not is_sub_stream:
+            singer.write_bookmark(Context.state,
+                                  stream_name + '_events',
+                                  'updates_created',
+                                  max_created)
 
-    # Write the child bookmark value only when the child is selected
-    if sub_stream_name and Context.is_selected(sub_stream_name):
-        singer.write_bookmark(Context.state,
-                              sub_stream_name + '_events',
-                              'updates_created',
-                              max_created)
+        # Write the child bookmark value only when the child is selected
+        if sub_stream_name and Context.is_selected(sub_stream_name):
+            singer.write_bookmark(Context.state,
+                                  sub_stream_name + '_events',
+                                  'updates_created',
+                                  max_created)
 
-    singer.write_state(Context.state)
+    write_state()
 
 def reset_bookmark_for_event_updates(is_sub_stream, stream_name, sub_stream_name, start_date):
     """
     Reset bookmark for parent and child streams to start date and clear the bookmark date for event updates.
     """
-    # Write the parent bookmark value only when the parent is selected
-    if not is_sub_stream:
-        singer.write_bookmark(Context.state,
-                              stream_name,
-                              STREAM_REPLICATION_KEY.get(stream_name),
-                              start_date)
-        Context.state.get("bookmarks").pop(stream_name + '_events', None)
+    with MESSAGE_LOCK:
+        # Write the parent bookmark value only when the parent is selected
+        if not is_sub_stream:
+            singer.write_bookmark(Context.state,
+                                  stream_name,
+                                  STREAM_REPLICATION_KEY.get(stream_name),
+                                  start_date)
+            Context.state.get("bookmarks").pop(stream_name + '_events', None)
 
-    # Write the child bookmark value only when the child is selected
-    if sub_stream_name and Context.is_selected(sub_stream_name):
-        singer.write_bookmark(Context.state,
-                              sub_stream_name,
-                              STREAM_REPLICATION_KEY.get(sub_stream_name),
-                              start_date)
-        Context.state.get("bookmarks").pop(sub_stream_name + '_events', None)
+        # Write the child bookmark value only when the child is selected
+        if sub_stream_name and Context.is_selected(sub_stream_name):
+            singer.write_bookmark(Context.state,
+                                  sub_stream_name,
+                                  STREAM_REPLICATION_KEY.get(sub_stream_name),
+                                  start_date)
+            Context.state.get("bookmarks").pop(sub_stream_name + '_events', None)
 
-    singer.write_state(Context.state)
+    write_state()
 
 
 def sync():
     """
     The sync function called for the sync mode.
     """
-    # Write all schemas and init count to 0
-    for catalog_entry in Context.catalog['streams']:
-        stream_name = catalog_entry["tap_stream_id"]
-        if Context.is_selected(stream_name):
-            singer.write_schema(stream_name,
-                                catalog_entry['schema'],
-                                catalog_entry['key_properties'])
-
-            Context.new_counts[stream_name] = 0
-            Context.updated_counts[stream_name] = 0
-
-    # Loop over streams in catalog
-    for catalog_entry in Context.catalog['streams']:
-        stream_name = catalog_entry['tap_stream_id']
-        if Context.is_selected(stream_name):
-            # Run the sync for only parent streams/only child streams/both parent-child streams
-            if not Context.is_sub_stream(stream_name) or not is_parent_selected(stream_name):
-                sync_stream(stream_name, Context.is_sub_stream(stream_name))
-                # This prevents us from retrieving immutable stream events.
-                if STREAM_TO_TYPE_FILTER.get(stream_name):
-                    sync_event_updates(stream_name, Context.is_sub_stream(stream_name))
+    # Build the plans of the streams once, they are only valid for the catalog of this sync
+    Context.stream_plans = {catalog_entry['tap_stream_id']: build_stream_plan(catalog_entry['tap_stream_id'])
+                            for catalog_entry in Context.catalog['streams']}
+    try:
+        # Write all schemas and init count to 0
+        for catalog_entry in Context.catalog['streams']:
+            stream_name = catalog_entry["tap_stream_id"]
+            if Context.is_selected(stream_name):
+                schema = catalog_entry['schema']
+                if Context.account_ids:
+                    # The records of the connected accounts are tagged with their account
+                    schema = {**schema, 'properties': {**schema['properties'],
+                                                       'account_id': {'type': ['null', 'string']}}}
+                singer.write_schema(stream_name,
+                                    schema,
+                                    catalog_entry['key_properties'])
+
+                Context.new_counts[stream_name] = 0
+                Context.updated_counts[stream_name] = 0
+
+        # Collect the parent streams/only child streams/both parent-child streams to sync
+        streams_to_sync = []
+        for catalog_entry in Context.catalog['streams']:
+            stream_name = catalog_entry['tap_stream_id']
+            if Context.is_selected(stream_name):
+                # Run the sync for only parent streams/only child streams/both parent-child streams
+                if not Context.is_sub_stream(stream_name) or not is_parent_selected(stream_name):
+                    streams_to_sync.append((stream_name, Context.is_sub_stream(stream_name)))
+
+        if Context.account_ids:
+            sync_accounts(streams_to_sync, Context.account_ids, Context.account_concurrency)
+        else:
+            sync_streams(streams_to_sync, Context.stream_concurrency, Context.shared_event_scan)
+    finally:
+        Context.stream_plans = {}
+
+
+def sync_account(streams_to_sync, account_id):
+    """
+    Sync the streams of a connected account, with the bookmarks kept for the account in the state.
+    """
+    with MESSAGE_LOCK:
+        account_state = Context.state.setdefault('accounts', {}).setdefault(account_id, {})
+    token = CURRENT_ACCOUNT.set(AccountScope(account_id, account_state))
+    try:
+        LOGGER.info('Syncing the connected account %s', account_id)
+        sync_streams(streams_to_sync, Context.stream_concurrency, Context.shared_event_scan)
+    finally:
+        CURRENT_ACCOUNT.reset(token)
+
+
+def sync_accounts(streams_to_sync, account_ids, concurrency=DEFAULT_ACCOUNT_CONCURRENCY):
+    """
+    Sync the streams of every connected account. With a concurrency above 1, the accounts are
+    synced by a pool of workers sharing the HTTP client, the stream plans and the concurrency
+    controller.
+    """
+    if concurrency <= 1:
+        for account_id in account_ids:
+            sync_account(streams_to_sync, account_id)
+        return
+
+    LOGGER.info('Syncing %d connected accounts with %d workers', len(account_ids), concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='tap-stripe-account') as executor:
+        wait_for_passes([submit_in_context(executor, sync_account, streams_to_sync, account_id)
+                         for account_id in account_ids])
+
+
+def sync_stream_and_event_updates(stream_name, is_sub_stream):
+    """
+    Sync the newly created records of the stream followed by its event based updates.
+    """
+    sync_stream(stream_name, is_sub_stream)
+    # This prevents us from retrieving immutable stream events.
+    if STREAM_TO_TYPE_FILTER.get(stream_name):
+        sync_event_updates(stream_name, is_sub_stream)
+
+
+def wait_for_passes(futures):
+    """
+    Wait for the submitted sync passes and raise the error of the first failed one.
+    """
+    done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+    failed = [future for future in done if future.exception()]
+    if failed:
+        # Passes that have not started yet are dropped, running ones are let finish
+        for future in not_done:
+            future.cancel()
+        failed[0].result()
+
+
+def sync_streams(streams_to_sync, concurrency=DEFAULT_STREAM_CONCURRENCY, shared_event_scan=False):
+    """
+    Run the creation pass and the event updates pass of every (stream_name, is_sub_stream).
+    With a concurrency above 1, the streams and the two passes of a stream run in a pool
+    of workers so the sync takes about as long as the slowest stream.
+    With shared_event_scan, the event updates of all the streams come from a single scan
+    of the events endpoint instead of one scan per stream.
+    """
+    event_streams = [(stream_name, is_sub_stream) for stream_name, is_sub_stream in streams_to_sync
+                     if STREAM_TO_TYPE_FILTER.get(stream_name)] if shared_event_scan else []
+
+    if concurrency <= 1:
+        for stream_name, is_sub_stream in streams_to_sync:
+            if shared_event_scan:
+                sync_stream(stream_name, is_sub_stream)
+            else:
+                sync_stream_and_event_updates(stream_name, is_sub_stream)
+        if event_streams:
+            sync_shared_event_updates(event_streams)
+        return
+
+    LOGGER.info('Syncing %d streams with %d workers', len(streams_to_sync), concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = []
+        for stream_name, is_sub_stream in streams_to_sync:
+            if shared_event_scan or not STREAM_TO_TYPE_FILTER.get(stream_name):
+                futures.append(submit_in_context(executor, sync_stream, stream_name, is_sub_stream))
+            elif not is_event_updates_bookmark_expired(stream_name, is_sub_stream):
+                futures.append(submit_in_context(executor, sync_stream, stream_name, is_sub_stream))
+                futures.append(submit_in_context(executor, sync_event_updates, stream_name, is_sub_stream))
+            else:
+                # An expired event updates bookmark resets the bookmark of the stream,
+                # which has to happen after the creation pass as it does when run serially.
+                futures.append(submit_in_context(executor, sync_stream_and_event_updates, stream_name, is_sub_stream))
+
+        if event_streams:
+            if any(is_event_updates_bookmark_expired(stream_name, is_sub_stream)
+                   for stream_name, is_sub_stream in event_streams):
+                # Same as above, the shared scan has to wait for the creation passes
+                wait_for_passes(futures)
+                futures = []
+            futures.append(submit_in_context(executor, sync_shared_event_updates, event_streams))
+
+        wait_for_passes(futures)
 
 
 def get_date_window_size(param, default_value):
@@ -1180,6 +3923,38 @@ def get_date_window_size(param, default_value):
             " be a valid non-zero integer.".format(window_size))
 
 
+def get_concurrency(param, default_value):
+    """
+    Get the number of workers from config, if the value is passed.
+    Else return the default value.
+    param: Name of param to fetch from the config. (e.g. window_concurrency)
+    default_value: Default value to return for the given param.
+    """
+    concurrency = Context.config.get(param)
+
+    if concurrency is None:
+        return default_value
+
+    # Return int of concurrency which is passed in the config as a positive int or string of digits.
+    if ((isinstance(concurrency, int) and not isinstance(concurrency, bool)) or
+        (isinstance(concurrency, str) and concurrency.isdigit())) and \
+            int(concurrency) > 0:
+        return int(concurrency)
+    else:
+        raise Exception("The entered {} '{}' is invalid, it should"\
+            " be a valid positive integer.".format(param, concurrency))
+
+
+def get_account_ids():
+    """
+    Get the connected accounts to sync from the config, as a list or a comma separated string.
+    """
+    account_ids = Context.config.get('account_ids') or []
+    if isinstance(account_ids, str):
+        account_ids = account_ids.split(',')
+    return [account_id.strip() for account_id in account_ids if account_id.strip()]
+
+
 @utils.handle_top_exception(LOGGER)
 def main():
     # Parse command line arguments
@@ -1187,6 +3962,10 @@ def main():
     # set the config and state in prior to check the authentication in the discovery mode itself.
     Context.config = args.config
     Context.state = args.state
+    if str(Context.config.get('replay', False)).lower() == 'true':
+        if not Context.config.get('archive_path'):
+            raise Exception("The replay requires the archive_path of the archive to replay.")
+        Context.archive_replay = ArchiveReplay(Context.config['archive_path'])
     configure_stripe_client()
 
     # If discover flag was passed, run discovery mode and dump output to stdout
@@ -1202,6 +3981,57 @@ def main():
         if Context.event_update_window_size > 30:
             Context.event_update_window_size = 30
             LOGGER.warning("Using a default window size of 30 days as Stripe Event API returns data of the last 30 days only.")
+        Context.window_concurrency = get_concurrency('window_concurrency', DEFAULT_WINDOW_CONCURRENCY)
+        Context.stream_concurrency = get_concurrency('stream_concurrency', DEFAULT_STREAM_CONCURRENCY)
+        Context.sub_stream_concurrency = get_concurrency('sub_stream_concurrency', DEFAULT_SUB_STREAM_CONCURRENCY)
+        Context.shared_event_scan = str(Context.config.get('shared_event_scan', False)).lower() == 'true'
+        Context.adaptive_window_size = str(Context.config.get('adaptive_window_size', False)).lower() == 'true'
+        Context.probe_empty_ranges = str(Context.config.get('probe_empty_ranges', False)).lower() == 'true'
+        Context.target_window_records = get_concurrency('target_window_records', DEFAULT_TARGET_WINDOW_RECORDS)
+        Context.raw_json = str(Context.config.get('raw_json', False)).lower() == 'true'
+        Context.stream_pages = str(Context.config.get('stream_pages', False)).lower() == 'true'
+        Context.checkpoint_interval = int(Context.config.get('checkpoint_interval') or 0)
+        Context.account_ids = get_account_ids()
+        if Context.config.get('events_store_path'):
+            Context.events_store = EventsStore(Context.config['events_store_path'])
+        if Context.config.get('archive_path') and not Context.archive_replay:
+            Context.page_archive = PageArchive(Context.config['archive_path'])
+        Context.account_concurrency = get_concurrency('account_concurrency', DEFAULT_ACCOUNT_CONCURRENCY)
+        output_buffer_size = int(Context.config.get('output_buffer_size') or 0)
+        if output_buffer_size > 0:
+            Context.message_writer = MessageWriter(
+                output_buffer_size,
+                float(Context.config.get('output_flush_interval') or DEFAULT_OUTPUT_FLUSH_INTERVAL))
+        state_flush_interval = Context.config.get('state_flush_interval')
+        state_flush_records = Context.config.get('state_flush_records')
+        if state_flush_interval or state_flush_records:
+            Context.state_throttle = StateThrottle(float(state_flush_interval) if state_flush_interval else None,
+                                                   int(state_flush_records) if state_flush_records else None)
+        Context.profile_stream = Context.config.get('profile_stream')
+        Context.profiler = Context.config.get('profiler', 'cprofile')
+        if Context.profiler not in PROFILERS:
+            raise Exception("The entered profiler '{}' is invalid, it should be one of {}.".format(
+                Context.profiler, ", ".join(PROFILERS)))
+        Context.transform_mode = Context.config.get('transform_mode', 'singer')
+        if Context.transform_mode not in TRANSFORM_MODES:
+            raise Exception("The entered transform_mode '{}' is invalid, it should be one of {}.".format(
+                Context.transform_mode, ", ".join(TRANSFORM_MODES)))
+
+        if Context.config.get('http_engine', 'requests') == 'asyncio':
+            max_connections = get_concurrency('max_connections', DEFAULT_MAX_CONNECTIONS)
+            Context.async_engine = AsyncioEngine(max_connections, get_request_timeout())
+            max_in_flight = max_connections
+        else:
+            # The date windows and the sub streams of a stream are fetched at the same time
+            max_in_flight = Context.stream_concurrency * (Context.window_concurrency +
+                                                          Context.sub_stream_concurrency - 1)
+            if Context.stream_concurrency > 1:
+                # Both passes of a stream may fetch their date windows at the same time
+                max_in_flight *= 2
+            if Context.account_ids:
+                max_in_flight *= min(Context.account_concurrency, len(Context.account_ids))
+        if max_in_flight > 1:
+            Context.concurrency_controller = ConcurrencyController(max_in_flight)
 
         Context.tap_start = utils.now()
         if args.catalog:
@@ -1212,8 +4042,22 @@ def main():
         try:
             sync()
         finally:
+            if Context.async_engine:
+                Context.async_engine.close()
+            if Context.events_store:
+                Context.events_store.close()
+            if Context.page_archive:
+                Context.page_archive.close()
+            if Context.archive_replay:
+                Context.archive_replay.close()
+            # The records written are covered by the state held back
+            flush_state()
+            if Context.message_writer:
+                Context.message_writer.flush()
             # Print counts
             Context.print_counts()
+            PhaseTimer.log_breakdown()
+            HTTP_METRICS.log_summary()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+"""
+Measures the throughput of the tap per stream against the local Stripe stand-in.
+
+    python tests/benchmarks/run_benchmarks.py --streams charges,customers --sizes 1000,10000 \
+        --config '{"raw_json": true}' --json results.json
+
+Every stream is synced on its own by a tap process, selected alone in the catalog. The
+records/sec and requests/sec are measured over the wall time of the process, and the CPU
+time and peak RSS are the ones of the tap process.
+"""
+import argparse
+import copy
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, ROOT)
+
+import tap_stripe  # pylint: disable=wrong-import-position
+from stripe_stand_in import DAY, StripeStandIn  # pylint: disable=wrong-import-position
+
+RUN_TAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run_tap.py')
+MESSAGE_PATTERN = re.compile(rb'\{"type":\s*"(\w+)"(?:,\s*"stream":\s*"(\w+)")?')
+DEFAULT_STREAMS = [stream_name for stream_name in tap_stripe.STREAM_SDK_OBJECTS
+                   if stream_name not in tap_stripe.PARENT_STREAM_MAP]
+
+
+def select_stream(catalog, stream_name):
+    catalog = copy.deepcopy(catalog)
+    for entry in catalog['streams']:
+        for mdata in entry['metadata']:
+            if not mdata['breadcrumb']:
+                mdata['metadata']['selected'] = entry['tap_stream_id'] == stream_name
+    return catalog
+
+
+def run_stream(stand_in, catalog, stream_name, config, work_dir):
+    """Syncs the stream with a tap process and returns its measures."""
+    config_path = os.path.join(work_dir, 'config.json')
+    catalog_path = os.path.join(work_dir, 'catalog.json')
+    with open(config_path, 'w', encoding='utf-8') as config_file:
+        json.dump(config, config_file)
+    with open(catalog_path, 'w', encoding='utf-8') as catalog_file:
+        json.dump(select_stream(catalog, stream_name), catalog_file)
+
+    stand_in.requests.clear()
+    messages = Counter()
+    env = dict(os.environ, STRIPE_API_BASE=stand_in.url,
+               PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    with open(os.path.join(work_dir, stream_name + '.log'), 'wb') as log_file:
+        start = time.monotonic()
+        process = subprocess.Popen([sys.executable, RUN_TAP, '--config', config_path, '--catalog', catalog_path],
+                                   stdout=subprocess.PIPE, stderr=log_file, env=env)
+        for line in process.stdout:
+            match = MESSAGE_PATTERN.match(line)
+            if match:
+                messages[match.group(1).decode()] += 1
+        _, status, rusage = os.wait4(process.pid, 0)
+        elapsed = time.monotonic() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        with open(log_file.name, encoding='utf-8') as log:
+            raise RuntimeError('The sync of {} failed:\n{}'.format(stream_name, ''.join(log.readlines()[-20:])))
+
+    requests = sum(stand_in.requests.values())
+    return {
+        'stream': stream_name,
+        'size': stand_in.size,
+        'records': messages['RECORD'],
+        'states': messages['STATE'],
+        'requests': requests,
+        'seconds': round(elapsed, 3),
+        'records_per_second': round(messages['RECORD'] / elapsed, 1),
+        'requests_per_second': round(requests / elapsed, 1),
+        'cpu_seconds': round(rusage.ru_utime + rusage.ru_stime, 3),
+        'peak_rss_mb': round(rusage.ru_maxrss / 1024, 1),
+    }
+
+
+def print_results(results):
+    columns = ['stream', 'size', 'records', 'requests', 'seconds', 'records_per_second',
+               'requests_per_second', 'cpu_seconds', 'peak_rss_mb']
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print('  '.join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--streams', default=','.join(DEFAULT_STREAMS),
+                        help='Comma separated streams to sync, one at a time (default: all parent streams)')
+    parser.add_argument('--sizes', default='1000', help='Comma separated numbers of objects per stream')
+    parser.add_argument('--days', type=int, default=60, help='Days over which the objects are created')
+    parser.add_argument('--event-ratio', type=float, default=0.2,
+                        help='Share of the objects updated by an event in the last 30 days')
+    parser.add_argument('--gzip', action='store_true', help='Compress the responses like Stripe')
+    parser.add_argument('--config', default='{}', help='JSON of the tap config options to benchmark')
+    parser.add_argument('--json', help='Write the results to this file')
+    args = parser.parse_args()
+
+    streams = args.streams.split(',')
+    catalog = tap_stripe.discover()
+    results = []
+    with tempfile.TemporaryDirectory(prefix='tap-stripe-benchmark-') as work_dir:
+        for size in (int(size) for size in args.sizes.split(',')):
+            stand_in = StripeStandIn(streams, size, days=args.days, event_ratio=args.event_ratio,
+                                     use_gzip=args.gzip).start()
+            try:
+                start_date = datetime.fromtimestamp(stand_in.now - args.days * DAY - DAY, timezone.utc)
+                config = {'client_secret': 'sk_test_benchmark',
+                          'account_id': 'acct_benchmark',
+                          'start_date': start_date.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                          **json.loads(args.config)}
+                for stream_name in streams:
+                    results.append(run_stream(stand_in, catalog, stream_name, config, work_dir))
+                    print('{stream} ({size}): {records} records in {seconds}s'.format(**results[-1]), file=sys.stderr)
+            finally:
+                stand_in.stop()
+
+    print()
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as results_file:
+            json.dump(results, results_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
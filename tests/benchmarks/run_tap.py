@@ -0,0 +1,10 @@
+"""
+Runs the tap against the Stripe API base given in the STRIPE_API_BASE environment variable.
+"""
+import os
+import stripe
+import tap_stripe
+
+if __name__ == '__main__':
+    stripe.api_base = os.environ['STRIPE_API_BASE']
+    tap_stripe.main()
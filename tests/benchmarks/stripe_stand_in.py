@@ -0,0 +1,316 @@
+"""
+A local stand-in for the Stripe API serving generated objects with the list semantics the
+tap relies on: `created[gte]`/`created[lt]`, `limit`, `starting_after`, `has_more`,
+`expand`, the `/v1/events` endpoint with its `type` filter, the balance history of payouts
+and the account retrieved when the tap connects.
+"""
+import bisect
+import fnmatch
+import gzip
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import tap_stripe
+
+DAY = 24 * 60 * 60
+
+# The `object` of the objects of every stream
+OBJECT_NAMES = {
+    'charges': 'charge',
+    'events': 'event',
+    'customers': 'customer',
+    'plans': 'plan',
+    'payment_intents': 'payment_intent',
+    'invoices': 'invoice',
+    'invoice_items': 'invoiceitem',
+    'invoice_line_items': 'line_item',
+    'transfers': 'transfer',
+    'coupons': 'coupon',
+    'subscriptions': 'subscription',
+    'subscription_items': 'subscription_item',
+    'balance_transactions': 'balance_transaction',
+    'payouts': 'payout',
+    'payout_transactions': 'balance_transaction',
+    'disputes': 'dispute',
+    'products': 'product',
+    'transfer_reversals': 'transfer_reversal',
+}
+
+# The lists of the sub stream objects embedded in their parents
+EMBEDDED_LISTS = {
+    'invoices': ('lines', 'invoice_line_items', 'invoice'),
+    'subscriptions': ('items', 'subscription_items', 'subscription'),
+    'transfers': ('reversals', 'transfer_reversals', 'transfer'),
+}
+
+# The objects returned by Stripe only when their field is expanded
+EXPANDED_OBJECTS = {
+    'data.sources': 'card',
+    'data.subscriptions': 'subscription',
+    'data.tax_ids': 'tax_id',
+    'data.refunds': 'refund',
+}
+
+
+def sample_value(schema, depth=0):
+    """Returns a value of the type of the schema, with all the properties of the objects."""
+    if 'anyOf' in schema:
+        schema = next((option for option in schema['anyOf'] if option.get('type') != 'null'),
+                      schema['anyOf'][0])
+    types = schema.get('type', [])
+    types = types if isinstance(types, list) else [types]
+    typ = next((typ for typ in types if typ != 'null'), 'string')
+    if schema.get('format') == 'date-time':
+        return 1600000000
+    if schema.get('format') == 'singer.decimal':
+        return '10.5'
+    if typ == 'object':
+        if depth >= 3:
+            return {}
+        return {key: sample_value(sub_schema, depth + 1)
+                for key, sub_schema in schema.get('properties', {}).items()}
+    if typ == 'array':
+        return []
+    if typ == 'integer':
+        return 1000
+    if typ == 'number':
+        return 10.5
+    if typ == 'boolean':
+        return False
+    return 'benchmark'
+
+
+def list_object(url, data):
+    return {'object': 'list', 'data': data, 'has_more': False, 'total_count': len(data), 'url': url}
+
+
+class Dataset():
+    """
+    The objects of a stream sorted the way Stripe lists them, newest first.
+    """
+    def __init__(self):
+        self.objects = []
+        self.keys = []  # Negated created times, ascending
+        self.positions = {}
+        self.encoded = {}
+
+    def add_all(self, objects):
+        self.objects = sorted(objects, key=lambda obj: (obj['created'], obj['id']), reverse=True)
+        self.keys = [-obj['created'] for obj in self.objects]
+        self.positions = {obj['id']: position for position, obj in enumerate(self.objects)}
+
+    def page(self, params, expand=(), object_filter=None):
+        """Returns the encoded objects of the page and whether the list has more."""
+        start = 0
+        stop = len(self.objects)
+        if 'created[lt]' in params:
+            start = bisect.bisect_right(self.keys, -int(params['created[lt]']))
+        if 'created[gte]' in params:
+            stop = bisect.bisect_right(self.keys, -int(params['created[gte]']))
+        if params.get('starting_after') in self.positions:
+            start = max(start, self.positions[params['starting_after']] + 1)
+        limit = int(params.get('limit', 10))
+        page = []
+        position = start
+        while position < stop and len(page) < limit:
+            obj = self.objects[position]
+            if object_filter is None or object_filter(obj):
+                page.append(self.encode(obj, expand))
+            position += 1
+        has_more = any(object_filter is None or object_filter(obj) for obj in self.objects[position:stop])
+        return page, has_more
+
+    def encode(self, obj, expand):
+        key = (obj['id'], expand)
+        if key not in self.encoded:
+            self.encoded[key] = json.dumps(expand_object(obj, expand), separators=(',', ':')).encode()
+        return self.encoded[key]
+
+
+def expand_object(obj, expand):
+    """Returns the object with the expanded fields requested."""
+    if not expand:
+        return obj
+    obj = dict(obj)
+    for expand_field in expand:
+        path = expand_field.split('.')[1:]
+        if expand_field in EXPANDED_OBJECTS:
+            url = '/v1/{}s/{}/{}'.format(obj['object'], obj['id'], path[0])
+            obj[path[0]] = list_object(url, [{'id': '{}_{}'.format(EXPANDED_OBJECTS[expand_field][:4], obj['id']),
+                                              'object': EXPANDED_OBJECTS[expand_field]}])
+        elif path[-1] == 'tiers':
+            parent = obj
+            for field_name in path[:-1]:
+                parent[field_name] = dict(parent.get(field_name) or {})
+                parent = parent[field_name]
+            parent['tiers'] = [{'flat_amount': None, 'unit_amount': 100, 'up_to': None}]
+    return obj
+
+
+class StripeStandIn():
+    """
+    Serves `size` objects per stream, created over the last `days` days, and an update event
+    within the last 30 days for `event_ratio` of them.
+    """
+    def __init__(self, streams, size, days=60, event_ratio=0.2, sub_objects=3, use_gzip=False, seed=0):
+        self.size = size
+        self.days = days
+        self.use_gzip = use_gzip
+        self.now = int(time.time())
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self.datasets = {}
+        self.events = Dataset()
+        catalog = {entry['tap_stream_id']: entry for entry in tap_stripe.discover()['streams']}
+        rand = random.Random(seed)
+        events = []
+        for stream_name in streams:
+            stream_name = tap_stripe.PARENT_STREAM_MAP.get(stream_name, stream_name)
+            if stream_name in self.datasets or stream_name == 'events':
+                continue
+            objects = self.generate(catalog, stream_name, rand, sub_objects)
+            self.datasets[stream_name] = Dataset()
+            self.datasets[stream_name].add_all(objects)
+            if stream_name in tap_stripe.STREAM_TO_TYPE_FILTER:
+                events.extend(self.generate_events(stream_name, objects, rand, event_ratio))
+        if 'events' in streams and not events:
+            # The events stream alone lists the events of charges
+            events = self.generate_events('charges', self.generate(catalog, 'charges', rand, sub_objects),
+                                          rand, event_ratio)
+        self.events.add_all(events)
+        self.server = None
+        self.thread = None
+
+    def generate(self, catalog, stream_name, rand, sub_objects):
+        template = json.dumps(self.template(catalog, stream_name))
+        embedded = EMBEDDED_LISTS.get(stream_name)
+        if embedded:
+            sub_template = json.dumps(self.template(catalog, embedded[1]))
+        objects = []
+        for index in range(self.size):
+            obj = json.loads(template)
+            obj['id'] = '{}_{:08d}'.format(OBJECT_NAMES[stream_name][:3], index)
+            obj['created'] = self.now - rand.randint(1, self.days * DAY)
+            if stream_name == 'invoice_items':
+                obj['date'] = obj['created']
+            if stream_name == 'payouts':
+                obj['automatic'] = True
+            if embedded:
+                field_name, sub_stream_name, parent_key = embedded
+                sub_objs = []
+                for sub_index in range(sub_objects):
+                    sub_obj = json.loads(sub_template)
+                    sub_obj.update({'id': '{}_{}_{}'.format(OBJECT_NAMES[sub_stream_name][:2], obj['id'], sub_index),
+                                    'created': obj['created'], parent_key: obj['id']})
+                    sub_objs.append(sub_obj)
+                obj[field_name] = list_object('/v1/{}/{}/{}'.format(stream_name, obj['id'], field_name), sub_objs)
+            objects.append(obj)
+        return objects
+
+    @staticmethod
+    def template(catalog, stream_name):
+        obj = sample_value(catalog[stream_name]['schema'])
+        obj['object'] = OBJECT_NAMES[stream_name]
+        obj['metadata'] = {}
+        # The fields that Stripe only returns when expanded
+        for expand_field in tap_stripe.STREAM_TO_EXPAND_FIELDS.get(stream_name, []):
+            path = expand_field.split('.')[1:]
+            parent = obj
+            for field_name in path[:-1]:
+                parent = parent.get(field_name) if isinstance(parent.get(field_name), dict) else {}
+            parent.pop(path[-1], None)
+        return obj
+
+    def generate_events(self, stream_name, objects, rand, event_ratio):
+        event_type = tap_stripe.STREAM_TO_TYPE_FILTER[stream_name]['type'].replace('*', 'updated')
+        events = []
+        for obj in objects:
+            if rand.random() >= event_ratio:
+                continue
+            events.append({'id': 'evt_{}'.format(obj['id']), 'object': 'event', 'type': event_type,
+                           'created': self.now - rand.randint(1, 29 * DAY), 'livemode': False,
+                           'pending_webhooks': 0, 'api_version': '2022-11-15',
+                           'request': {'id': None, 'idempotency_key': None},
+                           'data': {'object': obj}})
+        return events
+
+    def start(self):
+        stand_in = self
+
+        class Handler(StandInHandler):
+            pass
+        Handler.stand_in = stand_in
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    def respond(self, path, params):
+        """Returns the status code and the body of a request."""
+        expand = tuple(value for key, value in params if key.startswith('expand'))
+        params = dict(params)
+        parts = path.strip('/').split('/')
+        with self.lock:
+            self.requests[parts[1] if len(parts) > 1 else path] += 1
+        if len(parts) == 3 and parts[1] == 'accounts':
+            return 200, json.dumps({'id': parts[2], 'object': 'account',
+                                    'settings': {'dashboard': {'display_name': 'Benchmark'}}}).encode()
+        if path == '/v1/balance_transactions' and 'payout' in params:
+            return 200, self.payout_transactions(params['payout'])
+        if path == '/v1/events':
+            type_filter = params.get('type')
+            page, has_more = self.events.page(
+                params, object_filter=(lambda event: fnmatch.fnmatchcase(event['type'], type_filter))
+                if type_filter else None)
+            return 200, self.encode_list(path, page, has_more)
+        for stream_name, dataset in self.datasets.items():
+            if tap_stripe.STREAM_SDK_OBJECTS[stream_name]['sdk_object'].class_url() == path:
+                page, has_more = dataset.page(params, expand)
+                return 200, self.encode_list(path, page, has_more)
+        return 404, json.dumps({'error': {'type': 'invalid_request_error',
+                                          'message': 'Unrecognized request URL (GET: {})'.format(path)}}).encode()
+
+    @staticmethod
+    def encode_list(url, page, has_more):
+        return b''.join([b'{"object":"list","url":', json.dumps(url).encode(), b',"has_more":',
+                         b'true' if has_more else b'false', b',"data":[', b','.join(page), b']}'])
+
+    def payout_transactions(self, payout_id):
+        data = [{'id': 'txn_{}_{}'.format(payout_id, index), 'object': 'balance_transaction', 'amount': 100,
+                 'created': self.now, 'type': 'charge', 'status': 'available'} for index in range(2)]
+        return json.dumps(list_object('/v1/balance_transactions', data)).encode()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    stand_in = None
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        url = urlsplit(self.path)
+        status, body = self.stand_in.respond(url.path, parse_qsl(url.query))
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Request-Id', 'req_benchmark')
+        if self.stand_in.use_gzip and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=1)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
@@ -0,0 +1,174 @@
+import unittest
+from unittest import mock
+from urllib.parse import parse_qsl, urlsplit
+import stripe
+from tap_stripe import AdaptiveWindowSize, Context, apply_window_bisection_to_client
+
+DAY = 24 * 60 * 60
+
+
+class TestAdaptiveWindowSize(unittest.TestCase):
+    """
+    Test that `AdaptiveWindowSize` fits the date windows to the density of records.
+    """
+
+    def setUp(self):
+        Context.state = {}
+
+    def test_window_shrinks_for_dense_records(self):
+        """
+        Test that a window with many records makes the next windows smaller.
+        """
+        sizer = AdaptiveWindowSize('charges', 30 * DAY, target_records=1000)
+        sizer.record_window(30 * DAY, 30000)
+
+        # Verify that the window aims at 1000 records for 1000 records per day
+        self.assertEqual(sizer.window_seconds, DAY)
+        # Verify that the density is saved in the state
+        self.assertEqual(Context.state, {'bookmarks': {'charges': {'records_per_day': 1000.0}}})
+
+    def test_window_growth_is_bounded(self):
+        """
+        Test that an empty window grows the next window at most 4 times.
+        """
+        sizer = AdaptiveWindowSize('charges', DAY, target_records=1000)
+        sizer.record_window(DAY, 0)
+
+        # Verify that the window grows 4 times
+        self.assertEqual(sizer.window_seconds, 4 * DAY)
+
+    def test_window_size_is_clamped(self):
+        """
+        Test that the window never gets smaller than an hour.
+        """
+        sizer = AdaptiveWindowSize('charges', DAY, target_records=10)
+        sizer.record_window(DAY, 100000)
+
+        # Verify that the window is an hour
+        self.assertEqual(sizer.window_seconds, 60 * 60)
+
+    def test_saved_density_sizes_first_window(self):
+        """
+        Test that the density saved by a previous sync sizes the first window.
+        """
+        Context.state = {'bookmarks': {'charges_events': {'records_per_day': 500}}}
+        sizer = AdaptiveWindowSize('charges_events', 7 * DAY, target_records=5000,
+                                   max_window_seconds=30 * DAY)
+
+        # Verify that the first window holds about 5000 records
+        self.assertEqual(sizer.window_seconds, 10 * DAY)
+
+    def test_iter_windows_follows_window_size(self):
+        """
+        Test that the windows are sized when they are requested and end at the end time.
+        """
+        sizer = AdaptiveWindowSize('charges', 10, target_records=10)
+        windows = sizer.iter_windows(0, 100)
+        first = next(windows)
+        sizer.window_seconds = 40
+        rest = list(windows)
+
+        # Verify that the windows cover the range with the current size
+        self.assertEqual([first] + rest, [(0, 10), (10, 50), (50, 90), (90, 100)])
+
+
+class TestBisectOnTimeout(unittest.TestCase):
+    """
+    Test that a window whose requests time out is split in two.
+    """
+
+    def setUp(self):
+        Context.state = {}
+
+    def test_timed_out_window_is_split(self):
+        """
+        Test that the halves of a timed out window are fetched and no object is repeated.
+        """
+        calls = []
+
+        def fetch_window(window_start, window_stop):
+            calls.append((window_start, window_stop))
+            if window_stop - window_start > 2 * DAY:
+                yield {'id': 'obj_{}'.format(window_stop)}
+                raise stripe.error.APIConnectionError('timed out')
+            yield {'id': 'obj_{}'.format(window_stop)}
+
+        sizer = AdaptiveWindowSize('charges', 4 * DAY)
+        objects = list(sizer.bisect_on_timeout(fetch_window)(0, 4 * DAY))
+
+        # Verify that the window is fetched again as two halves, newest first
+        self.assertEqual(calls, [(0, 4 * DAY), (2 * DAY, 4 * DAY), (0, 2 * DAY)])
+        # Verify that the objects fetched before the timeout are not repeated
+        self.assertEqual(objects, [{'id': 'obj_{}'.format(4 * DAY)}, {'id': 'obj_{}'.format(2 * DAY)}])
+        # Verify that the next windows are smaller
+        self.assertEqual(sizer.window_seconds, 2 * DAY)
+
+    @mock.patch('tap_stripe.LOGGER.warning')
+    def test_smallest_window_timeout_raises(self, mock_warning):
+        """
+        Test that the timeout is raised when the window cannot be split any further.
+        """
+        def fetch_window(window_start, window_stop):
+            raise stripe.error.APIConnectionError('timed out')
+            yield  # pylint: disable=unreachable
+
+        sizer = AdaptiveWindowSize('charges', 60 * 60)
+
+        # Verify that the error is raised for an hour long window
+        with self.assertRaises(stripe.error.APIConnectionError):
+            list(sizer.bisect_on_timeout(fetch_window)(0, 60 * 60))
+
+    @mock.patch('tap_stripe.stripe.max_network_retries', 15)
+    def test_split_at_first_timeout(self):
+        """
+        Test that the SDK does not retry the timed out requests of a window that can still be split.
+        """
+        requests = []
+        bisections = []
+
+        def request(method, url, headers, post_data=None):
+            params = dict(parse_qsl(urlsplit(url).query))
+            requests.append((int(params['created[gte]']), int(params['created[lt]'])))
+            if requests[-1][1] - requests[-1][0] > DAY:
+                raise stripe.error.APIConnectionError('timed out', should_retry=True)
+            return b'{"object": "list", "data": [], "has_more": false, "url": "/v1/charges"}', 200, {}
+
+        client = stripe.http_client.RequestsClient()
+        client.request = request
+        client._sleep_time_seconds = lambda *args: 0  # pylint: disable=protected-access
+        apply_window_bisection_to_client(client)
+
+        def fetch_window(window_start, window_stop):
+            return stripe.Charge.list(limit=100, created={'gte': window_start, 'lt': window_stop},
+                                      api_key='api_key').auto_paging_iter()
+
+        sizer = AdaptiveWindowSize('charges', 2 * DAY)
+        with mock.patch('tap_stripe.stripe.default_http_client', client), \
+                mock.patch('tap_stripe.LOGGER.warning', side_effect=lambda *args: bisections.append(len(requests))):
+            list(sizer.bisect_on_timeout(fetch_window)(0, 2 * DAY))
+
+        # Verify that the window is split after its first request
+        self.assertEqual(bisections, [1])
+        self.assertEqual(requests, [(0, 2 * DAY), (DAY, 2 * DAY), (0, DAY)])
+
+    @mock.patch('tap_stripe.stripe.max_network_retries', 2)
+    def test_smallest_window_retried(self):
+        """
+        Test that the SDK still retries the timed out requests of a window that cannot be split.
+        """
+        client = stripe.http_client.RequestsClient()
+        client.request = mock.Mock(side_effect=stripe.error.APIConnectionError('timed out', should_retry=True))
+        client._sleep_time_seconds = lambda *args: 0  # pylint: disable=protected-access
+        apply_window_bisection_to_client(client)
+
+        def fetch_window(window_start, window_stop):
+            return stripe.Charge.list(limit=100, created={'gte': window_start, 'lt': window_stop},
+                                      api_key='api_key').auto_paging_iter()
+
+        sizer = AdaptiveWindowSize('charges', 60 * 60)
+        with mock.patch('tap_stripe.stripe.default_http_client', client), \
+                self.assertRaises(stripe.error.APIConnectionError):
+            list(sizer.bisect_on_timeout(fetch_window)(0, 60 * 60))
+
+        # Verify that the request of the hour long window is retried
+        self.assertEqual(client.request.call_count, 3)
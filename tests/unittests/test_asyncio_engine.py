@@ -0,0 +1,182 @@
+import json
+import unittest
+from unittest import mock
+import stripe
+from tap_stripe import AsyncioEngine, Context, fetch_date_windows, fetch_object_list_async, encode_params
+
+
+PAGES = {
+    None: {"object": "list", "has_more": True, "url": "/v1/charges",
+           "data": [{"id": "ch_3", "object": "charge", "created": 3},
+                    {"id": "ch_2", "object": "charge", "created": 2}]},
+    "ch_2": {"object": "list", "has_more": False, "url": "/v1/charges",
+             "data": [{"id": "ch_1", "object": "charge", "created": 1}]},
+}
+
+
+class MockEngine(AsyncioEngine):
+    '''Engine serving the list pages above instead of issuing HTTP requests.'''
+    def __init__(self, responses=None):
+        super().__init__(max_connections=5, request_timeout=10)
+        self.urls = []
+        self.responses = responses or []
+
+    async def get(self, url, headers):
+        self.urls.append(url)
+        if self.responses:
+            return self.responses.pop(0)
+        starting_after = url.split("starting_after=")[1] if "starting_after=" in url else None
+        return json.dumps(PAGES[starting_after]).encode(), 200, {}
+
+
+@mock.patch('tap_stripe.aiohttp')
+class TestAsyncioEngine(unittest.TestCase):
+    """
+    Test the asyncio http engine pagination and retries.
+    """
+
+    def setUp(self):
+        Context.config = {"client_secret": "test_secret", "account_id": "test_account"}
+        stripe.api_key = "test_secret"
+
+    def test_list_all_pages(self, mock_aiohttp):
+        """
+        Test that all the pages of a list request are fetched and converted to Stripe objects.
+        """
+        engine = MockEngine()
+        try:
+            objects = engine.run(engine.list_all, "/v1/charges", {"limit": 2, "created[gte]": 1})
+        finally:
+            engine.close()
+
+        # Verify every object of every page is returned as a Stripe object
+        self.assertEqual([obj.id for obj in objects], ["ch_3", "ch_2", "ch_1"])
+        self.assertIsInstance(objects[0], stripe.Charge)
+        # Verify the second page starts after the last object of the first page
+        self.assertIn("starting_after=ch_2", engine.urls[1])
+        self.assertIn("created[gte]=1", engine.urls[0])
+
+    def test_list_all_raw_pages(self, mock_aiohttp):
+        """
+        Test that with `raw` the objects of all the pages are returned as plain dicts.
+        """
+        engine = MockEngine()
+        try:
+            objects = engine.run(engine.list_all, "/v1/charges", {"limit": 2}, True)
+        finally:
+            engine.close()
+
+        # Verify every object of every page is returned as a dict
+        self.assertEqual(objects, PAGES[None]["data"] + PAGES["ch_2"]["data"])
+        self.assertIs(type(objects[0]), dict)
+
+    @mock.patch('tap_stripe.asyncio.sleep')
+    def test_rate_limit_retried(self, mock_sleep, mock_aiohttp):
+        """
+        Test that a 429 response is retried.
+        """
+        rate_limited = (json.dumps({"error": {"message": "Too many requests"}}).encode(), 429, {})
+        engine = MockEngine([rate_limited])
+        try:
+            objects = engine.run(engine.list_all, "/v1/charges", {"limit": 2})
+        finally:
+            engine.close()
+
+        # Verify the request is retried once before paginating
+        self.assertEqual(mock_sleep.call_count, 1)
+        self.assertEqual(len(objects), 3)
+
+    def test_error_raised_as_stripe_error(self, mock_aiohttp):
+        """
+        Test that a client error is raised as the Stripe error of the response.
+        """
+        invalid = (json.dumps({"error": {"message": "No such charge", "type": "invalid_request_error"}}).encode(), 400, {})
+        engine = MockEngine([invalid])
+        try:
+            with self.assertRaises(stripe.error.InvalidRequestError):
+                engine.run(engine.list_all, "/v1/charges", {"limit": 2})
+        finally:
+            engine.close()
+
+    def test_windows_fetched_through_engine(self, mock_aiohttp):
+        """
+        Test that the date windows fetched by the engine are yielded in window order.
+        """
+        engine = MockEngine()
+
+        async def fetch_window(window_start, window_stop):
+            return [window_start]
+
+        try:
+            result = list(fetch_date_windows(iter([(0, 10), (10, 20), (20, 30)]), fetch_window, 2, engine))
+        finally:
+            engine.close()
+
+        # Verify the windows are yielded in order with their objects
+        self.assertEqual(result, [(0, 10, [0]), (10, 20, [10]), (20, 30, [20])])
+
+
+@mock.patch('tap_stripe.aiohttp')
+class TestSubStreamListThroughEngine(unittest.TestCase):
+    """
+    Test that the next pages of a list embedded in a parent object are fetched through the engine.
+    """
+
+    def setUp(self):
+        Context.config = {"client_secret": "test_secret", "account_id": "test_account"}
+        stripe.api_key = "test_secret"
+        Context.async_engine = MockEngine()
+
+    def tearDown(self):
+        Context.async_engine.close()
+        Context.async_engine = None
+
+    def test_next_pages_fetched(self, mock_aiohttp):
+        """
+        Test that the pages after the embedded objects are requested by the engine.
+        """
+        object_list = stripe.util.convert_to_stripe_object(PAGES[None], "test_secret", None, "test_account")
+        objects = fetch_object_list_async(object_list)
+
+        # Verify the embedded objects followed by the objects of the next page
+        self.assertEqual([obj.id for obj in objects], ["ch_3", "ch_2", "ch_1"])
+        self.assertEqual(len(Context.async_engine.urls), 1)
+        self.assertIn("/v1/charges?limit=100&starting_after=ch_2", Context.async_engine.urls[0])
+
+    def test_complete_list_not_fetched(self, mock_aiohttp):
+        """
+        Test that a list embedded with all its objects makes no request.
+        """
+        object_list = stripe.util.convert_to_stripe_object(PAGES["ch_2"], "test_secret", None, "test_account")
+
+        # Verify that the embedded objects are returned without a request
+        self.assertEqual([obj.id for obj in fetch_object_list_async(object_list)], ["ch_1"])
+        self.assertEqual(Context.async_engine.urls, [])
+
+    def test_max_objects(self, mock_aiohttp):
+        """
+        Test that the pagination of a list stops past `max_objects`, as a list stuck in a cycle would not stop.
+        """
+        cycle = {"object": "list", "has_more": True, "url": "/v1/charges",
+                 "data": [{"id": "ch_2", "object": "charge", "created": 2}]}
+        Context.async_engine.responses = [(json.dumps(cycle).encode(), 200, {})] * 10
+        objects = Context.async_engine.run(Context.async_engine.list_all, "/v1/charges", {"limit": 1},
+                                           False, False, 3)
+
+        # Verify that the pagination stopped after the object past the maximum
+        self.assertEqual(len(objects), 4)
+
+
+class TestEngineRequirement(unittest.TestCase):
+
+    @mock.patch('tap_stripe.aiohttp', None)
+    def test_missing_aiohttp(self):
+        # Verify that a clear error is raised when aiohttp is not installed
+        with self.assertRaises(Exception) as e:
+            AsyncioEngine()
+        self.assertIn("requires the aiohttp package", str(e.exception))
+
+    def test_encode_params(self):
+        # Verify the params are encoded like the SDK encodes them
+        self.assertEqual(encode_params({"limit": 100, "expand": ["data.refunds"], "created[gte]": 1}),
+                         "limit=100&expand[0]=data.refunds&created[gte]=1")
@@ -0,0 +1,169 @@
+import copy
+import random
+import unittest
+from unittest import mock
+from parameterized import parameterized
+import singer
+from singer import metadata, Transformer
+from singer.transform import SchemaMismatch
+import stripe
+import tap_stripe
+from tap_stripe import CompiledTransformer, Context, StreamPlan, discover, sync_event_update
+
+CATALOG = discover()
+STREAMS = {stream['tap_stream_id']: stream for stream in CATALOG['streams']}
+
+
+def fixture_value(schema, rand, depth=0):
+    """Returns a value for the schema, in any of the shapes the Stripe API or the SDK may return it."""
+    if 'anyOf' in schema:
+        return fixture_value(rand.choice(schema['anyOf']), rand, depth)
+    types = schema.get('type', [])
+    types = types if isinstance(types, list) else [types]
+    if 'null' in types and rand.random() < 0.2:
+        return rand.choice([None, ""])
+    typ = rand.choice([typ for typ in types if typ != 'null'] or ['string'])
+    if schema.get('format') == 'date-time':
+        return rand.choice([rand.randint(0, 2000000000), "2022-01-0{}T00:00:00Z".format(rand.randint(1, 9))])
+    if typ == 'object':
+        value = {key: fixture_value(sub_schema, rand, depth + 1)
+                 for key, sub_schema in schema.get('properties', {}).items()
+                 if depth < 4 and rand.random() < 0.8}
+        # Fields missing from the schema are removed
+        value['not_in_schema'] = 'value'
+        return value
+    if typ == 'array':
+        if depth >= 4 or 'items' not in schema:
+            return []
+        return [fixture_value(schema['items'], rand, depth + 1) for _ in range(rand.randint(0, 2))]
+    if typ == 'integer':
+        return rand.choice([rand.randint(-1000, 1000), "1,000", True])
+    if typ == 'number':
+        return rand.choice([rand.random() * 100, rand.randint(0, 100), "2,000.5"])
+    if typ == 'boolean':
+        return rand.choice([True, False, "false", "true", 0])
+    return rand.choice(["text", 12, 1.5])
+
+
+def fixture_records(stream_name, count=20):
+    rand = random.Random(stream_name)
+    return [fixture_value(STREAMS[stream_name]['schema'], rand) for _ in range(count)]
+
+
+def selected_metadata(stream_name, deselected=()):
+    mdata = metadata.to_map(copy.deepcopy(STREAMS[stream_name]['metadata']))
+    for field_name in STREAMS[stream_name]['schema']['properties']:
+        mdata = metadata.write(mdata, ('properties', field_name), 'selected', field_name not in deselected)
+    return mdata
+
+
+class TestCompiledTransformerConformance(unittest.TestCase):
+    """
+    Test that the `CompiledTransformer` transforms the records the same way as `singer.Transformer`.
+    """
+
+    @parameterized.expand([[stream_name] for stream_name in sorted(STREAMS)])
+    def test_same_records_as_singer(self, stream_name):
+        """
+        Test that the records of every stream are transformed the same way.
+        """
+        schema = STREAMS[stream_name]['schema']
+        deselected = sorted(schema['properties'])[::3]
+        mdata = selected_metadata(stream_name, deselected)
+
+        with Transformer(singer.UNIX_SECONDS_INTEGER_DATETIME_PARSING) as transformer, \
+                CompiledTransformer() as compiled_transformer:
+            for record in fixture_records(stream_name):
+                try:
+                    expected = transformer.transform(copy.deepcopy(record), schema, mdata)
+                except SchemaMismatch:
+                    # Verify that a record not matching the schema raises the same error
+                    with self.assertRaises(SchemaMismatch):
+                        compiled_transformer.transform(copy.deepcopy(record), schema, mdata)
+                    continue
+
+                # Verify that the record is the same
+                self.assertEqual(compiled_transformer.transform(copy.deepcopy(record), schema, mdata), expected)
+
+    def test_nested_field_selection(self):
+        """
+        Test that nested deselected fields are pruned and automatic fields are kept.
+        """
+        schema = {'type': 'object', 'properties': {
+            'id': {'type': 'string'},
+            'address': {'type': ['null', 'object'], 'properties': {'city': {'type': ['null', 'string']},
+                                                                    'line1': {'type': ['null', 'string']}}},
+            'lines': {'type': ['null', 'array'], 'items': {'type': 'object', 'properties': {
+                'id': {'type': 'string'}, 'amount': {'type': 'integer'}}}},
+        }}
+        mdata = {
+            ('properties', 'id'): {'inclusion': 'automatic', 'selected': False},
+            ('properties', 'address', 'properties', 'line1'): {'selected': False},
+            ('properties', 'lines', 'items', 'properties', 'amount'): {'inclusion': 'unsupported'},
+        }
+        record = {'id': 1, 'address': {'city': 'Paris', 'line1': 'Rue'}, 'lines': [{'id': 'il_1', 'amount': '1,0'}]}
+
+        expected = Transformer().transform(copy.deepcopy(record), schema, mdata)
+        result = CompiledTransformer().transform(copy.deepcopy(record), schema, mdata)
+
+        # Verify that the nested fields are pruned the same way as singer
+        self.assertEqual(result, expected)
+        self.assertEqual(result, {'id': '1', 'address': {'city': 'Paris'}, 'lines': [{'id': 'il_1'}]})
+
+
+class TestTrustedTransformer(unittest.TestCase):
+    """
+    Test that the trusted mode only prunes fields and formats date-times.
+    """
+
+    def test_values_not_coerced(self):
+        """
+        Test that the values are passed through while the fields are pruned and the date-times formatted.
+        """
+        schema = {'type': 'object', 'properties': {
+            'amount': {'type': ['null', 'integer']},
+            'created': {'type': ['null', 'string'], 'format': 'date-time'},
+            'metadata': {'type': ['null', 'object'], 'properties': {}},
+        }}
+        record = {'amount': '1,000', 'created': 0, 'metadata': {'key': 'value'}, 'not_in_schema': 1}
+
+        result = CompiledTransformer(trusted=True).transform(record, schema, {})
+
+        # Verify that only the date-time is transformed
+        self.assertEqual(result, {'amount': '1,000', 'created': '1970-01-01T00:00:00.000000Z',
+                                  'metadata': {'key': 'value'}})
+
+
+class TestCompiledOnce(unittest.TestCase):
+    """
+    Test that the schema of a stream is compiled once across the transformers of the events.
+    """
+
+    def setUp(self):
+        Context.transform_mode = 'compiled'
+        schema = copy.deepcopy(STREAMS['charges']['schema'])
+        Context.stream_plans = {'charges': StreamPlan('charges', schema, selected_metadata('charges'), True,
+                                                      'created', 'created', None, [], None, None)}
+        Context.updated_counts = {'charges': 0}
+
+    def tearDown(self):
+        Context.transform_mode = 'singer'
+        Context.stream_plans = {}
+        Context.updated_counts = {}
+
+    @mock.patch('tap_stripe.write_record')
+    @mock.patch('tap_stripe.compile_metadata_filter', wraps=tap_stripe.compile_metadata_filter)
+    def test_compiled_once_per_stream(self, mock_compile_metadata_filter, mock_write_record):
+        """
+        Test that several event updates compile the schema of the stream once.
+        """
+        for index in range(5):
+            event = stripe.util.convert_to_stripe_object(
+                {'id': 'evt_{}'.format(index), 'object': 'event', 'type': 'charge.updated', 'created': 100 + index,
+                 'data': {'object': {'id': 'ch_{}'.format(index), 'object': 'charge', 'created': 10}}},
+                'api_key', None, None)
+            sync_event_update(event, 'charges', False, 0, {}, None)
+
+        # Verify that the records are written and the schema compiled once
+        self.assertEqual(mock_write_record.call_count, 5)
+        self.assertEqual(mock_compile_metadata_filter.call_count, 1)
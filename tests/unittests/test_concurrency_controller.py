@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+from tap_stripe import Context, ConcurrencyController, apply_concurrency_controller_to_client
+
+
+class TestConcurrencyController(unittest.TestCase):
+    """
+    Test that the `ConcurrencyController` raises the limit additively and cuts it multiplicatively.
+    """
+
+    def test_limit_grows_on_success(self):
+        """
+        Test that `limit` successful requests raise the limit by one.
+        """
+        controller = ConcurrencyController(10)
+        controller.limit = 4.0
+        for _ in range(4):
+            controller.release(controller.acquire(), 0.1, 200)
+
+        # Verify that the limit grew by about one request
+        self.assertAlmostEqual(controller.limit, 5.0, delta=0.2)
+
+    def test_limit_is_capped(self):
+        """
+        Test that the limit does not grow above the maximum concurrency.
+        """
+        controller = ConcurrencyController(2)
+        for _ in range(10):
+            controller.release(controller.acquire(), 0.1, 200)
+
+        # Verify that the limit is the maximum concurrency
+        self.assertEqual(controller.limit, 2)
+
+    def test_slow_requests_do_not_grow_limit(self):
+        """
+        Test that the limit stops growing while the latency is high.
+        """
+        controller = ConcurrencyController(10)
+        controller.limit = 4.0
+        controller.release(controller.acquire(), 0.1, 200)
+        limit = controller.limit
+        controller.release(controller.acquire(), 1, 200)
+
+        # Verify that the slow request did not raise the limit
+        self.assertEqual(controller.limit, limit)
+
+    @mock.patch('tap_stripe.LOGGER.info')
+    def test_burst_of_429_cuts_limit_once(self, mock_logger):
+        """
+        Test that the 429s of requests sent under the same limit halve it once.
+        """
+        controller = ConcurrencyController(8)
+        tokens = [controller.acquire() for _ in range(4)]
+        for token in tokens:
+            controller.release(token, 0.1, 429)
+
+        # Verify that the limit is halved once
+        self.assertEqual(controller.limit, 4)
+        # Verify that a request sent under the new limit can cut it again
+        controller.release(controller.acquire(), 0.1, 429)
+        self.assertEqual(controller.limit, 2)
+
+    @mock.patch('tap_stripe.LOGGER.info')
+    def test_limit_never_below_one(self, mock_logger):
+        """
+        Test that the limit is at least one request.
+        """
+        controller = ConcurrencyController(1)
+        controller.release(controller.acquire(), 0.1, 429)
+
+        # Verify that a request can still be sent
+        self.assertTrue(controller.has_slot())
+
+    def test_acquire_waits_for_free_slot(self):
+        """
+        Test that `acquire` blocks until a request in flight is released.
+        """
+        controller = ConcurrencyController(1)
+        token = controller.acquire()
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: (controller.acquire(), acquired.set()))
+        thread.start()
+
+        # Verify that the second request waits for the first one
+        self.assertFalse(acquired.wait(0.05))
+        controller.release(token, 0.1, 200)
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+
+    def test_acquire_async_waits_for_free_slot(self):
+        """
+        Test that `acquire_async` waits for a slot released from another thread.
+        """
+        controller = ConcurrencyController(1)
+        token = controller.acquire()
+        threading.Timer(0.05, controller.release, (token, 0.1, 200)).start()
+
+        # Verify that the slot is taken once released
+        asyncio.run(asyncio.wait_for(controller.acquire_async(), 1))
+        self.assertEqual(controller.in_flight, 1)
+
+
+class TestClientConcurrencyController(unittest.TestCase):
+    """
+    Test that the requests of the Stripe client go through the controller.
+    """
+
+    def tearDown(self):
+        Context.concurrency_controller = None
+
+    @mock.patch('tap_stripe.LOGGER.info')
+    def test_rate_limited_response_cuts_limit(self, mock_logger):
+        """
+        Test that a 429 response of the client lowers the limit.
+        """
+        Context.concurrency_controller = ConcurrencyController(4)
+        client = mock.Mock()
+        client.request.return_value = ('{}', 429, {})
+        apply_concurrency_controller_to_client(client)
+        client.request('get', 'https://api.stripe.com/v1/charges', {})
+
+        # Verify that the limit is halved and the slot is released
+        self.assertEqual(Context.concurrency_controller.limit, 2)
+        self.assertEqual(Context.concurrency_controller.in_flight, 0)
+
+    def test_failed_request_releases_slot(self):
+        """
+        Test that a request raising an error releases its slot.
+        """
+        Context.concurrency_controller = ConcurrencyController(4)
+        client = mock.Mock()
+        client.request.side_effect = Exception('connection error')
+        apply_concurrency_controller_to_client(client)
+
+        with self.assertRaises(Exception):
+            client.request('get', 'https://api.stripe.com/v1/charges', {})
+
+        # Verify that the slot is released and the limit is unchanged
+        self.assertEqual(Context.concurrency_controller.in_flight, 0)
+        self.assertEqual(Context.concurrency_controller.limit, 4)
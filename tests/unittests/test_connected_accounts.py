@@ -0,0 +1,127 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from parameterized import parameterized
+import singer
+from tap_stripe import (AccountScope, CURRENT_ACCOUNT, Context, MESSAGE_LOCK, get_account_ids, increment_count,
+                        submit_in_context, sync_accounts, write_record, write_state)
+
+
+class TestConnectedAccounts(unittest.TestCase):
+    """
+    Test that the connected accounts are synced with their own bookmarks.
+    """
+
+    def setUp(self):
+        Context.config = {'account_id': 'acct_platform'}
+        Context.state = {}
+        Context.stream_concurrency = 1
+        Context.shared_event_scan = False
+
+    @parameterized.expand([
+        ['list', ['acct_1', 'acct_2'], ['acct_1', 'acct_2']],
+        ['string', 'acct_1, acct_2,', ['acct_1', 'acct_2']],
+        ['none', None, []],
+    ])
+    def test_account_ids(self, name, account_ids, expected_account_ids):
+        """
+        Test that the connected accounts are read from a list or a comma separated string.
+        """
+        Context.config['account_ids'] = account_ids
+
+        # Verify the accounts to sync
+        self.assertEqual(get_account_ids(), expected_account_ids)
+
+    def test_account_scope(self):
+        """
+        Test that the state and the account id are the ones of the account synced by the thread.
+        """
+        account_state = {}
+        token = CURRENT_ACCOUNT.set(AccountScope('acct_1', account_state))
+        try:
+            # Verify that the account is used in the scope
+            self.assertIs(Context.state, account_state)
+            self.assertEqual(Context.get_account_id(), 'acct_1')
+        finally:
+            CURRENT_ACCOUNT.reset(token)
+
+        # Verify that the account of the config is used outside of the scope
+        self.assertEqual(Context.state, {})
+        self.assertEqual(Context.get_account_id(), 'acct_platform')
+
+    @parameterized.expand([[1], [2]])
+    @mock.patch('tap_stripe.sync_streams')
+    def test_bookmarks_per_account(self, concurrency, mock_sync_streams):
+        """
+        Test that the bookmarks of every account are kept under the account in the state.
+        """
+        def sync_streams(streams_to_sync, *args):
+            singer.write_bookmark(Context.state, 'charges', 'created', Context.get_account_id())
+        mock_sync_streams.side_effect = sync_streams
+
+        sync_accounts([('charges', False)], ['acct_1', 'acct_2'], concurrency)
+
+        # Verify that every account wrote its own bookmark
+        self.assertEqual(Context.state, {'accounts': {
+            'acct_1': {'bookmarks': {'charges': {'created': 'acct_1'}}},
+            'acct_2': {'bookmarks': {'charges': {'created': 'acct_2'}}},
+        }})
+
+    @mock.patch('tap_stripe.singer.write_state')
+    @mock.patch('tap_stripe.singer.write_record')
+    def test_messages_of_account(self, mock_write_record, mock_write_state):
+        """
+        Test that the records are tagged with the account and the state of all the accounts is written.
+        """
+        Context.state = {'accounts': {'acct_1': {}, 'acct_2': {}}}
+        token = CURRENT_ACCOUNT.set(AccountScope('acct_1', Context.state['accounts']['acct_1']))
+        try:
+            write_record('charges', {'id': 'ch_1'})
+            write_state()
+        finally:
+            CURRENT_ACCOUNT.reset(token)
+
+        # Verify that the record is tagged with its account
+        mock_write_record.assert_called_with('charges', {'id': 'ch_1', 'account_id': 'acct_1'}, time_extracted=None)
+        # Verify that the whole state is written
+        mock_write_state.assert_called_with({'accounts': {'acct_1': {}, 'acct_2': {}}})
+
+    def test_account_of_pool_threads(self):
+        """
+        Test that the functions submitted to a pool of threads sync the account of the caller.
+        """
+        token = CURRENT_ACCOUNT.set(AccountScope('acct_1', {}))
+        try:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                account_id = submit_in_context(executor, Context.get_account_id).result()
+        finally:
+            CURRENT_ACCOUNT.reset(token)
+
+        # Verify that the account is the one of the caller
+        self.assertEqual(account_id, 'acct_1')
+
+    def test_counts_of_accounts(self):
+        """
+        Test that the records counted by the threads of the accounts are all counted.
+        """
+        counts = {'charges': 0}
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for _ in range(4):
+                executor.submit(lambda: [increment_count(counts, 'charges') for _ in range(10000)])
+
+        # Verify that no count is lost
+        self.assertEqual(counts, {'charges': 40000})
+
+    def test_count_under_message_lock(self):
+        """
+        Test that a count is incremented while holding the lock of the messages.
+        """
+        class Counts(dict):
+            def __setitem__(self, key, value):
+                # Verify that the lock is held by the thread counting
+                assert MESSAGE_LOCK._is_owned()  # pylint: disable=protected-access
+                super().__setitem__(key, value)
+
+        counts = Counts(charges=0)
+        increment_count(counts, 'charges')
+        self.assertEqual(counts, {'charges': 1})
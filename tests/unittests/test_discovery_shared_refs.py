@@ -0,0 +1,34 @@
+import unittest
+from unittest import mock
+import singer
+from tap_stripe import discover, load_schemas, load_shared_schema_refs, STREAM_SDK_OBJECTS
+
+
+class TestDiscoverySharedRefs(unittest.TestCase):
+    """
+    Test that discovery loads the shared schemas once for all the streams.
+    """
+
+    @mock.patch('tap_stripe.load_shared_schema_refs', wraps=load_shared_schema_refs)
+    def test_shared_refs_loaded_once(self, mock_load_shared_schema_refs):
+        """
+        Test that the shared schemas are read once.
+        """
+        discover()
+
+        # Verify that the shared schema files are read once
+        self.assertEqual(mock_load_shared_schema_refs.call_count, 1)
+
+    def test_same_schemas_as_resolving_each_stream(self):
+        """
+        Test that the schemas are the same as when the shared schemas are loaded for every stream.
+        """
+        raw_schemas = load_schemas()
+        expected = {stream_name: singer.resolve_schema_references(raw_schemas[stream_name]['schema'],
+                                                                   load_shared_schema_refs())
+                    for stream_name in STREAM_SDK_OBJECTS}
+
+        catalog = discover()
+
+        # Verify that every stream has the same schema
+        self.assertEqual({entry['tap_stream_id']: entry['schema'] for entry in catalog['streams']}, expected)
@@ -0,0 +1,95 @@
+import unittest
+from unittest import mock
+from parameterized import parameterized
+from tap_stripe import Context, EmptyRangeProbe, ListData
+
+DAY = 24 * 60 * 60
+
+
+def get_list_page(created_times):
+    """
+    Returns a `request_raw_page` mock listing the newest object of the range, as `limit=1` does.
+    """
+    def request_raw_page(requestor, url, params):
+        page = ListData({'id': 'ch_{}'.format(created), 'created': created}
+                        for created in sorted(created_times, reverse=True)
+                        if params['created[gte]'] <= created < params['created[lt]'])
+        return ListData(page[:params['limit']])
+    return request_raw_page
+
+
+class TestEmptyRangeProbe(unittest.TestCase):
+    """
+    Test that `EmptyRangeProbe` finds the populated ranges of a stream.
+    """
+
+    def setUp(self):
+        Context.config = {'account_id': 'acct_1'}
+        Context.state = {}
+
+    @mock.patch('tap_stripe.request_raw_page')
+    def test_populated_ranges(self, mock_request_raw_page):
+        """
+        Test that the ranges without objects are found by bisecting up to the size of a window.
+        """
+        mock_request_raw_page.side_effect = get_list_page([5 * DAY, 100 * DAY + 1, 101 * DAY])
+        probe = EmptyRangeProbe('charges', 'charges', 'created', 30 * DAY)
+        probe.plan(0, 1000 * DAY)
+
+        # Verify that the populated ranges end at their newest object
+        self.assertEqual(probe.populated, [[0, 5 * DAY + 1], [303 * DAY // 4, 101 * DAY + 1]])
+        # Verify that the windows without objects are skipped
+        self.assertTrue(probe.is_empty(200 * DAY, 230 * DAY))
+        self.assertFalse(probe.is_empty(90 * DAY, 120 * DAY))
+        # Verify that the windows out of the probed range are requested
+        self.assertFalse(probe.is_empty(1000 * DAY, 1030 * DAY))
+
+    @mock.patch('tap_stripe.request_raw_page')
+    def test_empty_stream(self, mock_request_raw_page):
+        """
+        Test that a stream without objects is probed with a single request.
+        """
+        mock_request_raw_page.side_effect = get_list_page([])
+        probe = EmptyRangeProbe('disputes', 'disputes', 'created', 30 * DAY)
+        probe.plan(0, 1000 * DAY)
+
+        # Verify that every window is skipped after one probe
+        self.assertEqual((probe.populated, probe.probe_count), ([], 1))
+        self.assertTrue(probe.is_empty(0, 30 * DAY))
+
+    @mock.patch('tap_stripe.request_raw_page')
+    def test_resume_from_state(self, mock_request_raw_page):
+        """
+        Test that the ranges saved in the state are reused and only the range created since is probed.
+        """
+        mock_request_raw_page.side_effect = get_list_page([5 * DAY, 500 * DAY])
+        probe = EmptyRangeProbe('charges', 'charges', 'created', 30 * DAY)
+        probe.plan(0, 400 * DAY)
+        mock_request_raw_page.reset_mock()
+
+        probe = EmptyRangeProbe('charges', 'charges', 'created', 30 * DAY)
+        probe.plan(DAY, 600 * DAY)
+
+        # Verify that the range before the previous stop is not probed again
+        self.assertTrue(all(params['created[gte]'] >= 400 * DAY - 600
+                            for (_, _, params), _ in mock_request_raw_page.call_args_list))
+        self.assertEqual(probe.populated[0], [DAY, 5 * DAY + 1])
+        self.assertEqual(probe.populated[-1][1], 500 * DAY + 1)
+
+    @parameterized.expand([
+        ['single_window', 30 * DAY, False],
+        ['several_windows', 31 * DAY, True],
+    ])
+    @mock.patch('tap_stripe.request_raw_page')
+    def test_single_window_not_probed(self, name, stop, expected_probed, mock_request_raw_page):
+        """
+        Test that a range of a single window is requested without being probed.
+        """
+        mock_request_raw_page.side_effect = get_list_page([])
+        Context.state = {'bookmarks': {'charges': {'probed_ranges': {'start': 0, 'stop': 1, 'populated': []}}}}
+        probe = EmptyRangeProbe('charges', 'charges', 'created', 30 * DAY)
+        probe.plan(0, stop)
+
+        # Verify whether the range is probed and the stale probed ranges dropped
+        self.assertEqual(mock_request_raw_page.called, expected_probed)
+        self.assertEqual('probed_ranges' in Context.state['bookmarks']['charges'], expected_probed)
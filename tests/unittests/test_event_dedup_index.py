@@ -0,0 +1,75 @@
+import os
+import unittest
+from unittest import mock
+from tap_stripe import EventDedupIndex
+
+
+class TestEventDedupIndex(unittest.TestCase):
+    """
+    Test that the `EventDedupIndex` maps the object ids to their latest event like a dict.
+    """
+
+    def test_same_as_dict(self):
+        """
+        Test that the index returns the same values as a dict after many updates.
+        """
+        index = EventDedupIndex()
+        expected = {}
+        for i in range(5000):
+            object_id = 'ch_{}'.format(i % 3000)
+            index[object_id] = i
+            expected[object_id] = i
+
+        # Verify that every id has its latest value and missing ids have none
+        self.assertEqual(len(index), 3000)
+        self.assertTrue(all(index.get(object_id) == created for object_id, created in expected.items()))
+        self.assertIsNone(index.get('ch_missing'))
+
+    def test_compact_memory(self):
+        """
+        Test that an id takes at most 48 bytes in memory.
+        """
+        index = EventDedupIndex()
+        for i in range(10000):
+            index['cus_{}'.format(i)] = 1600000000 + i
+
+        # Verify the memory footprint of the index
+        self.assertLessEqual(index.memory_bytes(), 10000 * 48)
+
+    @mock.patch('tap_stripe.LOGGER.info')
+    def test_spill_to_disk(self, mock_logger):
+        """
+        Test that the ids are spilled to disk past the memory limit and still found.
+        """
+        index = EventDedupIndex(max_memory_bytes=32 * 1024)
+        for i in range(5000):
+            index['po_{}'.format(i)] = i
+        index['po_1'] = 10000
+
+        # Verify that the memory stays under the limit and the ids are found on disk
+        self.assertLessEqual(index.memory_bytes(), 32 * 1024)
+        self.assertGreater(index.spilled, 0)
+        self.assertEqual(index.get('po_4000'), 4000)
+        self.assertEqual(index.get('po_1'), 10000)
+        self.assertIsNone(index.get('po_missing'))
+
+        store_dir = index.finalizer.peek()[2][1]
+        index.close()
+
+        # Verify that the file is removed once closed
+        self.assertFalse(os.path.exists(store_dir))
+
+    @mock.patch('tap_stripe.metrics.log')
+    def test_memory_reported(self, mock_log):
+        """
+        Test that the memory footprint is reported as a metric.
+        """
+        index = EventDedupIndex()
+        index['ch_1'] = 1
+        index.log_metrics('charges')
+
+        point = mock_log.call_args[0][1]
+        # Verify the metric of the index
+        self.assertEqual(point.metric, 'event_dedup_index_bytes')
+        self.assertEqual(point.value, index.memory_bytes())
+        self.assertEqual(point.tags, {'stream': 'charges', 'ids': 1, 'spilled_ids': 0})
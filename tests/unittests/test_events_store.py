@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from tap_stripe import Context, EventsStore, IMMUTABLE_STREAM_LOOKBACK
+
+NOW = 1700000000
+
+
+def get_event(event_id, created, event_type='charge.updated'):
+    return {'id': event_id, 'object': 'event', 'created': created, 'type': event_type,
+            'data': {'object': {'id': 'in_1', 'object': 'invoice',
+                                'lines': {'object': 'list', 'data': [], 'has_more': True,
+                                          'url': '/v1/invoices/in_1/lines'}}}}
+
+
+class TestEventsStore(unittest.TestCase):
+    """
+    Test that `EventsStore` only fetches the events missing from the store.
+    """
+
+    def setUp(self):
+        Context.config = {'account_id': 'acct_1'}
+        self.store_dir = tempfile.mkdtemp()
+        self.store = EventsStore(os.path.join(self.store_dir, 'events.db'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.store_dir)
+
+    @mock.patch('tap_stripe.request_raw_page')
+    def test_fill_missing_ranges(self, mock_request_raw_page):
+        """
+        Test that the events already in the store are not fetched again.
+        """
+        mock_request_raw_page.return_value = {'data': [], 'has_more': False}
+        self.store.fill(NOW - 1000, NOW)
+        self.store.fill(NOW - 2000, NOW + 100)
+
+        ranges = [(params['created[gte]'], params['created[lt]'])
+                  for (_, _, params), _ in mock_request_raw_page.call_args_list]
+        # Verify that only the older events and the events since the last fill are fetched
+        self.assertEqual(ranges, [(NOW - 1000, NOW),
+                                  (NOW - 2000, NOW - 1000),
+                                  (NOW - IMMUTABLE_STREAM_LOOKBACK, NOW + 100)])
+
+    @mock.patch('tap_stripe.request_raw_page')
+    def test_fill_pages(self, mock_request_raw_page):
+        """
+        Test that the pages of events are fetched after the last event of the previous page.
+        """
+        mock_request_raw_page.side_effect = [{'data': [get_event('evt_2', NOW - 10)], 'has_more': True},
+                                             {'data': [get_event('evt_1', NOW - 20)], 'has_more': False}]
+        self.store.fill(NOW - 100, NOW)
+
+        # Verify that the second page starts after the first page
+        self.assertEqual(mock_request_raw_page.call_args[0][2]['starting_after'], 'evt_2')
+        # Verify that the events are stored
+        self.assertEqual([event.id for event in self.store.iter_events(NOW - 100, NOW)], ['evt_2', 'evt_1'])
+
+    @mock.patch('tap_stripe.EventsStore.page_size', 2)
+    @mock.patch('tap_stripe.request_raw_page')
+    def test_iter_events(self, mock_request_raw_page):
+        """
+        Test that the events of the window and type are read newest first.
+        """
+        mock_request_raw_page.return_value = {'data': [
+            get_event('evt_5', NOW - 10), get_event('evt_4', NOW - 20), get_event('evt_3', NOW - 20),
+            get_event('evt_2', NOW - 30, 'customer.updated'), get_event('evt_1', NOW - 40),
+        ], 'has_more': False}
+        self.store.fill(NOW - 100, NOW)
+
+        events = list(self.store.iter_events(NOW - 40, NOW - 10, 'charge.*'))
+        # Verify the events of the window and of the type across pages
+        self.assertEqual([event.id for event in events], ['evt_4', 'evt_3', 'evt_1'])
+        # Verify that the lists of the objects can still be paginated
+        self.assertEqual(events[0].data.object.lines.url, '/v1/invoices/in_1/lines')
+
+    @mock.patch('tap_stripe.request_raw_page')
+    def test_events_per_account(self, mock_request_raw_page):
+        """
+        Test that the events of an account are not read for another account.
+        """
+        mock_request_raw_page.return_value = {'data': [get_event('evt_1', NOW - 10)], 'has_more': False}
+        self.store.fill(NOW - 100, NOW)
+        Context.config = {'account_id': 'acct_2'}
+
+        # Verify that the other account has no events
+        self.assertEqual(list(self.store.iter_events(NOW - 100, NOW)), [])
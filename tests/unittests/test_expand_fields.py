@@ -0,0 +1,93 @@
+import unittest
+from unittest import mock
+from parameterized import parameterized
+import stripe
+from tap_stripe import Context, StreamPlan, get_selected_expand_fields, get_list_params, paginate
+
+
+class TestSelectedExpandFields(unittest.TestCase):
+    """
+    Test that only the expansions of the fields written are requested.
+    """
+
+    @parameterized.expand([
+        ['all_selected', {}, ['data.sources', 'data.subscriptions', 'data.tax_ids']],
+        ['deselected', {('properties', 'sources'): {'selected': False}}, ['data.subscriptions', 'data.tax_ids']],
+        ['unsupported', {('properties', 'tax_ids'): {'inclusion': 'unsupported'}}, ['data.sources', 'data.subscriptions']],
+        ['automatic', {('properties', 'sources'): {'inclusion': 'automatic', 'selected': False}},
+         ['data.sources', 'data.subscriptions', 'data.tax_ids']],
+    ])
+    def test_deselected_fields_not_expanded(self, name, mdata, expected_fields):
+        """
+        Test that the fields pruned by the field selection are not expanded.
+        """
+        # Verify the expanded fields
+        self.assertEqual(get_selected_expand_fields('customers', mdata), expected_fields)
+
+    def test_nested_field_selection(self):
+        """
+        Test that a nested expansion is dropped when its parent or itself is deselected.
+        """
+        # Verify that the nested field and its parent are both checked
+        self.assertEqual(get_selected_expand_fields('subscriptions', {('properties', 'plan'): {'selected': False}}), [])
+        self.assertEqual(get_selected_expand_fields(
+            'subscriptions', {('properties', 'plan', 'properties', 'tiers'): {'selected': False}}), [])
+        self.assertEqual(get_selected_expand_fields('subscriptions', {}), ['data.plan.tiers'])
+
+    @mock.patch('tap_stripe.LOGGER.info')
+    def test_whitelist_prunes_expansions(self, mock_logger):
+        """
+        Test that with a whitelist only the expansions a breadcrumb goes through are requested.
+        """
+        whitelist = [['sources', 'id'], ['tax_ids']]
+
+        # Verify the expanded fields and that every decision is logged
+        self.assertEqual(get_selected_expand_fields('customers', {}, whitelist, log=True),
+                         ['data.sources', 'data.tax_ids'])
+        mock_logger.assert_any_call('Not expanding %s for stream %s as %s.', 'data.subscriptions', 'customers',
+                                    'the field is not in the whitelist')
+        self.assertEqual(mock_logger.call_count, 3)
+
+    @parameterized.expand([
+        ['data_field', [['data']]],
+        ['nested_in_data_field', [['data', 'sources', 'id'], ['data', 'tax_ids']]],
+    ])
+    def test_whitelist_of_data_field(self, name, whitelist):
+        """
+        Test that the breadcrumbs of a field named `data` do not match the `data.` prefix of the list expansions.
+        """
+        # Verify that no field is expanded
+        self.assertEqual(get_selected_expand_fields('customers', {}, whitelist), [])
+
+
+class TestListRequestExpand(unittest.TestCase):
+    """
+    Test that the list requests expand the fields of the plan of the stream.
+    """
+
+    def tearDown(self):
+        Context.stream_plans = {}
+
+    def test_expand_of_plan(self):
+        """
+        Test that the expand of the plan is requested during a sync, and all the fields otherwise.
+        """
+        # Verify that all the fields are expanded without a plan
+        self.assertEqual(get_list_params('created', 0, 1, 'charges')['expand'], ['data.refunds'])
+
+        Context.stream_plans = {'charges': StreamPlan(*([None] * 7), expand=[], parent=None, sub_stream=None)}
+
+        # Verify that the fields of the plan are expanded
+        self.assertEqual(get_list_params('created', 0, 1, 'charges')['expand'], [])
+
+    @mock.patch('tap_stripe.stripe.Charge.list')
+    def test_sdk_pagination_uses_plan(self, mock_list):
+        """
+        Test that the SDK list requests expand the fields of the plan.
+        """
+        Context.config = {'account_id': 'acct_1'}
+        Context.stream_plans = {'charges': StreamPlan(*([None] * 7), expand=[], parent=None, sub_stream=None)}
+        list(paginate(stripe.Charge, 'created', 0, 1, 'charges'))
+
+        # Verify that no field is expanded
+        self.assertEqual(mock_list.call_args[1]['expand'], [])
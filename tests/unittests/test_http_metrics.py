@@ -0,0 +1,100 @@
+import unittest
+from unittest import mock
+from parameterized import parameterized
+import stripe
+from tap_stripe import HttpMetrics, apply_request_timer_to_client, get_endpoint_template, get_response_size
+
+
+class TestEndpointTemplate(unittest.TestCase):
+    """
+    Test that the requests are grouped by endpoint.
+    """
+
+    @parameterized.expand([
+        ['list', 'https://api.stripe.com/v1/customers?limit=100&created%5Bgte%5D=1', 'GET /v1/customers'],
+        ['sub_resource', 'https://api.stripe.com/v1/invoices/in_1MtHbE/lines?limit=100', 'GET /v1/invoices/{id}/lines'],
+        ['singleton', 'https://api.stripe.com/v1/balance/history?payout=po_1', 'GET /v1/balance/history'],
+        ['resource_with_underscore', 'https://api.stripe.com/v1/balance_transactions', 'GET /v1/balance_transactions'],
+        ['expand', 'http://127.0.0.1:8080/v1/customers?expand%5B1%5D=data.tax_ids&expand%5B0%5D=data.sources',
+         'GET /v1/customers?expand=data.sources,data.tax_ids'],
+    ])
+    def test_endpoint_template(self, name, url, expected_template):
+        """
+        Test that the ids are replaced and the expanded fields are kept.
+        """
+        # Verify the endpoint of the url
+        self.assertEqual(get_endpoint_template('get', url), expected_template)
+
+    def test_response_size(self):
+        """
+        Test that the size of a response is its content length when the header is set.
+        """
+        # Verify that the content length of a compressed response is used
+        self.assertEqual(get_response_size(b'{"data": []}', {'content-length': '5'}), 5)
+        # Verify that the length of the body is used otherwise
+        self.assertEqual(get_response_size(b'{"data": []}', {}), 12)
+
+
+class TestHttpMetrics(unittest.TestCase):
+    """
+    Test that `HttpMetrics` collects the attempts, the retries and the latencies of every endpoint.
+    """
+
+    def test_retry_of_last_request(self):
+        """
+        Test that a retry is recorded for the last request of the thread.
+        """
+        http_metrics = HttpMetrics()
+        http_metrics.record_attempt('GET /v1/charges', 0.1, 429, 100)
+        http_metrics.record_retry(2.0)
+        http_metrics.record_attempt('GET /v1/charges', 0.2, 200, 1000)
+
+        stats = http_metrics.endpoints['GET /v1/charges']
+        # Verify that the attempts, their status codes and the retry are recorded
+        self.assertEqual((stats.attempts, stats.retries, stats.sleep_seconds, stats.bytes_received),
+                         (2, 1, 2.0, 1100))
+        self.assertEqual(stats.status_codes, {429: 1, 200: 1})
+
+    @mock.patch('tap_stripe.metrics.log')
+    @mock.patch('tap_stripe.LOGGER.info')
+    def test_summary_percentiles(self, mock_info, mock_log):
+        """
+        Test that the percentiles of the latencies are emitted as metrics.
+        """
+        http_metrics = HttpMetrics()
+        for latency in range(100, 0, -1):
+            http_metrics.record_attempt('GET /v1/charges', latency / 1000, 200, 10)
+        http_metrics.log_summary()
+
+        values = {point.metric: point.value for (_, point), _ in mock_log.call_args_list}
+        # Verify the nearest rank percentiles of the latencies
+        self.assertEqual((values['http_request_duration_p50'], values['http_request_duration_p95'],
+                          values['http_request_duration_p99']), (0.05, 0.095, 0.099))
+        # Verify the counters
+        self.assertEqual((values['http_request_attempts'], values['http_request_retries'],
+                          values['http_bytes_received'], values['http_responses']), (100, 0, 1000, 100))
+
+
+class TestRequestTimer(unittest.TestCase):
+    """
+    Test that the requests of the Stripe client are recorded.
+    """
+
+    @mock.patch('tap_stripe.HTTP_METRICS')
+    def test_failed_attempt_and_retry(self, mock_http_metrics):
+        """
+        Test that a connection error is recorded as an errored attempt followed by a retry.
+        """
+        client = stripe.http_client.RequestsClient()
+        client.request = mock.Mock(side_effect=stripe.error.APIConnectionError('reset', should_retry=True))
+        apply_request_timer_to_client(client)
+
+        with self.assertRaises(stripe.error.APIConnectionError):
+            client.request('get', 'https://api.stripe.com/v1/charges/ch_1', {})
+        sleep_seconds = client._sleep_time_seconds(1)  # pylint: disable=protected-access
+
+        # Verify that the attempt is recorded with an error status
+        endpoint, _, status_code, bytes_received = mock_http_metrics.record_attempt.call_args[0]
+        self.assertEqual((endpoint, status_code, bytes_received), ('GET /v1/charges/{id}', 'error', 0))
+        # Verify that the sleep before the retry is recorded
+        mock_http_metrics.record_retry.assert_called_with(sleep_seconds)
@@ -0,0 +1,70 @@
+import unittest
+from unittest import mock
+import stripe
+from stripe.api_resources.list_object import ListObject
+from tap_stripe import Context, LazyStripeObject, StreamPlan, paginate
+
+INVOICE = {'id': 'in_1', 'object': 'invoice', 'created': 1700000000,
+           'customer': {'id': 'cus_1', 'object': 'customer'},
+           'lines': {'object': 'list', 'data': [{'id': 'il_1', 'object': 'line_item'}], 'has_more': True,
+                     'total_count': 12, 'url': '/v1/invoices/in_1/lines'}}
+
+
+class TestLazyStripeObject(unittest.TestCase):
+    """
+    Test that `LazyStripeObject` only converts the fields read.
+    """
+
+    def setUp(self):
+        Context.config = {'account_id': 'acct_1'}
+
+    @mock.patch('tap_stripe.stripe.util.convert_to_stripe_object', wraps=stripe.util.convert_to_stripe_object)
+    def test_fields_read(self, mock_convert):
+        """
+        Test that the replication key and the child list are read without converting the other fields.
+        """
+        parent = LazyStripeObject(INVOICE)
+
+        # Verify the replication key and the fields of the parent
+        self.assertEqual((parent['created'], parent.id, parent.get('paid', False)), (1700000000, 'in_1', False))
+        self.assertIn('lines', parent)
+        # Verify that the child list can be paginated with the account of the parent
+        self.assertIsInstance(parent.lines, ListObject)
+        self.assertEqual((parent.lines.url, parent.lines.total_count, parent.lines.stripe_account),
+                         ('/v1/invoices/in_1/lines', 12, 'acct_1'))
+        # Verify that the expanded customer is not converted
+        self.assertNotIn(INVOICE['customer'], [call[0][0] for call in mock_convert.call_args_list])
+
+    def test_missing_attribute(self):
+        """
+        Test that a missing field raises an AttributeError, as for a StripeObject.
+        """
+        with self.assertRaises(AttributeError):
+            LazyStripeObject(INVOICE).reversals
+
+
+class TestPaginateParent(unittest.TestCase):
+    """
+    Test that the parents of a selected sub stream are paginated as lazy views.
+    """
+
+    def setUp(self):
+        Context.config = {'account_id': 'acct_1'}
+
+    def tearDown(self):
+        Context.stream_plans = {}
+
+    @mock.patch('tap_stripe.stripe.Invoice.list')
+    @mock.patch('tap_stripe.request_raw_page', return_value={'data': [INVOICE], 'has_more': False})
+    def test_parent_not_selected(self, mock_request_raw_page, mock_list):
+        """
+        Test that a parent stream that is not selected is paginated as lazy views.
+        """
+        Context.stream_plans = {'invoices': StreamPlan(*([None] * 7), expand=[], parent=None,
+                                                       sub_stream='invoice_line_items')}
+        parents = list(paginate(stripe.Invoice, 'created', 0, 1, 'invoices'))
+
+        # Verify that the parents are not built by the SDK
+        mock_list.assert_not_called()
+        self.assertEqual([type(parent) for parent in parents], [LazyStripeObject])
+        self.assertEqual(mock_request_raw_page.call_args[0][2]['created[gte]'], 0)
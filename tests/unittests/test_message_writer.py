@@ -0,0 +1,112 @@
+import decimal
+import io
+import json
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+import singer
+from tap_stripe import Context, MessageWriter, encode_message, write_record, write_state
+
+
+class TestMessageWriter(unittest.TestCase):
+    """
+    Test that the `MessageWriter` buffers the messages and flushes them in order.
+    """
+
+    def test_records_buffered_until_state(self):
+        """
+        Test that the records are written along with the next state.
+        """
+        output = io.StringIO()
+        writer = MessageWriter(1024 * 1024, flush_interval=60, output=output)
+        writer.write_record('charges', {'id': 'ch_1'})
+        writer.write_record('charges', {'id': 'ch_2'})
+
+        # Verify that nothing is written before the state
+        self.assertEqual(output.getvalue(), '')
+
+        writer.write_state({'bookmarks': {'charges': {'created': 1}}})
+        messages = [json.loads(line) for line in output.getvalue().splitlines()]
+
+        # Verify that the records are written before their state
+        self.assertEqual([message['type'] for message in messages], ['RECORD', 'RECORD', 'STATE'])
+        self.assertEqual(messages[2]['value'], {'bookmarks': {'charges': {'created': 1}}})
+
+    def test_flush_on_size(self):
+        """
+        Test that the buffer is written when it is full.
+        """
+        output = io.StringIO()
+        writer = MessageWriter(10, flush_interval=60, output=output)
+        writer.write_record('charges', {'id': 'ch_1'})
+
+        # Verify that the record is written
+        self.assertEqual(json.loads(output.getvalue())['record'], {'id': 'ch_1'})
+
+    @mock.patch('tap_stripe.time.monotonic')
+    def test_flush_on_time(self, mock_monotonic):
+        """
+        Test that the buffer is written when it is older than the flush interval.
+        """
+        mock_monotonic.side_effect = [0, 0.5, 2, 2]
+        output = io.StringIO()
+        writer = MessageWriter(1024, flush_interval=1, output=output)
+        writer.write_record('charges', {'id': 'ch_1'})
+
+        # Verify that nothing is written within the interval
+        self.assertEqual(output.getvalue(), '')
+
+        writer.write_record('charges', {'id': 'ch_2'})
+
+        # Verify that both records are written after the interval
+        self.assertEqual(len(output.getvalue().splitlines()), 2)
+
+    def test_same_messages_as_singer(self):
+        """
+        Test that the messages are the same as the ones written by singer.
+        """
+        time_extracted = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        record = {'id': 'ch_1', 'amount': 100, 'paid': True, 'metadata': {'key': 'é'}}
+        output = io.StringIO()
+        writer = MessageWriter(1, output=output)
+        writer.write_record('charges', record, time_extracted)
+
+        expected = singer.format_message(singer.RecordMessage('charges', record, time_extracted=time_extracted))
+
+        # Verify that the message is the same
+        self.assertEqual(json.loads(output.getvalue()), json.loads(expected))
+
+    def test_decimal_encoded_as_singer(self):
+        """
+        Test that a value the fast encoders do not support is encoded by singer.
+        """
+        line = encode_message({'type': 'RECORD', 'stream': 'charges', 'record': {'amount': decimal.Decimal('1.10')}})
+
+        # Verify that the decimal is written as a number
+        self.assertEqual(line, b'{"type": "RECORD", "stream": "charges", "record": {"amount": 1.10}}\n')
+
+
+class TestWriteMessages(unittest.TestCase):
+    """
+    Test that the messages go through the message writer when it is configured.
+    """
+
+    def tearDown(self):
+        Context.message_writer = None
+
+    @mock.patch('singer.write_state')
+    @mock.patch('singer.write_record')
+    def test_messages_written_by_writer(self, mock_write_record, mock_write_state):
+        """
+        Test that the records and states are written by the message writer.
+        """
+        Context.message_writer = mock.Mock()
+        Context.state = {'bookmarks': {}}
+        write_record('charges', {'id': 'ch_1'})
+        write_state()
+
+        # Verify that singer does not write the messages
+        self.assertEqual(mock_write_record.call_count, 0)
+        self.assertEqual(mock_write_state.call_count, 0)
+        Context.message_writer.write_record.assert_called_with('charges', {'id': 'ch_1'}, None)
+        Context.message_writer.write_state.assert_called_with({'bookmarks': {}})
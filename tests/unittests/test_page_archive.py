@@ -0,0 +1,146 @@
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from parameterized import parameterized
+from tap_stripe import ArchiveReplay, Context, PageArchive, apply_page_archive_to_client
+
+API_BASE = 'https://api.stripe.com'
+ACCOUNT_HEADERS = {'Stripe-Account': 'acct_1'}
+
+
+def get_page(objects, has_more=False):
+    return json.dumps({'object': 'list', 'data': objects, 'has_more': has_more, 'url': '/v1/events'}).encode()
+
+
+def get_event(event_id, created, event_type='charge.updated'):
+    return {'id': event_id, 'object': 'event', 'created': created, 'type': event_type}
+
+
+class TestArchiveReplay(unittest.TestCase):
+    """
+    Test that the requests of a replay are answered from the archived responses.
+    """
+
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        Context.page_archive = PageArchive(self.archive_dir)
+        client = mock.Mock()
+        client.request.side_effect = [
+            (get_page([get_event('evt_4', 40), get_event('evt_3', 30, 'customer.updated')], True), 200, {}),
+            (get_page([get_event('evt_2', 20), get_event('evt_1', 10)]), 200, {}),
+            (json.dumps({'id': 'acct_1', 'object': 'account'}).encode(), 200, {}),
+            (json.dumps({'error': {'type': 'api_error'}}).encode(), 500, {}),
+        ]
+        apply_page_archive_to_client(client)
+        client.request('get', API_BASE + '/v1/events?limit=2&created[gte]=0&created[lt]=100', ACCOUNT_HEADERS)
+        client.request('get', API_BASE + '/v1/events?limit=2&created[gte]=0&created[lt]=100&starting_after=evt_3',
+                       ACCOUNT_HEADERS)
+        client.request('get', API_BASE + '/v1/accounts/acct_1', ACCOUNT_HEADERS)
+        client.request('get', API_BASE + '/v1/charges?limit=100', ACCOUNT_HEADERS)
+        Context.page_archive.close()
+        Context.page_archive = None
+        self.replay = ArchiveReplay(self.archive_dir)
+
+    def tearDown(self):
+        self.replay.close()
+        shutil.rmtree(self.archive_dir)
+
+    def get_ids(self, url, headers=None):
+        body, status_code, _ = self.replay.request(API_BASE + url, headers or ACCOUNT_HEADERS)
+        self.assertEqual(status_code, 200)
+        page = json.loads(body)
+        return [obj['id'] for obj in page['data']], page['has_more']
+
+    @parameterized.expand([
+        ['page_size', '/v1/events?limit=3&created[gte]=0&created[lt]=100', (['evt_4', 'evt_3', 'evt_2'], True)],
+        ['next_page', '/v1/events?limit=3&created[gte]=0&created[lt]=100&starting_after=evt_2', (['evt_1'], False)],
+        ['window', '/v1/events?limit=100&created[gte]=20&created[lt]=40', (['evt_3', 'evt_2'], False)],
+        ['type', '/v1/events?limit=100&created[gte]=0&created[lt]=100&type=charge.*',
+         (['evt_4', 'evt_2', 'evt_1'], False)],
+    ])
+    def test_list_pages(self, name, url, expected_page):
+        """
+        Test that the list requests are paged and filtered from the archived objects.
+        """
+        # Verify the objects of the page and whether the list has more pages
+        self.assertEqual(self.get_ids(url), expected_page)
+
+    def test_other_account(self):
+        """
+        Test that the objects of an account are not listed for another account.
+        """
+        body, status_code, _ = self.replay.request(API_BASE + '/v1/events?limit=100', {'Stripe-Account': 'acct_2'})
+
+        # Verify that the list is not in the archive for the other account
+        self.assertEqual(status_code, 404)
+        self.assertIn('not in the archive', json.loads(body)['error']['message'])
+
+    def test_archived_response(self):
+        """
+        Test that the other requests are answered with their archived response and the errors are not archived.
+        """
+        body, status_code, _ = self.replay.request(API_BASE + '/v1/accounts/acct_1', ACCOUNT_HEADERS)
+
+        # Verify the archived response
+        self.assertEqual((json.loads(body)['id'], status_code), ('acct_1', 200))
+        # Verify that the error response is not archived
+        self.assertEqual(self.replay.request(API_BASE + '/v1/charges?limit=100', ACCOUNT_HEADERS)[1], 404)
+
+    def test_replay_without_network(self):
+        """
+        Test that the requests of the client are answered from the archive during a replay.
+        """
+        client = mock.Mock()
+        request_stream = client.request_stream
+        apply_page_archive_to_client(client)
+        Context.archive_replay = self.replay
+        try:
+            body, status_code, _ = client.request_stream('get', API_BASE + '/v1/events?limit=1', ACCOUNT_HEADERS)
+        finally:
+            Context.archive_replay = None
+
+        # Verify that the stream of the page is read from the archive
+        self.assertEqual((json.loads(body.read())['data'][0]['id'], status_code), ('evt_4', 200))
+        request_stream.assert_not_called()
+
+
+class TestReplayFieldSelection(unittest.TestCase):
+    """
+    Test that a sync recorded with an expanded field is replayed with the field deselected.
+    """
+
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        Context.page_archive = PageArchive(self.archive_dir)
+        customer = {'id': 'cus_1', 'object': 'customer', 'created': 10,
+                    'subscriptions': {'object': 'list', 'data': [{'id': 'sub_1', 'object': 'subscription'}]}}
+        client = mock.Mock()
+        client.request.return_value = (json.dumps({'object': 'list', 'data': [customer], 'has_more': False,
+                                                   'url': '/v1/customers'}).encode(), 200, {})
+        apply_page_archive_to_client(client)
+        client.request('get', API_BASE + '/v1/customers?limit=100&created[gte]=0&created[lt]=100'
+                       '&expand[0]=data.sources&expand[1]=data.subscriptions', ACCOUNT_HEADERS)
+        Context.page_archive.close()
+        Context.page_archive = None
+        self.replay = ArchiveReplay(self.archive_dir)
+
+    def tearDown(self):
+        self.replay.close()
+        shutil.rmtree(self.archive_dir)
+
+    @parameterized.expand([
+        ['deselected', '&expand[0]=data.sources'],
+        ['none_selected', ''],
+    ])
+    def test_deselected_expand(self, name, expand):
+        """
+        Test that the list requests without the deselected expansion are answered with the archived objects.
+        """
+        body, status_code, _ = self.replay.request(
+            API_BASE + '/v1/customers?limit=100&created[gte]=0&created[lt]=100' + expand, ACCOUNT_HEADERS)
+
+        # Verify that the archived page with the superset of the expansions is served
+        self.assertEqual(status_code, 200)
+        self.assertEqual([obj['id'] for obj in json.loads(body)['data']], ['cus_1'])
@@ -0,0 +1,136 @@
+import unittest
+from unittest import mock
+from tap_stripe import Context, PhaseTimer, apply_request_timer_to_client, profile_stream
+
+
+class TestPhaseTimer(unittest.TestCase):
+    """
+    Test that `PhaseTimer` breaks the time of a pass down by phase.
+    """
+
+    def setUp(self):
+        PhaseTimer.totals = {}
+
+    @mock.patch('tap_stripe.time.perf_counter', side_effect=[0, 0, 3, 8, 9, 10])
+    def test_laps_exclude_http(self, mock_perf_counter):
+        """
+        Test that the time of the requests made during a lap is counted as http.
+        """
+        with PhaseTimer('charges') as timer:
+            timer.lap('paginate')
+            PhaseTimer.add_http(2.5)
+            timer.lap('transform')
+            timer.lap('write_record')
+
+        # Verify that the http time is taken out of the lap it happened in
+        self.assertEqual(PhaseTimer.totals, {'charges': {'paginate': 3, 'http': 2.5, 'transform': 2.5,
+                                                         'write_record': 1, 'total': 10}})
+
+    def test_nested_timers(self):
+        """
+        Test that a nested timer is active until it exits and that the totals of both are kept.
+        """
+        with PhaseTimer('invoices') as timer:
+            with PhaseTimer('invoice_line_items') as sub_timer:
+                # Verify that the nested timer is the timer of the thread
+                self.assertIs(PhaseTimer.current(), sub_timer)
+                PhaseTimer.add_http(1)
+            # Verify that the outer timer is active again
+            self.assertIs(PhaseTimer.current(), timer)
+
+        # Verify that the request is only counted by the nested timer
+        self.assertEqual(PhaseTimer.totals['invoice_line_items']['http'], 1)
+        self.assertNotIn('http', PhaseTimer.totals['invoices'])
+
+    def test_timer_outside_pass_not_reported(self):
+        """
+        Test that the laps made outside of a pass are not reported.
+        """
+        PhaseTimer.current().lap('transform')
+        PhaseTimer.add_http(1)
+
+        # Verify that nothing is reported
+        self.assertEqual(PhaseTimer.totals, {})
+
+    @mock.patch('tap_stripe.metrics.Timer')
+    @mock.patch('tap_stripe.time.perf_counter', side_effect=[0, 0, 1, 3, 4])
+    def test_request_time_counted(self, mock_perf_counter, mock_timer):
+        """
+        Test that the requests of the Stripe client are counted as http.
+        """
+        client = mock.Mock()
+        client.request.return_value = ('{}', 200, {})
+        apply_request_timer_to_client(client)
+        with PhaseTimer('charges'):
+            client.request('get', 'https://api.stripe.com/v1/charges?limit=100')
+
+        # Verify that the time of the request is counted
+        self.assertEqual(PhaseTimer.totals['charges']['http'], 2)
+
+
+class TestProfileStream(unittest.TestCase):
+    """
+    Test that `profile_stream` profiles the configured stream only.
+    """
+
+    def tearDown(self):
+        Context.profile_stream = None
+        Context.profiler = 'cprofile'
+
+    @mock.patch('tap_stripe.LOGGER.info')
+    def test_other_stream_not_profiled(self, mock_info):
+        """
+        Test that the passes of the other streams are not profiled.
+        """
+        Context.profile_stream = 'charges'
+        with profile_stream('customers', 'customers'):
+            pass
+
+        # Verify that no profile is logged
+        mock_info.assert_not_called()
+
+    @mock.patch('tap_stripe.LOGGER.info')
+    def test_cprofile(self, mock_info):
+        """
+        Test that the profile of the pass is logged.
+        """
+        Context.profile_stream = 'charges'
+        with profile_stream('charges', 'charges_events'):
+            sorted(range(100))
+
+        # Verify that the profile is logged for the pass
+        self.assertEqual(mock_info.call_args[0][:2], ('Profile of %s:\n%s', 'charges_events'))
+        self.assertIn('function calls', mock_info.call_args[0][2])
+
+    @mock.patch('tap_stripe.LOGGER.info')
+    def test_overlapping_passes(self, mock_info):
+        """
+        Test that a pass overlapping the pass being profiled by cProfile is not profiled.
+        """
+        Context.profile_stream = 'charges'
+        with profile_stream('charges', 'charges'):
+            with profile_stream('charges', 'charges_events'):
+                pass
+
+        # Verify that only the first pass is profiled
+        self.assertEqual(mock_info.call_args_list[0][0][1:], ('charges_events', 'charges'))
+        self.assertEqual(mock_info.call_args[0][:2], ('Profile of %s:\n%s', 'charges'))
+        # Verify that the next pass is profiled again
+        with profile_stream('charges', 'charges_events'):
+            pass
+        self.assertEqual(mock_info.call_args[0][:2], ('Profile of %s:\n%s', 'charges_events'))
+
+    @mock.patch('tap_stripe.LOGGER.info')
+    def test_tracemalloc(self, mock_info):
+        """
+        Test that the allocations of the pass are logged.
+        """
+        Context.profile_stream = 'charges'
+        Context.profiler = 'tracemalloc'
+        with profile_stream('charges', 'charges'):
+            data = [str(number) for number in range(1000)]
+
+        # Verify that the allocations are logged
+        self.assertEqual(mock_info.call_args[0][:2], ('Memory profile of %s, %.1f MiB at peak:\n%s', 'charges'))
+        self.assertIn('test_phase_timer.py', mock_info.call_args[0][3])
+        self.assertEqual(len(data), 1000)
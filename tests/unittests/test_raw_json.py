@@ -0,0 +1,104 @@
+import json
+import unittest
+from unittest import mock
+import stripe
+from tap_stripe import Context, ListData, decode_raw_json, paginate_raw, unwrap_data_objects, reduce_foreign_keys
+
+CUSTOMER = {
+    "id": "cus_1",
+    "object": "customer",
+    "created": 1,
+    "metadata": {"object": "list"},
+    "sources": {"object": "list", "has_more": False, "url": "/v1/customers/cus_1/sources",
+                "data": [{"id": "card_1", "object": "card"}]},
+    "subscriptions": {"object": "list", "has_more": False, "url": "/v1/customers/cus_1/subscriptions",
+                      "data": [{"id": "sub_1", "object": "subscription",
+                                "items": {"object": "list", "has_more": True, "url": "/v1/subscription_items",
+                                          "data": [{"id": "si_1", "object": "subscription_item"}]}}]},
+}
+
+
+class MockRequestor():
+    '''APIRequestor serving list pages of charges.'''
+    def __init__(self, responses):
+        self.responses = responses
+        self.params = []
+
+    def request_raw(self, method, url, params=None, supplied_headers=None, is_streaming=False):
+        self.params.append(dict(params))
+        rbody, rcode = self.responses.pop(0)
+        return json.dumps(rbody).encode(), rcode, {'request-id': 'req_1'}, 'api_key'
+
+    def interpret_response(self, rbody, rcode, rheaders):
+        raise stripe.error.RateLimitError("Rate Limit Error", rcode, {}, {}, {})
+
+
+class TestDecodeRawJson(unittest.TestCase):
+    """
+    Test that the raw JSON pipeline decodes the same records as the SDK pipeline.
+    """
+
+    def test_same_record_as_stripe_object(self):
+        """
+        Test that decoding a body gives the record built from the StripeObject.
+        """
+        body = json.dumps(CUSTOMER)
+        stripe_obj = stripe.util.convert_to_stripe_object(json.loads(body), 'api_key', None, None)
+        expected = reduce_foreign_keys(unwrap_data_objects(stripe_obj.to_dict_recursive()), 'customers')
+
+        # Verify that the records are the same
+        self.assertEqual(reduce_foreign_keys(decode_raw_json(body), 'customers'), expected)
+
+    def test_list_page_keeps_has_more(self):
+        """
+        Test that a list response is decoded as its objects and whether it has more pages.
+        """
+        page = decode_raw_json(json.dumps({"object": "list", "has_more": True, "data": [CUSTOMER]}))
+
+        # Verify that the page is the list of its objects with has_more
+        self.assertIsInstance(page, ListData)
+        self.assertTrue(page.has_more)
+        self.assertEqual(page[0]['subscriptions'][0]['items'], [{"id": "si_1", "object": "subscription_item"}])
+
+
+@mock.patch('tap_stripe.APIRequestor')
+class TestPaginateRaw(unittest.TestCase):
+    """
+    Test that `paginate_raw` paginates like the SDK.
+    """
+
+    def setUp(self):
+        Context.config = {"account_id": "test_account"}
+
+    def test_all_pages_yielded(self, mock_requestor):
+        """
+        Test that the pages are requested after the last object of the previous page.
+        """
+        requestor = MockRequestor([
+            ({"object": "list", "has_more": True, "data": [{"id": "ch_2"}, {"id": "ch_1"}]}, 200),
+            ({"object": "list", "has_more": False, "data": [{"id": "ch_0"}]}, 200),
+        ])
+        mock_requestor.return_value = requestor
+
+        objects = list(paginate_raw(stripe.Charge, 'created', 0, 10, 'charges', limit=2))
+
+        # Verify that the objects of both pages are yielded as dicts
+        self.assertEqual(objects, [{"id": "ch_2"}, {"id": "ch_1"}, {"id": "ch_0"}])
+        # Verify that the second page starts after the last object of the first page
+        self.assertNotIn('starting_after', requestor.params[0])
+        self.assertEqual(requestor.params[1]['starting_after'], 'ch_1')
+        self.assertEqual(requestor.params[1]['created[lt]'], 10)
+
+    @mock.patch("time.sleep")
+    def test_rate_limit_retried(self, mock_sleep, mock_requestor):
+        """
+        Test that a 429 response is retried like the SDK requests.
+        """
+        requestor = MockRequestor([({}, 429), ({"object": "list", "has_more": False, "data": [{"id": "ch_0"}]}, 200)])
+        mock_requestor.return_value = requestor
+
+        objects = list(paginate_raw(stripe.Charge, 'created', 0, 10, 'charges'))
+
+        # Verify that the page is requested again
+        self.assertEqual(mock_sleep.call_count, 1)
+        self.assertEqual(objects, [{"id": "ch_0"}])
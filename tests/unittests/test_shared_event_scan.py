@@ -0,0 +1,103 @@
+import unittest
+from unittest import mock
+from datetime import datetime, timezone
+from tap_stripe import Context, sync_shared_event_updates, get_shared_event_type_filter, sync_streams
+
+MOCK_CURRENT_TIME = datetime(2023, 5, 10, 8, 30, 50, tzinfo=timezone.utc)
+NOW = int(MOCK_CURRENT_TIME.timestamp())
+DAY = 24 * 60 * 60
+
+
+class MockResponse(list):
+    '''Mock of the events list response.'''
+    def auto_paging_iter(self):
+        return iter(self)
+
+
+def mock_event(event_type, created):
+    return mock.Mock(type=event_type, created=created)
+
+
+class TestSharedEventTypeFilter(unittest.TestCase):
+    """
+    Test the event type filter sent for the shared scan.
+    """
+
+    def test_covering_type_filter(self):
+        # Verify that the filter of the parent covers the more specific filter
+        self.assertEqual(get_shared_event_type_filter(['customer.*', 'customer.subscription.*']), 'customer.*')
+
+    def test_unrelated_type_filters(self):
+        # Verify that no type filter is used when the types are unrelated
+        self.assertIsNone(get_shared_event_type_filter(['charge.*', 'invoice.*']))
+
+
+@mock.patch('tap_stripe.write_bookmark_for_event_updates')
+@mock.patch('tap_stripe.sync_event_update')
+@mock.patch('stripe.Event.list')
+@mock.patch('singer.utils.now', return_value=MOCK_CURRENT_TIME)
+class TestSharedEventScan(unittest.TestCase):
+    """
+    Test that the event updates of several streams come from a single events scan.
+    """
+
+    def setUp(self):
+        Context.config = {"client_secret": "test_secret", "account_id": "test_account", "start_date": "2022-02-17T00:00:00"}
+        Context.event_update_window_size = 7
+        Context.state = {"bookmarks": {"charges_events": {"updates_created": NOW - 10 * DAY},
+                                       "invoices_events": {"updates_created": NOW - 3 * DAY}}}
+
+    def test_single_scan_dispatches_events(self, mock_now, mock_event_list, mock_sync_event_update, mock_write_bookmark):
+        """
+        Test that one scan is made and each event is dispatched to the stream of its type.
+        """
+        charge_event = mock_event('charge.succeeded', NOW - 9 * DAY)
+        old_invoice_event = mock_event('invoice.paid', NOW - 5 * DAY)
+        invoice_event = mock_event('invoice.paid', NOW - 2 * DAY)
+        mock_event_list.side_effect = [MockResponse([charge_event, old_invoice_event]),
+                                       MockResponse([invoice_event]),
+                                       MockResponse([])]
+
+        sync_shared_event_updates([('charges', False), ('invoices', False)])
+
+        # Verify that the scan starts at the oldest bookmark without a type filter
+        first_call = mock_event_list.call_args_list[0][1]
+        self.assertEqual(first_call['created[gte]'], NOW - 10 * DAY)
+        self.assertNotIn('type', first_call)
+        # Verify that the events are dispatched to their stream only, after the stream bookmark
+        dispatched = [(call[0][0], call[0][1]) for call in mock_sync_event_update.call_args_list]
+        self.assertEqual(dispatched, [(charge_event, 'charges'), (invoice_event, 'invoices')])
+        # Verify that each stream is bookmarked with its own latest event
+        mock_write_bookmark.assert_any_call(False, 'charges', None, NOW - 9 * DAY)
+        mock_write_bookmark.assert_any_call(False, 'invoices', 'invoice_line_items', NOW - 2 * DAY)
+
+    @mock.patch('tap_stripe.Context.is_selected', return_value=True)
+    def test_child_stream_uses_parent_filter(self, mock_is_selected, mock_now, mock_event_list,
+                                             mock_sync_event_update, mock_write_bookmark):
+        """
+        Test that the parent stream type filter is used when only child streams are selected.
+        """
+        Context.state = {"bookmarks": {"subscription_items_events": {"updates_created": NOW - 3 * DAY}}}
+        mock_event_list.return_value = MockResponse([])
+
+        sync_shared_event_updates([('subscription_items', True)])
+
+        # Verify that the subscription events are requested
+        self.assertEqual(mock_event_list.call_args[1]['type'], 'customer.subscription.*')
+
+
+@mock.patch('tap_stripe.sync_shared_event_updates')
+@mock.patch('tap_stripe.sync_event_updates')
+@mock.patch('tap_stripe.sync_stream')
+class TestSyncStreamsWithSharedScan(unittest.TestCase):
+    """
+    Test that `sync_streams` replaces the per stream event scans with the shared scan.
+    """
+
+    def test_shared_scan_after_creation_passes(self, mock_sync_stream, mock_sync_event_updates, mock_shared_scan):
+        sync_streams([('charges', False), ('balance_transactions', False)], shared_event_scan=True)
+
+        # Verify that the streams are scanned together and never one by one
+        self.assertEqual(mock_sync_stream.call_count, 2)
+        self.assertEqual(mock_sync_event_updates.call_count, 0)
+        mock_shared_scan.assert_called_once_with([('charges', False)])
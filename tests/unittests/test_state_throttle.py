@@ -0,0 +1,79 @@
+import unittest
+from unittest import mock
+from tap_stripe import Context, StateThrottle, flush_state, write_record, write_state
+
+
+@mock.patch('tap_stripe.singer.write_record')
+@mock.patch('tap_stripe.singer.write_state')
+class TestStateThrottle(unittest.TestCase):
+    """
+    Test that the STATE messages are coalesced by the `StateThrottle`.
+    """
+
+    def setUp(self):
+        Context.state = {'bookmarks': {'charges': {'created': 1}}}
+
+    def tearDown(self):
+        Context.state_throttle = None
+
+    @mock.patch('tap_stripe.time.monotonic')
+    def test_state_written_every_interval(self, mock_monotonic, mock_write_state, mock_write_record):
+        """
+        Test that the states written within the interval are held back.
+        """
+        mock_monotonic.return_value = 100
+        Context.state_throttle = StateThrottle(interval=10)
+        write_state()
+
+        # Verify that the state is held back within the interval
+        self.assertEqual(mock_write_state.call_count, 0)
+        self.assertTrue(Context.state_throttle.pending)
+
+        mock_monotonic.return_value = 110
+        write_state()
+        write_state()
+
+        # Verify that only the state written after the interval is emitted
+        self.assertEqual(mock_write_state.call_count, 1)
+        self.assertTrue(Context.state_throttle.pending)
+
+    def test_state_written_every_records(self, mock_write_state, mock_write_record):
+        """
+        Test that a state is written once enough records were written since the last one.
+        """
+        Context.state_throttle = StateThrottle(max_records=3)
+        for _ in range(2):
+            write_record('charges', {'id': 'ch_1'})
+            write_state()
+
+        # Verify that the states are held back until the third record
+        self.assertEqual(mock_write_state.call_count, 0)
+        write_record('charges', {'id': 'ch_1'})
+        write_state()
+        self.assertEqual(mock_write_state.call_count, 1)
+        self.assertEqual(Context.state_throttle.records, 0)
+
+    def test_held_back_state_flushed(self, mock_write_state, mock_write_record):
+        """
+        Test that the latest state held back is written by the final flush.
+        """
+        Context.state_throttle = StateThrottle(max_records=100)
+        write_state()
+        Context.state = {'bookmarks': {'charges': {'created': 2}}}
+        write_state()
+        flush_state()
+        flush_state()
+
+        # Verify that the latest state is written once
+        mock_write_state.assert_called_once_with({'bookmarks': {'charges': {'created': 2}}})
+
+    def test_no_throttle(self, mock_write_state, mock_write_record):
+        """
+        Test that every state is written without a throttle.
+        """
+        write_state()
+        write_state()
+        flush_state()
+
+        # Verify that every state is written
+        self.assertEqual(mock_write_state.call_count, 2)
@@ -0,0 +1,104 @@
+import threading
+import unittest
+from unittest import mock
+from datetime import datetime
+from tap_stripe import Context, sync_streams, is_event_updates_bookmark_expired
+
+
+MOCK_CURRENT_TIME = datetime.strptime("2023-05-10T08:30:50Z", "%Y-%m-%dT%H:%M:%SZ")
+STREAMS = [('charges', False), ('balance_transactions', False), ('invoice_line_items', True)]
+
+
+@mock.patch('tap_stripe.is_event_updates_bookmark_expired', return_value=False)
+@mock.patch('tap_stripe.sync_event_updates')
+@mock.patch('tap_stripe.sync_stream')
+class TestSyncStreams(unittest.TestCase):
+    """
+    Test `sync_streams` runs the creation and event updates passes of every stream.
+    """
+
+    def test_serial_sync_order(self, mock_sync_stream, mock_sync_event_updates, mock_expired):
+        """
+        Test that with the default concurrency the streams are synced one after another.
+        """
+        calls = []
+        mock_sync_stream.side_effect = lambda name, is_sub: calls.append(('created', name))
+        mock_sync_event_updates.side_effect = lambda name, is_sub: calls.append(('updates', name))
+
+        sync_streams(STREAMS)
+
+        # Verify the passes run stream by stream, without events for immutable streams
+        self.assertEqual(calls, [('created', 'charges'), ('updates', 'charges'),
+                                 ('created', 'balance_transactions'),
+                                 ('created', 'invoice_line_items'), ('updates', 'invoice_line_items')])
+
+    def test_parallel_sync_runs_every_pass(self, mock_sync_stream, mock_sync_event_updates, mock_expired):
+        """
+        Test that with a concurrency the passes run in worker threads.
+        """
+        threads = set()
+        mock_sync_stream.side_effect = lambda name, is_sub: threads.add(threading.current_thread())
+
+        sync_streams(STREAMS, 3)
+
+        # Verify every pass was run with the expected arguments
+        self.assertCountEqual(mock_sync_stream.mock_calls,
+                              [mock.call(name, is_sub) for name, is_sub in STREAMS])
+        self.assertCountEqual(mock_sync_event_updates.mock_calls,
+                              [mock.call('charges', False), mock.call('invoice_line_items', True)])
+        # Verify the main thread did not run the passes
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_expired_event_bookmark_runs_after_creation(self, mock_sync_stream, mock_sync_event_updates, mock_expired):
+        """
+        Test that the event updates pass which resets the bookmark runs after the creation pass.
+        """
+        mock_expired.return_value = True
+        created = threading.Event()
+        mock_sync_stream.side_effect = lambda name, is_sub: created.set()
+        mock_sync_event_updates.side_effect = lambda name, is_sub: self.assertTrue(created.is_set())
+
+        sync_streams([('charges', False)], 4)
+
+        # Verify both passes were run
+        self.assertEqual(mock_sync_event_updates.call_count, 1)
+
+    def test_parallel_sync_raises_error(self, mock_sync_stream, mock_sync_event_updates, mock_expired):
+        """
+        Test that an error of a pass is raised once the running passes are finished.
+        """
+        mock_sync_event_updates.side_effect = Exception("Event updates failed")
+
+        with self.assertRaises(Exception) as e:
+            sync_streams(STREAMS, 2)
+
+        # Verify the error of the failed pass is raised
+        self.assertEqual(str(e.exception), "Event updates failed")
+
+
+@mock.patch('tap_stripe.utils.now', return_value=MOCK_CURRENT_TIME)
+class TestEventUpdatesBookmarkExpired(unittest.TestCase):
+    """
+    Test `is_event_updates_bookmark_expired` matches the reset done by `sync_event_updates`.
+    """
+
+    def setUp(self):
+        Context.config = {"client_secret": "test_secret", "account_id": "test_account", "start_date": "2022-02-17T00:00:00"}
+
+    def test_bookmark_older_than_30_days(self, mock_now):
+        Context.state = {"bookmarks": {"charges_events": {"updates_created": 1675251000}}}
+
+        # Verify that the bookmark from February 2023 is expired in May 2023
+        self.assertTrue(is_event_updates_bookmark_expired('charges', False))
+
+    def test_recent_bookmark(self, mock_now):
+        Context.state = {"bookmarks": {"charges_events": {"updates_created": 1683000000}}}
+
+        # Verify that the bookmark from May 2023 is not expired
+        self.assertFalse(is_event_updates_bookmark_expired('charges', False))
+
+    def test_no_bookmark(self, mock_now):
+        Context.state = {}
+
+        # Verify that the start date is not considered as an expired bookmark
+        self.assertFalse(is_event_updates_bookmark_expired('charges', False))
@@ -0,0 +1,56 @@
+import unittest
+from unittest import mock
+from tap_stripe import Context, build_stream_plan, sync
+
+CATALOG = {'streams': [
+    {'tap_stream_id': 'invoice_items', 'schema': {'type': 'object'}, 'key_properties': ['id'],
+     'metadata': [{'breadcrumb': [], 'metadata': {'selected': True}}]},
+    {'tap_stream_id': 'invoice_line_items', 'schema': {'type': 'object'}, 'key_properties': ['id'],
+     'metadata': [{'breadcrumb': [], 'metadata': {'selected': False}}]},
+]}
+
+
+class TestStreamPlan(unittest.TestCase):
+    """
+    Test the plans of the streams built for a sync.
+    """
+
+    def setUp(self):
+        Context.catalog = CATALOG
+        Context.stream_map = {}
+        Context.config = {'whitelist_map': '{"invoice_items": [["lines", "id"]]}'}
+
+    def tearDown(self):
+        Context.stream_map = {}
+
+    def test_plan_of_stream(self):
+        """
+        Test that the plan holds what the sync needs of the catalog entry and the config.
+        """
+        plan = build_stream_plan('invoice_items')
+
+        # Verify the plan of the stream
+        self.assertEqual(plan.schema, {'type': 'object'})
+        self.assertEqual(plan.metadata, {(): {'selected': True}})
+        self.assertTrue(plan.selected)
+        self.assertEqual((plan.replication_key, plan.filter_key), ('date', 'created'))
+        self.assertEqual(plan.whitelist, [['lines', 'id']])
+        self.assertIsNone(plan.sub_stream)
+
+    @mock.patch('tap_stripe.singer.write_schema')
+    @mock.patch('tap_stripe.metadata.to_map', side_effect=lambda mdata: {(): mdata[0]['metadata']})
+    @mock.patch('tap_stripe.sync_streams')
+    def test_plans_built_once_per_sync(self, mock_sync_streams, mock_to_map, mock_write_schema):
+        """
+        Test that the metadata maps are built once per stream and the plans are dropped after the sync.
+        """
+        mock_sync_streams.side_effect = lambda *args: self.assertEqual(set(Context.stream_plans),
+                                                                       {'invoice_items', 'invoice_line_items'})
+        sync()
+
+        # Verify that the metadata of every stream is read once
+        self.assertEqual(mock_to_map.call_count, 2)
+        # Verify that only the selected stream is synced
+        mock_sync_streams.assert_called_with([('invoice_items', False)], 1, False)
+        # Verify that the plans do not outlive the sync
+        self.assertEqual(Context.stream_plans, {})
@@ -0,0 +1,134 @@
+import io
+import json
+import unittest
+from unittest import mock
+from parameterized import parameterized
+import stripe
+from tap_stripe import Context, ListPageParser, decode_raw_json, paginate_raw
+
+PAGE = {
+    "object": "list",
+    "data": [
+        {"id": "cus_2", "object": "customer", "name": "Zoë", "balance": -1250, "metadata": {"object": "list"},
+         "sources": {"object": "list", "has_more": False, "data": [{"id": "card_1", "object": "card"}]}},
+        {"id": "cus_1", "object": "customer", "name": "李", "balance": 0.5, "deleted": None, "tax_ids": []},
+    ],
+    "has_more": True,
+    "url": "/v1/customers",
+}
+
+
+def chunked(body, chunk_size):
+    return [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+
+class MockStreamRequestor():
+    '''APIRequestor streaming the bodies of list pages.'''
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.params = []
+
+    def request_raw(self, method, url, params=None, supplied_headers=None, is_streaming=False):
+        self.params.append(dict(params))
+        return io.BytesIO(self.bodies.pop(0)), 200, {'request-id': 'req_1'}, 'api_key'
+
+
+class TestListPageParser(unittest.TestCase):
+    """
+    Test that `ListPageParser` decodes the objects of a list page as they arrive.
+    """
+
+    @parameterized.expand([[1], [2], [7], [64], [100000]])
+    def test_same_objects_as_decoded_page(self, chunk_size):
+        """
+        Test that the objects are the ones of the fully decoded page whatever the chunks are.
+        """
+        body = json.dumps(PAGE, ensure_ascii=False, indent=1).encode()
+        parser = ListPageParser()
+        objects = [obj for chunk in chunked(body, chunk_size) for obj in parser.feed(chunk)]
+        objects += parser.feed(b'', final=True)
+
+        # Verify that the objects and has_more are the same as the decoded page
+        page = decode_raw_json(body)
+        self.assertEqual(objects, list(page))
+        self.assertEqual(parser.has_more, page.has_more)
+        self.assertEqual(parser.state, 'done')
+
+    def test_objects_returned_as_they_arrive(self):
+        """
+        Test that an object is returned once its bytes arrived, before the end of the page.
+        """
+        body = json.dumps({"has_more": False, "data": [{"id": "ch_1"}, {"id": "ch_2"}]}).encode()
+        parser = ListPageParser()
+        end_of_first = body.index(b'}') + 1
+
+        # Verify that the first object is returned before the page is complete
+        self.assertEqual(parser.feed(body[:end_of_first - 1]), [])
+        self.assertEqual(parser.feed(body[end_of_first - 1:-3]), [{"id": "ch_1"}])
+        self.assertNotEqual(parser.state, 'done')
+        # Verify that has_more is read when it comes before the data
+        self.assertFalse(parser.has_more)
+
+    def test_truncated_page_raises(self):
+        """
+        Test that a page ending before it is complete raises a connection error.
+        """
+        body = json.dumps(PAGE).encode()
+
+        # Verify that the objects read are yielded before the error
+        objects = []
+        with self.assertRaises(stripe.error.APIConnectionError):
+            for obj in ListPageParser().parse(io.BytesIO(body[:body.index(b'cus_1')])):
+                objects.append(obj)
+        self.assertEqual([obj['id'] for obj in objects], ['cus_2'])
+
+
+@mock.patch('tap_stripe.APIRequestor')
+class TestPaginateStreamedPages(unittest.TestCase):
+    """
+    Test that `paginate_raw` reads the streamed pages like the decoded ones.
+    """
+
+    def setUp(self):
+        Context.config = {"account_id": "test_account"}
+        Context.stream_pages = True
+
+    def tearDown(self):
+        Context.stream_pages = False
+
+    def test_all_pages_yielded(self, mock_requestor):
+        """
+        Test that the pages are requested after the last object of the previous page.
+        """
+        requestor = MockStreamRequestor([
+            json.dumps({"object": "list", "has_more": True, "data": [{"id": "ch_2"}, {"id": "ch_1"}]}).encode(),
+            json.dumps({"object": "list", "has_more": False, "data": [{"id": "ch_0"}]}).encode(),
+        ])
+        mock_requestor.return_value = requestor
+
+        objects = list(paginate_raw(stripe.Charge, 'created', 0, 10, 'charges', limit=2))
+
+        # Verify that the objects of both pages are yielded
+        self.assertEqual(objects, [{"id": "ch_2"}, {"id": "ch_1"}, {"id": "ch_0"}])
+        # Verify that the second page starts after the last object of the first page
+        self.assertNotIn('starting_after', requestor.params[0])
+        self.assertEqual(requestor.params[1]['starting_after'], 'ch_1')
+
+    @mock.patch('tap_stripe.LOGGER.warning')
+    def test_cut_page_resumed(self, mock_warning, mock_requestor):
+        """
+        Test that a page cut short is requested again from the last object yielded.
+        """
+        body = json.dumps({"object": "list", "has_more": False, "data": [{"id": "ch_2"}, {"id": "ch_1"}]}).encode()
+        requestor = MockStreamRequestor([
+            body[:body.index(b'ch_1')],
+            json.dumps({"object": "list", "has_more": False, "data": [{"id": "ch_1"}]}).encode(),
+        ])
+        mock_requestor.return_value = requestor
+
+        objects = list(paginate_raw(stripe.Charge, 'created', 0, 10, 'charges'))
+
+        # Verify that no object is repeated or missed
+        self.assertEqual(objects, [{"id": "ch_2"}, {"id": "ch_1"}])
+        self.assertEqual(requestor.params[1]['starting_after'], 'ch_2')
+        self.assertEqual(mock_warning.call_count, 1)
@@ -0,0 +1,70 @@
+import threading
+import time
+import unittest
+from unittest import mock
+from tap_stripe import SubStreamFetcher
+
+
+def fetch_sub_stream_records(sub_stream_name, parent_obj, updates=False):
+    """Return the records of a parent, finishing the first parents last."""
+    time.sleep((5 - parent_obj['index']) / 100)
+    return 'extraction_time', [{'id': '{}-{}'.format(parent_obj['id'], threading.current_thread().name)}]
+
+
+class TestSubStreamFetcher(unittest.TestCase):
+    """
+    Test that the `SubStreamFetcher` fetches the sub streams concurrently and writes them in order.
+    """
+
+    @mock.patch('tap_stripe.sync_sub_stream')
+    def test_serial_sync_inline(self, mock_sync_sub_stream):
+        """
+        Test that with the default concurrency the sub stream is synced when the parent is submitted.
+        """
+        with SubStreamFetcher('invoice_line_items') as fetcher:
+            fetcher.submit({'id': 'in_1'})
+
+            # Verify that the sub stream of the parent is synced right away
+            mock_sync_sub_stream.assert_called_with('invoice_line_items', {'id': 'in_1'}, updates=False)
+            self.assertIsNone(fetcher.pool)
+
+    @mock.patch('tap_stripe.write_sub_stream_records')
+    @mock.patch('tap_stripe.fetch_sub_stream_records', side_effect=fetch_sub_stream_records)
+    def test_records_written_in_parent_order(self, mock_fetch, mock_write):
+        """
+        Test that the records are fetched by several threads and written in the order of the parents.
+        """
+        parents = [{'id': 'po_{}'.format(index), 'index': index} for index in range(5)]
+        with SubStreamFetcher('payout_transactions', 3, updates=True) as fetcher:
+            for parent in parents:
+                fetcher.submit(parent)
+
+            # Verify that at most `concurrency` parents are waiting to be written
+            self.assertLessEqual(len(fetcher.pending), 3)
+            fetcher.drain()
+
+            # Verify that every record is written after the drain
+            self.assertEqual(len(fetcher.pending), 0)
+
+        written = [call[0][1][0]['id'] for call in mock_write.call_args_list]
+        # Verify that the records are written in the order of the parents
+        self.assertEqual([record_id.split('-')[0] for record_id in written], [parent['id'] for parent in parents])
+        # Verify that the records are fetched by the threads of the pool
+        self.assertTrue(all('tap-stripe-payout_transactions' in record_id for record_id in written))
+        # Verify that the records are written as updates
+        self.assertTrue(all(call[0][3] for call in mock_write.call_args_list))
+
+    @mock.patch('tap_stripe.write_sub_stream_records')
+    @mock.patch('tap_stripe.fetch_sub_stream_records', side_effect=Exception('boom'))
+    def test_fetch_error_raised(self, mock_fetch, mock_write):
+        """
+        Test that an error fetching a sub stream is raised when its records are written.
+        """
+        with self.assertRaises(Exception) as error:
+            with SubStreamFetcher('invoice_line_items', 2) as fetcher:
+                fetcher.submit({'id': 'in_1'})
+                fetcher.drain()
+
+        # Verify that the error is raised and nothing is written
+        self.assertEqual(str(error.exception), 'boom')
+        self.assertEqual(mock_write.call_count, 0)
@@ -102,6 +102,7 @@ class TestSyncEventUpdates(unittest.TestCase):
         """
         Test that tap writes expected bookmark for sub streams.
         """
+        mock_context.message_writer = None
         Context.state = {'bookmarks': {}}
         write_bookmark_for_event_updates(True, 'invoices', 'invoice_line_items', 1648177250)
         
@@ -0,0 +1,218 @@
+import copy
+import datetime
+import unittest
+from unittest import mock
+import stripe
+from tap_stripe import (Context, EventDedupIndex, WindowCheckpoint, get_checkpoint_request_args,
+                        is_window_checkpointed, sync_event_updates, sync_stream)
+
+DAY = 24 * 60 * 60
+CHECKPOINT = {'start': 1000, 'stop': 1000 + 30 * DAY, 'starting_after': 'ch_5', 'created': 5000}
+CATALOG = {'streams': [
+    {'tap_stream_id': 'charges', 'key_properties': ['id'],
+     'schema': {'type': 'object', 'properties': {'id': {'type': 'string'}, 'created': {'type': 'integer'}}},
+     'metadata': [{'breadcrumb': [], 'metadata': {'selected': True}}]},
+    {'tap_stream_id': 'balance_transactions', 'key_properties': ['id'],
+     'schema': {'type': 'object', 'properties': {'id': {'type': 'string'}, 'created': {'type': 'integer'}}},
+     'metadata': [{'breadcrumb': [], 'metadata': {'selected': True}}]},
+]}
+
+
+def event(event_id, object_id, created):
+    return stripe.util.convert_to_stripe_object(
+        {'id': event_id, 'object': 'event', 'type': 'charge.updated', 'created': created,
+         'data': {'object': {'id': object_id, 'object': 'charge'}}}, 'api_key', None, None)
+
+
+class TestWindowCheckpoint(unittest.TestCase):
+    """
+    Test that `WindowCheckpoint` saves the last object processed of a window in the state.
+    """
+
+    def setUp(self):
+        Context.state = {'bookmarks': {'charges': {'created': 1000}}}
+
+    @mock.patch('tap_stripe.write_state')
+    def test_checkpoint_saved_every_interval(self, mock_write_state):
+        """
+        Test that the checkpoint is saved every `interval` objects, after draining, and dropped with the window.
+        """
+        drain = mock.Mock()
+        window_checkpoint = WindowCheckpoint(['charges'], 2, drain)
+        for object_id, created in [('ch_9', 9000), ('ch_8', 8000), ('ch_7', 7000)]:
+            window_checkpoint.object_processed(1000, 10000, object_id, created)
+
+        # Verify that the second object is saved once, after the sub streams are drained
+        self.assertEqual(drain.call_count, 1)
+        self.assertEqual(mock_write_state.call_count, 1)
+        self.assertEqual(Context.state['bookmarks']['charges']['window_checkpoint'],
+                         {'start': 1000, 'stop': 10000, 'starting_after': 'ch_8', 'created': 8000})
+
+        window_checkpoint.window_done()
+
+        # Verify that the checkpoint is dropped with the window
+        self.assertEqual(Context.state, {'bookmarks': {'charges': {'created': 1000}}})
+
+    def test_resume_matching_checkpoint(self):
+        """
+        Test that a checkpoint is only resumed for the window it was saved for, by all the streams.
+        """
+        Context.state['bookmarks']['charges']['window_checkpoint'] = CHECKPOINT
+
+        # Verify that the checkpoint of the window is resumed
+        self.assertEqual(WindowCheckpoint(['charges'], 0).resume(1000, 40 * DAY), CHECKPOINT)
+        # Verify that the checkpoint of a window after the start of the range, e.g. a lookback before it, is resumed
+        self.assertEqual(WindowCheckpoint(['charges'], 0).resume(400, 40 * DAY), CHECKPOINT)
+        # Verify that a checkpoint of a window before the range is not
+        self.assertIsNone(WindowCheckpoint(['charges'], 0).resume(2000, 40 * DAY))
+        # Verify that a checkpoint missing for a newly selected sub stream is not
+        self.assertIsNone(WindowCheckpoint(['charges', 'refunds'], 0).resume(1000, 40 * DAY))
+
+    def test_request_args_of_split_windows(self):
+        """
+        Test the windows of a checkpoint window split on timeouts paginate from the checkpoint.
+        """
+        # Verify that the window with the object paginates after it
+        self.assertEqual(get_checkpoint_request_args(None, CHECKPOINT, 1000, 10000), {'starting_after': 'ch_5'})
+        # Verify that the window of older objects is fully fetched
+        self.assertIsNone(get_checkpoint_request_args(None, CHECKPOINT, 1000, 5000))
+        self.assertFalse(is_window_checkpointed(CHECKPOINT, 1000, 5000))
+        # Verify that the window of newer objects is skipped
+        self.assertTrue(is_window_checkpointed(CHECKPOINT, 6000, 10000))
+
+
+@mock.patch('tap_stripe.write_record')
+@mock.patch('tap_stripe.paginate_raw')
+@mock.patch('tap_stripe.utils.now', return_value=datetime.datetime.fromtimestamp(1000 + 45 * DAY, datetime.timezone.utc))
+class TestSyncStreamCheckpoint(unittest.TestCase):
+    """
+    Test that `sync_stream` checkpoints and resumes its date windows.
+    """
+
+    def setUp(self):
+        Context.catalog = CATALOG
+        Context.stream_map = {}
+        Context.config = {'start_date': '2022-01-01T00:00:00Z'}
+        Context.new_counts = {'charges': 0}
+        Context.raw_json = True
+
+    def tearDown(self):
+        Context.raw_json = False
+        Context.checkpoint_interval = 0
+        Context.stream_map = {}
+
+    @mock.patch('tap_stripe.write_state')
+    def test_resumed_after_checkpoint(self, mock_write_state, mock_now, mock_paginate, mock_write_record):
+        """
+        Test that the window of the checkpoint is paginated after its object and the next windows follow it.
+        """
+        Context.state = {'bookmarks': {'charges': {'created': 1000, 'window_checkpoint': CHECKPOINT}}}
+        mock_paginate.side_effect = [[{'id': 'ch_4', 'created': 4000}], []]
+        sync_stream('charges')
+
+        # Verify that the checkpoint window is resumed and the next window starts after it
+        self.assertEqual(mock_paginate.call_args_list, [
+            mock.call(stripe.Charge, 'created', 1000, 1000 + 30 * DAY, 'charges', {'starting_after': 'ch_5'}),
+            mock.call(stripe.Charge, 'created', 1000 + 30 * DAY, 1000 + 45 * DAY, 'charges', None),
+        ])
+        # Verify that only the objects after the checkpoint are written
+        self.assertEqual([args[0][1]['id'] for args in mock_write_record.call_args_list], ['ch_4'])
+        # Verify that the checkpoint is dropped once the window is bookmarked
+        self.assertEqual(Context.state, {'bookmarks': {'charges': {'created': 1000 + 45 * DAY}}})
+
+    @mock.patch('tap_stripe.write_state')
+    def test_resumed_after_lookback(self, mock_write_state, mock_now, mock_paginate, mock_write_record):
+        """
+        Test that the checkpoint of a window after the first one of an immutable stream is resumed after the lookback.
+        """
+        Context.new_counts = {'balance_transactions': 0}
+        bookmark = 1000 + 10 * DAY
+        checkpoint = {'start': bookmark, 'stop': bookmark + 30 * DAY, 'starting_after': 'txn_5', 'created': bookmark + 5}
+        Context.state = {'bookmarks': {'balance_transactions': {'created': bookmark, 'window_checkpoint': checkpoint}}}
+        mock_paginate.side_effect = [[], [{'id': 'txn_4', 'created': bookmark + 4}], []]
+        sync_stream('balance_transactions')
+
+        # Verify that the lookback is fetched, then the checkpoint window after its object
+        self.assertEqual(mock_paginate.call_args_list, [
+            mock.call(stripe.BalanceTransaction, 'created', bookmark - 600, bookmark, 'balance_transactions', None),
+            mock.call(stripe.BalanceTransaction, 'created', bookmark, bookmark + 30 * DAY, 'balance_transactions',
+                      {'starting_after': 'txn_5'}),
+            mock.call(stripe.BalanceTransaction, 'created', bookmark + 30 * DAY, 1000 + 45 * DAY,
+                      'balance_transactions', None),
+        ])
+        # Verify that the records written before the checkpoint are not written again
+        self.assertEqual([args[0][1]['id'] for args in mock_write_record.call_args_list], ['txn_4'])
+
+    def test_checkpoint_written_within_window(self, mock_now, mock_paginate, mock_write_record):
+        """
+        Test that the checkpoint is written in the state after the records it covers.
+        """
+        Context.state = {'bookmarks': {'charges': {'created': 1000}}}
+        Context.checkpoint_interval = 2
+        mock_paginate.side_effect = [[{'id': 'ch_3', 'created': 3000}, {'id': 'ch_2', 'created': 2000},
+                                      {'id': 'ch_1', 'created': 1000}], []]
+        states = []
+        with mock.patch('tap_stripe.write_state', side_effect=lambda: states.append(copy.deepcopy(Context.state))):
+            sync_stream('charges')
+
+        # Verify that the first state saves the window after the second record
+        self.assertEqual(states[0]['bookmarks']['charges'], {'created': 1000, 'window_checkpoint': {
+            'start': 1000, 'stop': 1000 + 30 * DAY, 'starting_after': 'ch_2', 'created': 2000}})
+        self.assertEqual(mock_write_record.call_count, 3)
+        # Verify that the last state has no checkpoint
+        self.assertEqual(states[-1], {'bookmarks': {'charges': {'created': 1000 + 45 * DAY}}})
+
+
+class TestSyncEventUpdatesCheckpoint(unittest.TestCase):
+    """
+    Test that `sync_event_updates` resumes an event window after its checkpoint.
+    """
+
+    @mock.patch('tap_stripe.write_bookmark_for_event_updates')
+    @mock.patch('tap_stripe.sync_event_update')
+    @mock.patch('tap_stripe.fetch_event_windows')
+    @mock.patch('singer.utils.now', return_value=datetime.datetime.fromtimestamp(1000 + 10 * DAY, datetime.timezone.utc))
+    def test_resumed_after_checkpoint(self, mock_now, mock_fetch, mock_sync_event_update, mock_write_bookmark):
+        """
+        Test that the events up to the checkpoint are only remembered, so older events of their objects are skipped.
+        """
+        Context.config = {'start_date': '1970-01-01T00:00:00Z'}
+        Context.state = {'bookmarks': {'charges_events': {'updates_created': 1000, 'window_checkpoint': {
+            'start': 1000, 'stop': 1000 + 7 * DAY, 'starting_after': 'evt_2', 'created': 2000}}}}
+        events = [event('evt_3', 'ch_1', 3000), event('evt_2', 'ch_2', 2000), event('evt_1', 'ch_1', 1500)]
+        mock_fetch.return_value = [(1000 + 7 * DAY, None, events)]
+        sync_event_updates('charges', False)
+
+        # Verify that the first window ends at the end of the checkpoint window
+        self.assertEqual(mock_fetch.call_args[0][4], 1000 + 7 * DAY)
+        # Verify that only the events after the checkpoint are synced
+        self.assertEqual([args[0][0].id for args in mock_sync_event_update.call_args_list], ['evt_1'])
+        # Verify that the object of an event before the checkpoint is remembered with its latest event
+        index = mock_sync_event_update.call_args[0][4]
+        self.assertIsInstance(index, EventDedupIndex)
+        self.assertEqual(index.get('ch_1'), 3000)
+        # Verify that the checkpoint is dropped and the bookmark is written
+        self.assertNotIn('window_checkpoint', Context.state['bookmarks']['charges_events'])
+        mock_write_bookmark.assert_called_with(False, 'charges', None, 1000 + 3 * DAY)
+
+    @mock.patch('tap_stripe.write_bookmark_for_event_updates')
+    @mock.patch('tap_stripe.sync_event_update')
+    @mock.patch('tap_stripe.fetch_event_windows')
+    @mock.patch('singer.utils.now', return_value=datetime.datetime.fromtimestamp(1000 + 20 * DAY, datetime.timezone.utc))
+    def test_resumed_in_later_window(self, mock_now, mock_fetch, mock_sync_event_update, mock_write_bookmark):
+        """
+        Test that the checkpoint of a window after the first one is resumed from the bookmark of the events.
+        """
+        Context.config = {'start_date': '1970-01-01T00:00:00Z'}
+        # The bookmark is the last event of the first window, before the start of the window of the checkpoint
+        Context.state = {'bookmarks': {'charges_events': {'updates_created': 1000 + 6 * DAY, 'window_checkpoint': {
+            'start': 1000 + 7 * DAY, 'stop': 1000 + 14 * DAY, 'starting_after': 'evt_2', 'created': 1000 + 9 * DAY}}}}
+        events = [event('evt_3', 'ch_3', 1000 + 10 * DAY), event('evt_2', 'ch_2', 1000 + 9 * DAY),
+                  event('evt_1', 'ch_1', 1000 + 8 * DAY)]
+        mock_fetch.return_value = [(1000 + 14 * DAY, None, events)]
+        sync_event_updates('charges', False)
+
+        # Verify that the first window ends at the end of the checkpoint window
+        self.assertEqual(mock_fetch.call_args[0][4], 1000 + 14 * DAY)
+        # Verify that the events synced before the checkpoint are not synced again
+        self.assertEqual([args[0][0].id for args in mock_sync_event_update.call_args_list], ['evt_1'])
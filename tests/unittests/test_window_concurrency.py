@@ -0,0 +1,95 @@
+import time
+import unittest
+from parameterized import parameterized
+from tap_stripe import Context, fetch_date_windows, get_concurrency, DEFAULT_WINDOW_CONCURRENCY
+
+
+WINDOWS = [(0, 10), (10, 20), (20, 30), (30, 40), (40, 50)]
+
+
+def fetch_window(window_start, window_stop):
+    """Return the objects of a window, finishing the earliest windows last."""
+    time.sleep((50 - window_start) / 1000)
+    return iter(["{}-{}".format(window_start, window_stop)])
+
+
+class TestFetchDateWindows(unittest.TestCase):
+    """
+    Test `fetch_date_windows` keeps the window order whatever the concurrency.
+    """
+
+    @parameterized.expand([
+        ["serial", 1],
+        ["parallel", 3],
+        ["more_workers_than_windows", 10],
+    ])
+    def test_windows_yielded_in_order(self, name, concurrency):
+        """
+        Test that the windows and their objects are yielded in window order.
+        """
+        result = [(start, stop, list(objs))
+                  for start, stop, objs in fetch_date_windows(iter(WINDOWS), fetch_window, concurrency)]
+
+        # Verify that every window is yielded once, oldest first
+        self.assertEqual(result, [(start, stop, ["{}-{}".format(start, stop)]) for start, stop in WINDOWS])
+
+    def test_serial_fetch_is_lazy(self):
+        """
+        Test that with the default concurrency a window is only fetched when it is consumed.
+        """
+        fetched = []
+
+        def record_fetch(window_start, window_stop):
+            fetched.append(window_start)
+            return []
+
+        windows = fetch_date_windows(iter(WINDOWS), record_fetch)
+        next(windows)
+
+        # Verify that only the first window was requested
+        self.assertEqual(fetched, [0])
+
+    def test_fetch_error_is_raised(self):
+        """
+        Test that an error raised while fetching a window is raised to the caller.
+        """
+        def failing_fetch(window_start, window_stop):
+            raise ValueError("window {} failed".format(window_start))
+
+        with self.assertRaises(ValueError) as e:
+            list(fetch_date_windows(iter(WINDOWS), failing_fetch, 2))
+
+        # Verify that the error of the first window is raised
+        self.assertEqual(str(e.exception), "window 0 failed")
+
+
+class TestGetConcurrency(unittest.TestCase):
+    """
+    Test `get_concurrency` reads the worker count from the config.
+    """
+
+    @parameterized.expand([
+        ["integer_value", 4, 4],
+        ["string_integer", "8", 8],
+        ["not_passed", None, DEFAULT_WINDOW_CONCURRENCY],
+    ])
+    def test_valid_values(self, name, concurrency, expected_value):
+        Context.config = {} if concurrency is None else {"window_concurrency": concurrency}
+
+        # Verify the expected worker count is returned
+        self.assertEqual(get_concurrency("window_concurrency", DEFAULT_WINDOW_CONCURRENCY), expected_value)
+
+    @parameterized.expand([
+        ["zero", 0],
+        ["negative", -2],
+        ["float", 2.5],
+        ["string_alphabet", "abc"],
+    ])
+    def test_invalid_values(self, name, concurrency):
+        Context.config = {"window_concurrency": concurrency}
+        with self.assertRaises(Exception) as e:
+            get_concurrency("window_concurrency", DEFAULT_WINDOW_CONCURRENCY)
+
+        # Verify that the exception message is expected
+        self.assertEqual(str(e.exception),
+                         "The entered window_concurrency '{}' is invalid, it should be a valid positive integer.".format(concurrency))